@@ -0,0 +1,106 @@
+''' Benchmark loading the database tables with ids assigned in SQL and in Python (straindb.db_tables)
+
+Both run on the same synthetic CSVs (straindb.synthetic), filtered and normalized, in SQLite
+databases with the tables of 3_create_db_tables.sql:
+
+    sql:     staging tables loaded, then 4_load_db_tables_set_based.sql run (translated to SQLite)
+    python:  write_db_tables, then load_db_tables (batched inserts; MySQL would use LOAD DATA)
+
+and every table must hold the same rows (strain_view lists compared as sets, since
+group_concat does not order them). References are not validated before the staging tables, so
+the SQL path records the error tables itself. Script 2's select distinct loads staging_strain in
+strain_name index order in SQLite (and MySQL); it is reloaded in the order strains first appear
+in strain_allele.csv, the order db_tables assigns strain ids in.
+
+Usage: python3 benchmarks/bench_db_tables.py [--strains 10000 100000] [--seed 0]
+'''
+
+import argparse, re, sqlite3, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from straindb.db_tables import db_tables, error_tables, generation_statements, load_db_tables, write_db_tables
+from straindb.filter_csv import filter_all
+from straindb.load import load_all
+from straindb.normalize_csv import normalize_all
+from straindb.sql_scripts import schema_statements, sql_dir
+from straindb.synthetic import synthetic_config
+
+
+def set_based_statements():  # 4_load_db_tables_set_based.sql, translated to SQLite
+    sql = re.sub(r'--[^\n]*', '', (sql_dir / '4_load_db_tables_set_based.sql').read_text())
+    sql = sql.replace('engine = MyISAM', '').replace('<=>', ' is ').replace('start transaction', 'begin')
+    sql = sql.replace('cast(ea.first_use_id as unsigned)', 'ea.first_use_id').replace('now()', "datetime('now')")
+    sql = re.sub(r",\s*key \([^)]*\)", '', sql)
+    sql = re.sub(r"group_concat\(([^)]*?) separator ', '\)", r"group_concat(\1, ', ')", sql)
+    return [s.strip() for s in sql.split(';') if s.strip()]
+
+
+def database(path):  # SQLite database with the staging tables and the tables of script 3
+    connection = sqlite3.connect(path)
+    for statement in schema_statements(sqlite=True, script='1_create_staging_tables.sql') + schema_statements(sqlite=True):
+        connection.execute(statement)
+    for statement in generation_statements(sqlite=True):
+        connection.execute(statement)
+    return connection
+
+
+def dump(connection):  # table -> sorted rows, with strain_view lists as sorted tuples
+    tables = {}
+    for table in list(db_tables) + list(error_tables):
+        rows = connection.execute(f'select * from {table}').fetchall()
+        if table == 'strain_view':
+            rows = [r[:2] + tuple(tuple(sorted(v.split(', '))) if v is not None else None for v in r[2:7]) + r[7:] for r in rows]
+        tables[table] = sorted(rows, key=repr)
+    return tables
+
+
+def first_use_strain_order(connection):  # reload staging_strain in the order strains first appear in staging_strain_allele
+    connection.execute('delete from staging_strain')
+    connection.execute('insert into staging_strain (strain_name) select strain_name from staging_strain_allele'
+                       ' group by strain_name order by min(id)')
+    connection.commit()
+
+
+def timed(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def bench(num_strains, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = synthetic_config(tmp, num_strains, seed, validate_references=False)
+        with redirect_stdout(StringIO()):
+            filter_all(config)
+            normalize_all(config)
+
+            sql = database(Path(tmp) / 'sql.db')
+            load_seconds = timed(lambda: load_all(config, sql))
+            first_use_strain_order(sql)
+            statements = set_based_statements()
+            def etl():
+                for statement in statements:
+                    sql.execute(statement)
+            etl_seconds = timed(etl)
+
+            python = database(Path(tmp) / 'python.db')
+            write_seconds = timed(lambda: write_db_tables(config))
+            bulk_seconds = timed(lambda: load_db_tables(config, python))
+
+        expected, actual = dump(sql), dump(python)
+        for table in expected:
+            assert actual[table] == expected[table], f'{table}: rows differ'
+
+    print(f"{num_strains} strains: {', '.join(f'{len(rows)} {table}' for table, rows in expected.items() if table in db_tables)}")
+    print(f'  sql:    load staging {load_seconds:6.2f} s + set-based etl {etl_seconds:6.2f} s = {load_seconds + etl_seconds:6.2f} s')
+    print(f'  python: write tables {write_seconds:6.2f} s + load tables   {bulk_seconds:6.2f} s = {write_seconds + bulk_seconds:6.2f} s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--strains', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for num_strains in args.strains:
+        bench(num_strains, args.seed)
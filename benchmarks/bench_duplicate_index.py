@@ -0,0 +1,83 @@
+''' Benchmark the filter stage (filter_csv.filter_all) with DuplicateIndex vs. the former list membership test
+
+On synthetic CSVs (straindb.synthetic) of 10k to 1M strain rows, with allele and plasmid rows in
+proportion, filter_all is timed as the pipeline runs it, once with DuplicateIndex and once with
+ListIndex, the former duplicate detection (a list of names tested with `in`), patched in where
+filter_csv creates its indexes. Both must write the same outputs and error files (duplicate
+rows name the line of their first occurrence). Time per row stays flat
+with DuplicateIndex and grows with n with ListIndex, which is therefore only run on the smaller
+sizes (at 1M rows it would take hours).
+
+Usage: python3 benchmarks/bench_duplicate_index.py [--sizes 10000 100000 1000000] [--list-sizes 10000 100000]
+'''
+
+import argparse, hashlib, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from straindb import filter_csv
+from straindb.duplicate_index import DuplicateIndex
+from straindb.synthetic import synthetic_config
+
+
+class ListIndex:  # the former duplicate detection: names in a list, with the first line number of each
+
+    def __init__(self):
+        self.names = []
+        self.linenums = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def check(self, name, linenum):
+        if name in self.names:
+            return self.linenums[self.names.index(name)]
+        self.names.append(name)
+        self.linenums.append(linenum)
+        return None
+
+
+def time_filter(config, index_class):  # seconds of filter_all, with index_class detecting duplicates
+    filter_csv.DuplicateIndex = index_class
+    try:
+        with redirect_stdout(StringIO()):
+            start = time.perf_counter()
+            filter_csv.filter_all(config)
+            return time.perf_counter() - start
+    finally:
+        filter_csv.DuplicateIndex = DuplicateIndex
+
+
+def output_digests(config):  # file name -> digest of the filter outputs and error files
+    return {path.name: hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()
+            for path in sorted(config.filter_dir.glob('*.csv')) + sorted(config.filter_errdir.glob('*.csv'))}
+
+
+def raw_rows(config):  # data rows of the three raw CSVs
+    return sum(sum(1 for _ in open(path)) - 1 for path in config.rawCSV.values())
+
+
+def bench(sizes, list_sizes):
+    print(f"  {'strain rows':>11} {'all rows':>10} {'index':<16} {'seconds':>9} {'us/row':>8}")
+    for n in sorted(set(sizes) | set(list_sizes)):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = synthetic_config(tmp, n)
+            rows = raw_rows(config)
+            outputs = []
+            for label, index_class, run in [('DuplicateIndex', DuplicateIndex, n in sizes), ('ListIndex', ListIndex, n in list_sizes)]:
+                if not run:
+                    continue
+                seconds = time_filter(config, index_class)
+                outputs.append(output_digests(config))
+                print(f'  {n:>11} {rows:>10} {label:<16} {seconds:>9.2f} {1e6*seconds/rows:>8.2f}')
+            assert all(digests == outputs[0] for digests in outputs), 'outputs differ between DuplicateIndex and ListIndex'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000], help='strain rows to filter with DuplicateIndex')
+    parser.add_argument('--list-sizes', type=int, nargs='+', default=[10_000, 100_000], help='strain rows to filter with ListIndex')
+    args = parser.parse_args()
+    bench(args.sizes, args.list_sizes)
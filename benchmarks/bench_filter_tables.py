@@ -0,0 +1,58 @@
+''' Benchmark filter_all with the three tables filtered one after another and in parallel processes
+
+Runs on the raw CSVs of config.yaml (our CHB exports), or with --synthetic on synthetic CSVs
+(straindb.synthetic), and checks that both modes write identical outputs, error files and
+errstats.txt. Outputs go to a temporary directory.
+
+Usage: python3 benchmarks/bench_filter_tables.py [--config config.yaml | --synthetic STRAINS] [--repeat 3]
+'''
+
+import argparse, copy, statistics, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from straindb.config import load_config
+from straindb.filter_csv import filter_all
+from straindb.synthetic import synthetic_config
+
+
+def run(config, output_directory, parallel_tables):  # seconds taken by filter_all
+    config = copy.copy(config)
+    config.output_directory = output_directory
+    config.parallel_tables = parallel_tables
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        filter_all(config)
+    return time.perf_counter() - start
+
+
+def snapshot(directory):  # relative path -> contents of each file in directory
+    return {p.relative_to(directory): p.read_bytes() for p in Path(directory).rglob('*') if p.is_file()}
+
+
+def bench(config, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        seconds = {}
+        outputs = {}
+        for parallel_tables in (False, True):  # same output directory for both, since errstats.txt names it
+            seconds[parallel_tables] = statistics.median(run(config, Path(tmp), parallel_tables) for _ in range(repeat))
+            outputs[parallel_tables] = snapshot(tmp)
+        assert outputs[False] == outputs[True], 'outputs differ'
+
+    print(f"Raw CSVs: {', '.join(str(p) for p in config.rawCSV.values())}")
+    print(f'  sequential: {seconds[False]:8.2f} s')
+    print(f'  parallel:   {seconds[True]:8.2f} s')
+    print(f'  speedup:    {seconds[False]/seconds[True]:8.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', help='path to config.yaml (default: straindb/config.yaml)')
+    parser.add_argument('--synthetic', type=int, metavar='STRAINS', help='run on synthetic CSVs of this many strains instead')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as tmp:
+            bench(synthetic_config(tmp, args.synthetic), args.repeat)
+    else:
+        bench(load_config(args.config), args.repeat)
@@ -0,0 +1,49 @@
+''' Benchmark memory held by parsed genotypes, as parse_genotype dicts and as compact Genotypes
+
+Each synthetic strain's genotype is parsed separately (no cache sharing), as when parsed
+genotypes are kept per strain; both forms are checked to round-trip losslessly.
+
+Usage: python3 benchmarks/bench_genotype_model.py [--strains N]
+'''
+
+import argparse, tracemalloc
+from straindb.genotype_model import Genotype
+from straindb.parse_genotype import GenotypeParser
+from straindb.synthetic import SyntheticCHB
+
+# Every synthetic genotype distinct and parseable
+DISTINCT_VALID = {'genotype_reuse': 0, 'empty_genotype': 0, 'invalid_genotype': 0}
+
+
+def traced_size(build):  # bytes still allocated by build() when it returns, and its result
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def bench(num_strains, seed=0):
+    synthetic = SyntheticCHB(num_strains, seed, DISTINCT_VALID)
+    genotype_strs = [synthetic.genotype([]) for _ in range(num_strains)]
+    parser = GenotypeParser()
+    normalized = [parser.normalize(s) for s in genotype_strs]
+
+    dict_size, dicts = traced_size(lambda: [parser.parse_normalized(s) for s in normalized])
+    alleles = {}  # one allele table for all genotypes, as GenotypeParser keeps
+    compact_size, compact = traced_size(lambda: [Genotype.from_dicts(parser.parse_normalized(s), alleles) for s in normalized])
+
+    for d, g in zip(dicts, compact):
+        assert g.to_dicts() == d and Genotype.from_dicts(d) == g, 'lossless round trip'
+
+    print(f'{num_strains} synthetic genotypes')
+    print(f'  dicts:     {dict_size/2**20:8.2f} MiB ({dict_size/num_strains:6.0f} bytes/genotype)')
+    print(f'  Genotypes: {compact_size/2**20:8.2f} MiB ({compact_size/num_strains:6.0f} bytes/genotype)')
+    print(f'  ratio:     {dict_size/compact_size:8.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--strains', type=int, default=100000)
+    args = parser.parse_args()
+    bench(args.strains)
@@ -0,0 +1,41 @@
+''' Benchmark write_strains with genotypes parsed on 1, 2, 4 and 8 worker processes
+
+Strains are synthetic (straindb.synthetic).
+
+Usage: python3 benchmarks/bench_parallel_parse.py [--rows N] [--workers 1 2 4 8] [--seed 0]
+'''
+
+import argparse, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from straindb.config import Config
+from straindb.filter_csv import write_strains
+from straindb.synthetic import write_synthetic_csvs
+
+
+def bench(rows, workers_list, seed=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_csv = write_synthetic_csvs(Path(tmp) / 'raw', rows, seed)
+        print(f'{rows} synthetic strains')
+        print(f"  {'workers':>7} {'seconds':>9} {'speedup':>8}")
+        baseline = None
+        for workers in workers_list:
+            config = Config({'raw_csv': raw_csv,
+                             'output_directory': Path(tmp) / f'out{workers}',
+                             'workers': workers})
+            start = time.perf_counter()
+            with redirect_stdout(StringIO()):
+                write_strains(config)
+            seconds = time.perf_counter() - start
+            baseline = baseline or seconds
+            print(f'  {workers:>7} {seconds:>9.2f} {baseline/seconds:>8.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    bench(args.rows, args.workers, args.seed)
@@ -0,0 +1,80 @@
+''' Benchmark allele classification: AlleleClassifier vs. the former regex-per-check parse_allele
+
+Timing only: tests/test_parse_allele.py checks that both agree on corner cases and on random
+strings over the characters that matter to the patterns, with its own copy of the former
+parse_allele.
+
+Usage: python3 benchmarks/bench_parse_allele.py [--names 100000]
+'''
+
+import argparse, random, re, time
+from straindb.parse_allele import AlleleClassifier
+
+
+def former_parse_allele(allele_name):  # parse_allele as it was, with a regex for each check
+
+    if allele_name == '' or not re.match(r'^([a-zA-Z]+[0-9]+[a-z]*)+$', allele_name):
+        return (None, None, 'invalid_allele_name')
+
+    allele_name = re.sub(r'[a-z]+$','',allele_name)
+
+    if re.match(r'^([a-z]{1,3}[0-9]+)+$', allele_name):
+        allele_type = 'mutant'
+    elif re.match(r'^[a-z]{1,3}(Ex|Is|Si)[0-9]+$', allele_name):
+        allele_type = 'transgene'
+    elif re.match(r'^[a-z]{1,3}(T|C|In|Df)[0-9]+$', allele_name):
+        allele_type = 'rearrangement'
+    else:
+        allele_type = 'other'
+
+    return (allele_name, allele_type, None)
+
+
+def synthetic_names(n, seed=0):  # allele names in the proportions of CHB exports, with repeats (as in genotypes) and a few invalid names
+    rng = random.Random(seed)
+    names = []
+    for _ in range(n):
+        if names and rng.random() < 0.5:
+            names.append(rng.choice(names))
+            continue
+        prefix = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(1, 3)))
+        kind = rng.random()
+        if kind < 0.6:
+            name = f'{prefix}{rng.randint(1, 9999)}'
+        elif kind < 0.85:
+            name = f"{prefix}{rng.choice(['Ex', 'Is', 'Si'])}{rng.randint(1, 999)}"
+        elif kind < 0.9:
+            name = f"{prefix}{rng.choice(['T', 'C', 'In', 'Df'])}{rng.randint(1, 99)}"
+        elif kind < 0.97:
+            name = f'{prefix.upper()}{rng.randint(1, 99)}'
+        else:
+            name = f'{prefix}-{rng.randint(1, 99)}'
+        if rng.random() < 0.1:
+            name += rng.choice(['a', 'b', 'ts'])
+        names.append(name)
+    return names
+
+
+def timed(f, names):
+    start = time.perf_counter()
+    f(names)
+    return time.perf_counter() - start
+
+
+def bench(num_names):
+    names = synthetic_names(num_names)
+    classifier = AlleleClassifier()
+    seconds = [('former parse_allele', timed(lambda names: [former_parse_allele(name) for name in names], names)),
+               ('AlleleClassifier.classify', timed(lambda names: [classifier.classify(name) for name in names], names)),
+               ('AlleleClassifier.classify_many', timed(classifier.classify_many, names))]
+    print(f"  {'':<32} {'seconds':>8} {'ns/name':>8} {'speedup':>8}")
+    for label, s in seconds:
+        print(f'  {label:<32} {s:>8.3f} {1e9*s/num_names:>8.0f} {seconds[0][1]/s:>8.2f}')
+    print(f'  classify_many memo hits: {classifier.memo_hits} of {num_names}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--names', type=int, default=100_000)
+    args = parser.parse_args()
+    bench(args.names)
@@ -0,0 +1,175 @@
+''' Benchmark each stage of the pipeline at 10k, 100k and 1M strains, on synthetic CHB-shaped CSVs
+
+For each size, raw CSVs are written by straindb.synthetic (same seed, so runs are comparable),
+then filter, normalize (with reference validation and the index file) and the staging table
+loader are run under straindb.instrument's Profiler, each repeat in a fresh process so caches
+and peak RSS do not carry over between sizes. Staging tables are loaded into a temporary
+SQLite database, or with --mysql into the MySQL database of config.yaml, where the SQL ETL
+(3_create_db_tables.sql, then 4_load_db_tables.sql or with --set-based its set-based variant)
+is timed too; its tables are dropped.
+
+Results (median wall and CPU seconds, rows/sec and peak RSS of each step) can be saved as
+JSON with --save, and compared with a saved run with --compare; steps more than --threshold
+slower than in the saved run are reported as regressions, and the exit status is 1, e.g.
+
+    python3 benchmarks/bench_pipeline_scaling.py --save before.json
+    (change something)
+    python3 benchmarks/bench_pipeline_scaling.py --compare before.json
+
+Usage: python3 benchmarks/bench_pipeline_scaling.py [--sizes 10000 100000 1000000] [--repeat 1] [--seed 0]
+           [--workers N] [--columnar] [--table-files] [--mysql [--config config.yaml] [--set-based]]
+           [--save results.json] [--compare results.json] [--threshold 0.1]
+'''
+
+import argparse, json, multiprocessing, platform, sqlite3, statistics, subprocess, sys, tempfile, time
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from datetime import datetime
+from io import StringIO
+from pathlib import Path
+from straindb import instrument
+from straindb.config import Config, load_config
+from straindb.filter_csv import filter_all
+from straindb.load import connect, load_all
+from straindb.normalize_csv import normalize_all
+from straindb.sql_scripts import schema_statements, script_statements, sql_dir
+from straindb.synthetic import write_synthetic_csvs
+
+SIZES = [10_000, 100_000, 1_000_000]
+STEP_KEYS = ['wall_seconds', 'cpu_seconds', 'children_cpu_seconds', 'rows', 'rows_per_second', 'peak_rss_mb']
+NOISE_SECONDS = 0.05  # steps faster than this in both runs are not reported as regressions
+
+
+def run_etl(connection, set_based):  # create the database tables and load them from the staging tables
+    scripts = ['3_create_db_tables.sql', '4_load_db_tables_set_based.sql' if set_based else '4_load_db_tables.sql']
+    cursor = connection.cursor()
+    for script in scripts:
+        for statement in script_statements(sql_dir / script):
+            cursor.execute(statement)
+            if cursor.with_rows:
+                cursor.fetchall()
+    connection.commit()
+    cursor.close()
+
+
+def run_stages(settings, mysql, set_based):  # top-level steps of one profiled run (in a fresh process): step -> OrderedDict of STEP_KEYS
+    config = Config(settings)
+    with tempfile.TemporaryDirectory() as profile_dir:
+        profiler = instrument.Profiler(Path(profile_dir), 'bench_pipeline_scaling')
+        with profiler, redirect_stdout(StringIO()):
+            filter_all(config)
+            normalize_all(config)
+            if mysql:
+                connection = connect(config)
+                cursor = connection.cursor()
+                for statement in script_statements(sql_dir / '1_create_staging_tables.sql'):
+                    cursor.execute(statement)
+                cursor.close()
+            else:
+                connection = sqlite3.connect(Path(profile_dir) / 'staging.db')
+                for statement in schema_statements(sqlite=True, script='1_create_staging_tables.sql'):
+                    connection.execute(statement)
+            try:
+                load_all(config, connection)
+                if mysql:
+                    with instrument.step('etl'):
+                        run_etl(connection, set_based)
+            finally:
+                connection.close()
+            report = profiler.report()
+    return OrderedDict((step['step'], OrderedDict((k, step[k]) for k in STEP_KEYS))
+                       for step in report['steps'] if 'parent' not in step)
+
+
+def median_steps(runs):  # step -> median of each value over runs
+    return OrderedDict((name, OrderedDict((k, round(statistics.median(run[name][k] for run in runs), 4)) for k in STEP_KEYS))
+                       for name in runs[0])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench(sizes, repeat, seed, settings, mysql_config=None, set_based=False):  # results: run metadata, and size -> step -> values
+    results = OrderedDict([
+        ('date', datetime.now().isoformat(timespec='seconds')),
+        ('commit', git_commit()),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('seed', seed),
+        ('settings', settings),
+        ('backend', ('mysql, set-based etl' if set_based else 'mysql') if mysql_config else 'sqlite'),
+        ('sizes', OrderedDict()),
+    ])
+    spawn = multiprocessing.get_context('spawn')
+    for strains in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            paths = write_synthetic_csvs(Path(tmp) / 'raw', strains, seed)
+            generate_seconds = time.perf_counter() - start
+            run_settings = dict(mysql_config.settings if mysql_config else {}, **settings)
+            run_settings.update({'raw_csv': {table: str(path) for table, path in paths.items()}, 'output_directory': str(Path(tmp) / 'output')})
+            runs = []
+            for _ in range(repeat):
+                with spawn.Pool(1) as pool:
+                    runs.append(pool.apply(run_stages, (run_settings, mysql_config is not None, set_based)))
+        steps = median_steps(runs)
+        results['sizes'][str(strains)] = steps
+        print(f'{strains} strains (CSVs written in {generate_seconds:.1f} s)')
+        print(f"  {'step':<22} {'wall s':>9} {'cpu s':>9} {'rows':>9} {'rows/s':>10} {'peak MB':>8}")
+        for name, values in steps.items():
+            print(f"  {name:<22} {values['wall_seconds']:>9.2f} {values['cpu_seconds']:>9.2f} {values['rows']:>9} "
+                  f"{values['rows_per_second']:>10.0f} {values['peak_rss_mb']:>8.1f}")
+    return results
+
+
+def compare(results, baseline, threshold):  # print wall time ratios to a saved run; return the regressions
+    print(f"Compared with {baseline['date']} (commit {baseline['commit']}, settings {baseline['settings']}):")
+    print(f"  {'strains':>8} {'step':<22} {'before s':>9} {'after s':>9} {'ratio':>7}")
+    regressions = []
+    for size, steps in results['sizes'].items():
+        for name, values in steps.items():
+            before = baseline['sizes'].get(size, {}).get(name)
+            if before is None:
+                continue
+            (b, a) = (before['wall_seconds'], values['wall_seconds'])
+            ratio = a / b if b else float('inf')
+            regressed = ratio > 1 + threshold and max(a, b) >= NOISE_SECONDS
+            if regressed:
+                regressions.append((size, name, ratio))
+            print(f"  {size:>8} {name:<22} {b:>9.2f} {a:>9.2f} {ratio:>7.2f}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of strain rows')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each size (median reported)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--columnar', action='store_true')
+    parser.add_argument('--table-files', action='store_true')
+    parser.add_argument('--mysql', action='store_true', help='load into the MySQL database of config.yaml and time the SQL ETL')
+    parser.add_argument('--config', help='config.yaml with a mysql section (default: straindb/config.yaml)')
+    parser.add_argument('--set-based', action='store_true', help='with --mysql, run 4_load_db_tables_set_based.sql')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='compare with results saved by --save')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression (default 0.1: 10%%)')
+    args = parser.parse_args()
+
+    settings = OrderedDict([('workers', args.workers), ('columnar', args.columnar), ('table_files', args.table_files)])
+    results = bench(args.sizes, args.repeat, args.seed, settings, load_config(args.config) if args.mysql else None, args.set_based)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(f'{name} at {size}' for size, name, _ in regressions)}")
+            sys.exit(1)
@@ -0,0 +1,139 @@
+''' Benchmark the queries of sql/example_queries.sql on synthetic databases, with and without the indexes of 3_create_db_tables.sql
+
+For each scale (a multiple of BASE_SIZE, roughly the size of the current database), the
+tables of 3_create_db_tables.sql are created twice, once with the primary, unique and
+secondary keys removed ("before") and once as written ("after"), filled with the same
+synthetic rows, and each example query is timed. Query results must agree between the two.
+
+Runs against the MySQL database in the mysql section of config.yaml (its tables are dropped),
+or against a temporary SQLite database with --sqlite.
+
+Usage: python3 benchmarks/bench_queries.py [--config config.yaml | --sqlite] [--scales 10 100] [--repeat 3]
+'''
+
+import argparse, random, sqlite3, statistics, tempfile, time
+from collections import OrderedDict
+from pathlib import Path
+from straindb.config import load_config
+from straindb.load import connect, placeholder_for
+from straindb.sql_scripts import example_queries, schema_statements
+
+BASE_SIZE = OrderedDict([('strain', 4000), ('allele', 3000), ('gene', 300), ('plasmid', 800)])
+
+# Names used by example_queries.sql, so the queries return rows
+QUERY_ALLELES = ['p808', 'hmn12', 'mIn1', 'ia4', 'oyIs44']
+QUERY_PLASMIDS = ['pCY118', 'pCY168', 'pCY155', 'pMH339']
+QUERY_GENES = ['apa-2']
+CHROMOSOMES = ['I', 'II', 'III', 'IV', 'V', 'X', None]
+
+def synthetic_tables(scale, seed=0):  # table -> rows, with ids assigned
+    rng = random.Random(seed)
+    n = OrderedDict((table, size * scale) for table, size in BASE_SIZE.items())
+
+    genes = QUERY_GENES + [f'gen-{i}' for i in range(n['gene'] - len(QUERY_GENES))]
+    alleles = QUERY_ALLELES + [f'{rng.choice(["e", "n", "tm", "ok", "oy"])}{i}' for i in range(n['allele'] - len(QUERY_ALLELES))]
+    plasmids = QUERY_PLASMIDS + [f'pX{i}' for i in range(n['plasmid'] - len(QUERY_PLASMIDS))]
+
+    tables = OrderedDict()
+    tables['strain'] = [(i+1, f'CHB{i+1}', None, 'CGC', None) for i in range(n['strain'])]
+    tables['gene'] = [(i+1, name) for i, name in enumerate(genes)]
+    tables['allele'] = [(i+1, name, rng.choice(['mutant', 'transgene', 'rearrangement', 'other']),
+                         rng.randint(1, len(genes)) if rng.random() < 0.5 else None, None) for i, name in enumerate(alleles)]
+    tables['plasmid'] = [(i+1, name, name + '[expanded]', 'lab', None, None, None, None) for i, name in enumerate(plasmids)]
+    def random_plasmid():  # skewed towards the plasmids of the example queries
+        return rng.randint(1, len(QUERY_PLASMIDS)) if rng.random() < 0.1 else rng.randint(1, len(plasmids))
+    tables['allele_plasmid'] = sorted({(a, random_plasmid())
+                                       for a in range(1, len(alleles) + 1) for _ in range(rng.randint(0, 2)) if rng.random() < 0.4})
+
+    tables['alleleset'] = []
+    tables['alleleset_allele'] = []
+    for strain_id in range(1, n['strain'] + 1):
+        for chromosome in rng.sample(CHROMOSOMES, rng.randint(1, 3)):
+            for binaryid in range(rng.choice([1, 1, 2])):
+                alleleset_id = len(tables['alleleset']) + 1
+                tables['alleleset'].append((alleleset_id, binaryid, strain_id, chromosome))
+                for _ in range(rng.randint(1, 2)):
+                    allele_id = rng.randint(1, len(QUERY_ALLELES)) if rng.random() < 0.05 else rng.randint(1, len(alleles))
+                    tables['alleleset_allele'].append((alleleset_id, allele_id, binaryid == 1))
+
+    # Materialized strain_plasmid, as refresh_strain would compute it
+    strain_of = {ast[0]: ast[2] for ast in tables['alleleset']}
+    plasmids_of = OrderedDict()
+    for (allele_id, plasmid_id) in tables['allele_plasmid']:
+        plasmids_of.setdefault(allele_id, []).append(plasmid_id)
+    tables['strain_plasmid'] = sorted({(plasmid_id, strain_of[aa[0]]) for aa in tables['alleleset_allele']
+                                       for plasmid_id in plasmids_of.get(aa[1], [])})
+    return tables
+
+
+def fill(connection, tables):
+    placeholder = placeholder_for(connection)
+    cursor = connection.cursor()
+    for table, rows in tables.items():
+        cursor.executemany(f"insert into {table} values ({', '.join([placeholder]*len(rows[0]))})", rows)
+    connection.commit()
+    # Update index statistics, so the query planner sees the new table sizes
+    if isinstance(connection, sqlite3.Connection):
+        cursor.execute('analyze')
+    else:
+        cursor.execute(f"analyze table {', '.join(tables)}")
+        cursor.fetchall()
+    cursor.close()
+
+
+def time_query(connection, statements, repeat):  # median seconds of the last statement, and its rows
+    cursor = connection.cursor()
+    seconds = []
+    for _ in range(repeat):
+        for statement in statements[:-1]:
+            cursor.execute(statement)
+        start = time.perf_counter()
+        cursor.execute(statements[-1])
+        rows = cursor.fetchall()
+        seconds.append(time.perf_counter() - start)
+    cursor.close()
+    return statistics.median(seconds), sorted(rows)
+
+
+def bench(connect_db, sqlite, scales, repeat):
+    queries = example_queries(sqlite)
+    for scale in scales:
+        tables = synthetic_tables(scale)
+        print(f"{scale}x: {', '.join(f'{len(rows)} {table}' for table, rows in tables.items())}")
+        results = OrderedDict()
+        for label, indexes in [('before', False), ('after', True)]:
+            connection = connect_db()
+            try:
+                cursor = connection.cursor()
+                if not sqlite:
+                    cursor.execute('set foreign_key_checks = 0')
+                for statement in schema_statements(indexes, sqlite):
+                    cursor.execute(statement)
+                cursor.close()
+                fill(connection, tables)
+                results[label] = OrderedDict((title, time_query(connection, statements, repeat))
+                                             for title, statements in queries.items())
+            finally:
+                connection.close()
+
+        print(f"  {'query':<60} {'rows':>6} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+        for title in queries:
+            (before, rows), (after, rows_after) = results['before'][title], results['after'][title]
+            assert rows == rows_after, f'{title}: results differ with and without indexes'
+            print(f'  {title[:60]:<60} {len(rows):>6} {before*1000:>10.1f} {after*1000:>10.1f} {before/max(after, 1e-9):>8.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', help='config.yaml with a mysql section')
+    parser.add_argument('--sqlite', action='store_true', help='use a temporary SQLite database instead of MySQL')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        with tempfile.TemporaryDirectory() as tmp:
+            bench(lambda: sqlite3.connect(Path(tmp) / 'bench.db'), True, args.scales, args.repeat)
+    else:
+        config = load_config(args.config)
+        bench(lambda: connect(config), False, args.scales, args.repeat)
@@ -0,0 +1,96 @@
+''' Benchmark StrainIndex queries against the example queries run in SQLite, on the synthetic databases of bench_queries.py
+
+The synthetic tables are loaded into SQLite (with the indexes of 3_create_db_tables.sql) and
+turned back into normalize output rows for StrainIndex, which is also written to an index
+file and reopened from it; each example query must return the same strains from all three.
+
+Usage: python3 benchmarks/bench_query_engine.py [--scales 1 10 100] [--repeat 100]
+'''
+
+import argparse, sqlite3, statistics, tempfile, time
+from collections import OrderedDict
+from pathlib import Path
+from bench_queries import fill, synthetic_tables
+from straindb.index_file import write_index_file
+from straindb.query import StrainIndex, strain_postings
+from straindb.sql_scripts import example_queries, schema_statements
+
+# Example queries of example_queries.sql as StrainIndex expressions
+EXPRESSIONS = [
+    'plasmid:pCY118 and plasmid:pCY168 and not plasmid:pCY155',
+    'gene:apa-2',
+    'allele:p808 and allele:hmn12',
+    'allele:mIn1 and not allele:ia4',
+    'allele:oyIs44 and plasmid:pMH339',
+]
+
+
+def normalize_rows(tables):  # strain_allele rows, allele rows and plasmid names equivalent to the synthetic tables
+    names = OrderedDict((table, {r[0]: r[1] for r in tables[table]}) for table in ('strain', 'gene', 'allele', 'plasmid'))
+    alleleset = {r[0]: r for r in tables['alleleset']}
+    strain_allele_rows = []
+    for (alleleset_id, allele_id, heterozygous) in tables['alleleset_allele']:
+        (_, binaryid, strain_id, chromosome) = alleleset[alleleset_id]
+        strain_allele_rows.append([strain_id, names['strain'][strain_id], chromosome, binaryid,
+                                   names['allele'][allele_id], None, heterozygous, None, 'CGC', None])
+    strain_allele_rows.sort(key=lambda r: r[0])  # strains in id order, as loaded
+
+    plasmids_of = OrderedDict()
+    for (allele_id, plasmid_id) in tables['allele_plasmid']:
+        plasmids_of.setdefault(allele_id, []).append(names['plasmid'][plasmid_id])
+    allele_rows = []
+    for (allele_id, name, allele_type, gene_id, comment) in tables['allele']:
+        for plasmid_name in plasmids_of.get(allele_id, [None]):
+            allele_rows.append([allele_id, name, allele_type, names['gene'].get(gene_id), plasmid_name, comment])
+
+    return strain_allele_rows, allele_rows, list(names['plasmid'].values())
+
+
+def median_seconds(f, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def bench(scales, repeat, tmp):
+    queries = example_queries(sqlite=True)
+    for scale in scales:
+        tables = synthetic_tables(scale)
+        connection = sqlite3.connect(':memory:')
+        for statement in schema_statements(indexes=True, sqlite=True):
+            connection.execute(statement)
+        fill(connection, tables)
+
+        start = time.perf_counter()
+        strain_names, postings = strain_postings(*normalize_rows(tables))
+        index = StrainIndex(strain_names, postings)
+        print(f'{scale}x: {len(index.strain_names)} strains, index built in {time.perf_counter() - start:.2f} s')
+
+        index_path = Path(tmp) / f'strain_index_{scale}.bin'
+        write_index_file(index_path, strain_names, postings, [])
+        start = time.perf_counter()
+        mapped = StrainIndex.from_index_file(index_path)
+        print(f'  index file of {index_path.stat().st_size/2**20:.1f} MiB opened in {(time.perf_counter() - start)*1000:.2f} ms')
+
+        print(f"  {'query':<60} {'rows':>6} {'SQLite us':>10} {'index us':>10}")
+        for (title, statements), expression in zip(queries.items(), EXPRESSIONS):
+            sql_names = {r[0] for r in connection.execute(statements[-1])}
+            names = index.query(expression)
+            assert set(names) == sql_names and len(names) == len(sql_names), f'{title}: results differ'
+            assert mapped.query(expression) == names, f'{title}: index file results differ'
+            sql_seconds = median_seconds(lambda: connection.execute(statements[-1]).fetchall(), max(repeat // 10, 1))
+            index_seconds = median_seconds(lambda: index.evaluate(expression), repeat)
+            print(f'  {title[:60]:<60} {len(names):>6} {sql_seconds*1e6:>10.0f} {index_seconds*1e6:>10.1f}')
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        bench(args.scales, args.repeat, tmp)
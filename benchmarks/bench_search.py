@@ -0,0 +1,151 @@
+''' Benchmark substring and fuzzy search with the trigram index (straindb.search) against like '%...%' queries in SQLite
+
+On synthetic CSVs (straindb.synthetic; by default 20000 strains, about our data, and 200000,
+10x it), the normalize stage writes normalize/search_index.bin, and build_sqlite_db the SQLite
+database. Search texts are random fragments (3 to 6 characters, and 1 or 2) of allele, gene
+and plasmid names, expanded names and genotypes, and random one-character edits of names. For
+each:
+
+    substring  SearchIndex.substring over names must return the strains of the like '%text%'
+               joins below, with the same ids; over all fields, the strains a scan of every term finds
+    fuzzy      SearchIndex.fuzzy (one edit) must return the strains of the names a scan finds
+               within one edit
+
+Median and maximum latencies are reported, and whether each median of the index meets the
+target of TARGET_MS (the index is memory-mapped from its file, and opening it is timed too).
+Texts of 1 or 2 characters, which match a large share of all terms, are reported without it.
+
+Usage: python3 benchmarks/bench_search.py [--strains 20000 200000] [--queries 200] [--seed 0]
+'''
+
+import argparse, random, statistics, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from straindb.filter_csv import filter_all
+from straindb.normalize_csv import normalize_all
+from straindb.search import NAME_FIELDS, TERM_FIELDS, SearchIndex
+from straindb.sqlite_db import build_sqlite_db, connect_sqlite
+from straindb.synthetic import synthetic_config
+
+TARGET_MS = 1.0  # median latency of index searches, at 10x our data
+
+LIKE_QUERY = r'''
+select ast.strain_id
+  from alleleset ast
+  join alleleset_allele aa on aa.alleleset_id = ast.id
+  join allele a on a.id = aa.allele_id
+  left join gene g on g.id = a.gene_id
+  where a.name like :text escape '\' or g.name like :text escape '\'
+union
+select sp.strain_id
+  from strain_plasmid sp
+  join plasmid p on p.id = sp.plasmid_id
+  where p.name like :text escape '\' or p.expanded_name like :text escape '\'
+'''
+
+
+def like_pattern(text):
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def levenshtein(a, b):  # unbounded, to check SearchIndex's bounded edit distance
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def all_terms(index, fields):  # [(name, strain ids)] of every term of fields
+    terms = []
+    for f, field in enumerate(TERM_FIELDS):
+        if field in fields:
+            terms += [(name, {i + 1 for i in index.term_strains[f](k)}) for k, name in enumerate(index.terms[f])]
+    return terms
+
+
+def fragments(index, count, lengths, rng):  # count random fragments of terms, of lengths (min, max) where terms are long enough
+    texts = []
+    for _ in range(count):
+        f = rng.randrange(len(TERM_FIELDS))
+        name = index.terms[f][rng.randrange(len(index.terms[f]))]
+        length = min(len(name), rng.randint(*lengths))
+        start = rng.randrange(len(name) - length + 1)
+        texts.append(name[start:start + length])
+    return texts
+
+
+def search_texts(index, count, rng):  # (substring texts, short substring texts, fuzzy texts)
+    substrings, short, fuzzy = fragments(index, count, (3, 6), rng), fragments(index, count, (1, 2), rng), []
+    names = [name for name, _ in all_terms(index, NAME_FIELDS)]
+    for _ in range(count):
+        name = rng.choice(names)
+        i = rng.randrange(len(name))
+        c = rng.choice('abcdeghklmnpst0123456789-')
+        fuzzy.append(rng.choice([name[:i] + c + name[i+1:], name[:i] + name[i+1:], name[:i] + c + name[i:]]))
+    return substrings, short, fuzzy
+
+
+def median_ms(f, texts):
+    seconds = []
+    for text in texts:
+        start = time.perf_counter()
+        f(text)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds) * 1000, max(seconds) * 1000
+
+
+def bench(num_strains, num_queries, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = synthetic_config(tmp, num_strains, seed)
+        with redirect_stdout(StringIO()):
+            filter_all(config)
+            start = time.perf_counter()
+            normalize_all(config)
+            build_sqlite_db(config)
+        start = time.perf_counter()
+        index = SearchIndex.from_config(config)
+        open_ms = (time.perf_counter() - start) * 1000
+        assert index.index_file is not None, 'search index file is missing or stale'
+        connection = connect_sqlite(config)
+        substrings, short, fuzzy = search_texts(index, num_queries, random.Random(seed))
+
+        name_terms, terms = all_terms(index, NAME_FIELDS), all_terms(index, TERM_FIELDS)
+        for text in substrings:
+            expected = {strain_id for (strain_id,) in connection.execute(LIKE_QUERY, {'text': like_pattern(text)})}
+            assert set(index.substring(text, NAME_FIELDS)) == expected, f'{text!r}: names differ from like query'
+        for text in substrings + short:
+            expected = set().union(*(ids for name, ids in terms if text.lower() in name.lower()))
+            assert set(index.substring(text)) == expected, f'{text!r}: strains differ from scan'
+        for text in fuzzy:
+            expected = set().union(*(ids for name, ids in name_terms if levenshtein(text.lower(), name.lower()) <= 1))
+            assert set(index.fuzzy(text)) == expected, f'{text!r}: fuzzy strains differ from scan'
+
+        print(f'{num_strains} strains: {index.num_terms} terms, {len(index.trigrams)} trigrams, '
+              f'{config.normalize_dir.joinpath("search_index.bin").stat().st_size/2**20:.1f} MB index, {num_queries} queries of each kind')
+        print(f'  opening the index: {open_ms:.1f} ms')
+        print(f"  {'query':<48} {'median ms':>10} {'max ms':>10} {f'< {TARGET_MS:g} ms':>10}")
+        for label, f, texts, checked in [
+                ("like '%text%' joins (SQLite)", lambda text: connection.execute(LIKE_QUERY, {'text': like_pattern(text)}).fetchall(), substrings, False),
+                ('substring, names', lambda text: index.substring(text, NAME_FIELDS), substrings, True),
+                ('substring, names and genotypes', index.substring, substrings, True),
+                ('substring, names and genotypes, first 100 strains', lambda text: index.substring(text, limit=100), substrings, True),
+                ('substring of 1-2 characters, first 100 strains', lambda text: index.substring(text, limit=100), short, False),
+                ('fuzzy, one edit', index.fuzzy, fuzzy, True),
+                ('fuzzy, one edit, first 100 strains', lambda text: index.fuzzy(text, limit=100), fuzzy, True)]:
+            median, worst = median_ms(f, texts)
+            target = ('yes' if median < TARGET_MS else 'NO') if checked else ''
+            print(f'  {label:<48} {median:>10.3f} {worst:>10.3f} {target:>10}')
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--strains', type=int, nargs='+', default=[20_000, 200_000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for num_strains in args.strains:
+        bench(num_strains, args.queries, args.seed)
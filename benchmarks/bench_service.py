@@ -0,0 +1,223 @@
+''' Benchmark the lookup service (straindb.service) against a connection per lookup, and check its results and cache invalidation
+
+On synthetic CSVs (straindb.synthetic), filtered and normalized, build_sqlite_db builds the
+SQLite database that stands in for MySQL, and a LookupService serves it in this process on a
+free port. Requests are strain, allele, plasmid and gene lookups and set queries (allele:X and
+plasmid:Y, and not, or), drawn with Zipf-like repetition from a set of distinct targets, and sent
+by concurrent clients over kept-alive HTTP connections. Each distinct target is checked:
+
+    lookups   strains of an allele, gene or plasmid must be those of StrainIndex (in id order),
+              alleles and plasmids of a strain those of its strain_view row
+    queries   strains must be those of StrainIndex.query
+
+Timings: each request as a tool makes it today (new connection, lookup, close), then the service
+with an empty cache and again with every response cached. The CSVs are then generated again with
+another seed and the database rebuilt: the service must report the next load generation, drop
+its cached responses, and answer every target from the new tables.
+
+Usage: python3 benchmarks/bench_service.py [--strains 20000] [--targets 400] [--requests 4000] [--clients 8] [--seed 0]
+'''
+
+import argparse, asyncio, json, random, re, statistics, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from urllib.parse import parse_qs, quote, unquote, urlencode
+from straindb.filter_csv import filter_all
+from straindb.normalize_csv import normalize_all
+from straindb.query import StrainIndex
+from straindb.service import LookupService, request_query, routes, sqlite_connector
+from straindb.sqlite_db import build_sqlite_db, connect_sqlite
+from straindb.synthetic import synthetic_config
+
+term_name_re = re.compile(r'^[^\s()]+$')  # names a query expression can hold
+
+
+class Client:  # one kept-alive HTTP/1.1 connection to the service
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def get(self, target):  # (status, decoded JSON)
+        self.writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode().partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def prepare(config):  # filter, normalize and build the SQLite database; return its StrainIndex
+    with redirect_stdout(StringIO()):
+        filter_all(config)
+        normalize_all(config)
+        build_sqlite_db(config)
+    return StrainIndex.from_config(config)
+
+
+def make_targets(config, count, rng):  # distinct request targets: lookups of each kind, and queries
+    connection = connect_sqlite(config)
+    names = {route: [name for (name,) in connection.execute(f'select name from {table} order by random() limit {count}')]
+             for route, table in [('strains', 'strain'), ('alleles', 'allele'), ('plasmids', 'plasmid'), ('genes', 'gene')]}
+    connection.close()
+    term = lambda route: rng.choice([name for name in names[route] if term_name_re.match(name)])
+    targets = set()
+    while len(targets) < count:
+        kind = rng.randrange(6)
+        if kind < 4:
+            route = list(routes)[kind]
+            targets.add(f'/{route}/{quote(rng.choice(names[route]), safe="")}')
+        else:
+            expression = rng.choice([f'allele:{term("alleles")} and plasmid:{term("plasmids")}',
+                                     f'(gene:{term("genes")} or allele:{term("alleles")}) and not plasmid:{term("plasmids")}',
+                                     f'plasmid:{term("plasmids")} or plasmid:{term("plasmids")}',
+                                     f'gene:{term("genes")} and chromosome:X'])
+            targets.add('/query?' + urlencode({'q': expression}))
+    return sorted(targets)
+
+
+def query_expression(target):  # q of a /query target
+    return parse_qs(target.split('?', 1)[1])['q'][0]
+
+
+def check(config, index, responses):  # assert each (target, status, body) agrees with StrainIndex and strain_view
+    connection = connect_sqlite(config)
+    for target, status, body in responses:
+        if target.startswith('/query?'):
+            assert status == 200, f'{target}: status {status}'
+            assert body['strains'] == index.query(query_expression(target)), f'{target}: strains differ from StrainIndex'
+            continue
+        route, _, name = target[1:].partition('/')
+        name = unquote(name)
+        table = routes[route]
+        exists = connection.execute(f'select count(*) from {table} where name = ?', (name,)).fetchone()[0]
+        assert status == (200 if exists else 404), f'{target}: status {status}'
+        if status == 404:
+            continue
+        if route == 'strains':
+            (alleles, plasmids) = connection.execute('select allele_names, plasmids from strain_view where strain_name = ?', (name,)).fetchone()
+            split = lambda names: set(names.split(', ')) if names else set()
+            assert {a['name'] for a in body['alleles']} == split(alleles), f'{target}: alleles differ from strain_view'
+            assert set(body['plasmids']) == split(plasmids), f'{target}: plasmids differ from strain_view'
+        else:
+            field = {'alleles': 'allele', 'plasmids': 'plasmid', 'genes': 'gene'}[route]
+            assert body['strains'] == index.names(index.strains(field, name)), f'{target}: strains differ from StrainIndex'
+    connection.close()
+
+
+async def fetch_all(host, port, targets):  # [(target, status, body)], over one connection
+    client = await Client.open(host, port)
+    try:
+        return [(target, *await client.get(target)) for target in targets]
+    finally:
+        await client.close()
+
+
+async def run_clients(host, port, requests, num_clients):  # (seconds, per-request latencies) of num_clients sending requests concurrently
+    latencies = []
+
+    async def client_run(targets):
+        client = await Client.open(host, port)
+        try:
+            for target in targets:
+                start = time.perf_counter()
+                status, _ = await client.get(target)
+                latencies.append(time.perf_counter() - start)
+                assert status in (200, 404), f'{target}: status {status}'
+        finally:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_run(requests[i::num_clients]) for i in range(num_clients)))
+    return time.perf_counter() - start, latencies
+
+
+def connection_per_request(config, requests):  # (seconds, latencies) of each request as a new connection, lookup and close
+    connect = sqlite_connector(config.sqlite_database)
+    latencies = []
+    start = time.perf_counter()
+    for target in requests:
+        t = time.perf_counter()
+        connection = connect()
+        try:
+            request_query(target)(connection)
+        except Exception:
+            pass
+        connection.close()
+        latencies.append(time.perf_counter() - t)
+    return time.perf_counter() - start, latencies
+
+
+def report(label, seconds, latencies):
+    print(f'  {label:<40} {len(latencies)/seconds:>10.0f} {statistics.median(latencies)*1000:>10.3f}'
+          f' {sorted(latencies)[int(len(latencies)*0.99)]*1000:>10.3f}')
+
+
+async def bench_service(config, index, num_strains, num_targets, num_requests, num_clients, seed):
+    rng = random.Random(seed)
+    targets = make_targets(config, num_targets, rng)
+    weights = [1 / (i + 1) for i in range(len(targets))]
+    requests = rng.choices(rng.sample(targets, len(targets)), weights, k=num_requests)
+
+    service = LookupService(sqlite_connector(config.sqlite_database), pool_size=4, check_seconds=0.05)
+    server = await service.start('127.0.0.1', 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    try:
+        responses = await fetch_all(host, port, targets)
+        check(config, index, responses)
+        assert (await fetch_all(host, port, ['/strains/no%20such%20strain']))[0][1] == 404
+        assert (await fetch_all(host, port, ['/query?q=colour:red']))[0][1] == 400
+
+        print(f'{num_strains} strains: {len(targets)} distinct targets, {num_requests} requests, {num_clients} clients')
+        print(f"  {'':<40} {'req/s':>10} {'median ms':>10} {'p99 ms':>10}")
+        report('connection per request (no service)', *await asyncio.get_running_loop().run_in_executor(
+            None, connection_per_request, config, requests))
+        service.cache.clear()
+        hits, misses = service.cache.hits, service.cache.misses
+        report('service, empty cache', *await run_clients(host, port, requests, num_clients))
+        print(f'    {service.cache.hits - hits} hits, {service.cache.misses - misses} misses, {service.pool.opened} connections opened')
+        report('service, cached', *await run_clients(host, port, requests, num_clients))
+
+        generation = (await fetch_all(host, port, ['/generation']))[0][2]
+        assert generation['cached'] == len(set(requests)), generation
+        new_config = synthetic_config(config.output_directory.parent, num_strains, seed + 1, validate_references=config.validate_references)
+        new_index = await asyncio.get_running_loop().run_in_executor(None, prepare, new_config)
+        await asyncio.sleep(0.1)
+        after = (await fetch_all(host, port, ['/generation']))[0][2]
+        assert after['generation'] == generation['generation'] + 1 and after['cached'] == 0, after
+        check(new_config, new_index, await fetch_all(host, port, targets))
+        print(f"  reload: generation {generation['generation']} -> {after['generation']}, "
+              f"{generation['cached']} cached responses dropped, {len(targets)} targets answered from the new tables")
+    finally:
+        server.close()
+        await server.wait_closed()
+        service.close()
+
+
+def bench(num_strains, num_targets, num_requests, num_clients, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = synthetic_config(tmp, num_strains, seed)
+        index = prepare(config)
+        asyncio.run(bench_service(config, index, num_strains, num_targets, num_requests, num_clients, seed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--strains', type=int, nargs='+', default=[20_000])
+    parser.add_argument('--targets', type=int, default=400)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for num_strains in args.strains:
+        bench(num_strains, args.targets, args.requests, args.clients, args.seed)
@@ -0,0 +1,93 @@
+''' Benchmark building the SQLite database (straindb.sqlite_db) and running example_queries.sql on it
+
+On synthetic CSVs (straindb.synthetic), filtered and normalized, build_sqlite_db is timed and
+compared with the SQL path of bench_db_tables.py (staging tables loaded into SQLite, then
+4_load_db_tables_set_based.sql): every table must hold the same rows, and each example query
+must return the same strains from both databases. Query values are the most used names of the
+synthetic data (the names of example_queries.sql do not occur in it): the three plasmids in most
+strains, the gene and the two alleles in most alleleset rows.
+
+Usage: python3 benchmarks/bench_sqlite_db.py [--strains 10000 100000] [--seed 0] [--repeat 20]
+'''
+
+import argparse, statistics, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from bench_db_tables import database, dump, first_use_strain_order, set_based_statements
+from straindb.filter_csv import filter_all
+from straindb.load import load_all
+from straindb.normalize_csv import normalize_all
+from straindb.sql_scripts import example_queries
+from straindb.sqlite_db import build_sqlite_db, connect_sqlite
+from straindb.synthetic import synthetic_config
+
+
+def most_used(connection, table, column, id_column, limit):  # names of table with the most rows of column referencing them, as SQL literals
+    rows = connection.execute(f'select t.name from {table} t join (select {column}, count(*) as n from {id_column} group by {column})'
+                              f' u on u.{column} = t.id order by u.n desc, t.id limit {limit}').fetchall()
+    return [f"'{name}'" for (name,) in rows]
+
+
+def query_values(connection):  # user variable -> SQL literal, for example_queries
+    (plasmid_x, plasmid_y, plasmid_z) = most_used(connection, 'plasmid', 'plasmid_id', 'strain_plasmid', 3)
+    (allele_x, allele_y) = most_used(connection, 'allele', 'allele_id', 'alleleset_allele', 2)
+    (gene,) = most_used(connection, 'gene', 'gene_id', 'allele a join alleleset_allele aa on aa.allele_id = a.id', 1)
+    return {'@plasmidX': plasmid_x, '@plasmidY': plasmid_y, '@plasmidZ': plasmid_z,
+            '@gene': gene, '@alleleX': allele_x, '@alleleY': allele_y}
+
+
+def run_query(connection, statements, repeat):  # median seconds and sorted rows of the last statement
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = connection.execute(statements[-1]).fetchall()
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds), sorted(rows)
+
+
+def bench(num_strains, seed, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = synthetic_config(tmp, num_strains, seed, validate_references=False)
+        with redirect_stdout(StringIO()):
+            filter_all(config)
+            normalize_all(config)
+
+            start = time.perf_counter()
+            sql = database(Path(tmp) / 'sql.db')
+            load_all(config, sql)
+            first_use_strain_order(sql)
+            for statement in set_based_statements():
+                sql.execute(statement)
+            sql.commit()
+            sql.execute('analyze')
+            sql_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            build_sqlite_db(config)
+            build_seconds = time.perf_counter() - start
+
+        connection = connect_sqlite(config)
+        expected, actual = dump(sql), dump(connection)
+        for table in expected:
+            assert actual[table] == expected[table], f'{table}: rows differ'
+
+        print(f'{num_strains} strains: {config.sqlite_database.stat().st_size/2**20:.1f} MB database')
+        print(f'  build: staging tables + set-based etl {sql_seconds:6.2f} s, build_sqlite_db {build_seconds:6.2f} s')
+        print(f"  {'query':<60} {'rows':>6} {'etl db ms':>10} {'sqlite ms':>10}")
+        for title, statements in example_queries(sqlite=True, values=query_values(connection)).items():
+            (sql_query_seconds, rows), (query_seconds, rows_sqlite) = run_query(sql, statements, repeat), run_query(connection, statements, repeat)
+            assert rows == rows_sqlite, f'{title}: results differ'
+            print(f'  {title[:60]:<60} {len(rows):>6} {sql_query_seconds*1000:>10.2f} {query_seconds*1000:>10.2f}')
+        connection.close()
+        sql.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--strains', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    for num_strains in args.strains:
+        bench(num_strains, args.seed, args.repeat)
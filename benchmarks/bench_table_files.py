@@ -0,0 +1,79 @@
+''' Benchmark reading stage outputs from CSV files and from table files (.col)
+
+Runs filter_all and normalize_all with table_files on the raw CSVs of config.yaml (our CHB
+exports, or synthetic CSVs with --synthetic), then times reading the files the loader reads (read_rows of each staging table),
+and the normalize stage, from the CSV files and from the table files. Checks that both give
+the same rows and normalize outputs. Outputs go to a temporary directory.
+
+Usage: python3 benchmarks/bench_table_files.py [--config config.yaml | --synthetic STRAINS] [--repeat 3]
+'''
+
+import argparse, copy, statistics, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from straindb.config import load_config
+from straindb.filter_csv import filter_all
+from straindb.load import read_rows, staging_files
+from straindb.normalize_csv import normalize_all, normalize_allele, normalize_strain
+from straindb.synthetic import synthetic_config
+from straindb.table_file import table_path
+
+
+def timed(f, repeat):  # median seconds of f(), and its last result
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds), result
+
+
+def as_loaded(rows):  # rows as the loader inserts them (line numbers are ints in table files, strings in CSV files)
+    return [[str(x) if type(x) is int else x for x in r] for r in rows]
+
+
+def normalize(config, table_files):  # normalize outputs read from the CSV files or from the table files
+    config = copy.copy(config)
+    config.table_files = table_files
+    with redirect_stdout(StringIO()):
+        normalize_strain(config)
+        normalize_allele(config)
+    return {name: (config.normalize_dir / name).read_bytes() for name in ('strain_allele.csv', 'allele.csv')}
+
+
+def bench(config, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = copy.copy(config)
+        config.output_directory = Path(tmp)
+        config.table_files = True
+        with redirect_stdout(StringIO()):
+            filter_all(config)
+            normalize_all(config)
+
+        print(f"Raw CSVs: {', '.join(str(p) for p in config.rawCSV.values())}")
+        print(f"  {'':<32} {'rows':>8} {'csv s':>8} {'col s':>8} {'speedup':>8} {'csv MB':>8} {'col MB':>8}")
+        for table, (csvfile, _) in staging_files(config).items():
+            csv_seconds, csv_rows = timed(lambda: list(read_rows(csvfile)), repeat)
+            col_seconds, col_rows = timed(lambda: list(read_rows(table_path(csvfile))), repeat)
+            assert as_loaded(col_rows) == csv_rows, f'{table}: rows differ'
+            print(f'  read_rows {table:<22} {len(csv_rows):>8} {csv_seconds:>8.3f} {col_seconds:>8.3f} '
+                  f'{csv_seconds/col_seconds:>8.2f} {csvfile.stat().st_size/2**20:>8.1f} {table_path(csvfile).stat().st_size/2**20:>8.1f}')
+
+        csv_seconds, csv_outputs = timed(lambda: normalize(config, False), repeat)
+        col_seconds, col_outputs = timed(lambda: normalize(config, True), repeat)
+        assert csv_outputs == col_outputs, 'normalize outputs differ'
+        print(f"  {'normalize strain, allele':<32} {'':>8} {csv_seconds:>8.3f} {col_seconds:>8.3f} {csv_seconds/col_seconds:>8.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', help='path to config.yaml (default: straindb/config.yaml)')
+    parser.add_argument('--synthetic', type=int, metavar='STRAINS', help='run on synthetic CSVs of this many strains instead')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as tmp:
+            bench(synthetic_config(tmp, args.synthetic), args.repeat)
+    else:
+        bench(load_config(args.config), args.repeat)
@@ -3,5 +3,9 @@ from setuptools import setup, find_packages
 setup(
     name='straindb',
     version='1.0',
-    install_requires=['mysql-connector-python', 'pyyaml', 'python-dateutil']
+    packages=find_packages(exclude=['tests', 'tests.*']),
+    package_data={'straindb': ['sql/*.sql']},
+    python_requires='>=3.8',
+    install_requires=['mysql-connector-python', 'pyyaml', 'python-dateutil'],
+    entry_points={'console_scripts': ['straindb=straindb.cli:main']}
 )
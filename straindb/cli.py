@@ -0,0 +1,118 @@
+''' Command line entry point: straindb [--config PATH] {filter,normalize,validate,run,load,tables,load-tables,sqlite,sync,load-delta,query,search,serve} '''
+
+import argparse
+from straindb import instrument
+from straindb.config import load_config
+from straindb.db_tables import load_db_tables, write_db_tables
+from straindb.filter_csv import filter_all
+from straindb.normalize_csv import normalize_all
+from straindb.load import load_all
+from straindb.incremental import load_delta, sync
+from straindb.instrument import Profiler
+from straindb.query import StrainIndex
+from straindb.search import SearchIndex
+from straindb.service import run_service
+from straindb.sqlite_db import build_sqlite_db
+from straindb.validate_references import validate_references
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='straindb', description='Filter and normalize CHB strain, allele and plasmid CSV files')
+    parser.add_argument('--config', help='path to config.yaml (default: straindb/config.yaml)')
+    parser.add_argument('--combined', action='store_true', default=None,
+                        help='write normalize/strain_allele.csv directly from the filter stage (overrides config)')
+    parser.add_argument('--no-strain-csv', dest='write_strain_csv', action='store_false', default=None,
+                        help='in combined mode, do not write filter/strain.csv (overrides config)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes used to parse strain genotypes (overrides config)')
+    parser.add_argument('--parallel-tables', action='store_true', default=None,
+                        help='filter the strain, allele and plasmid tables in separate processes (overrides config)')
+    parser.add_argument('--columnar', action='store_true', default=None,
+                        help='validate raw rows in batches, a column at a time (overrides config)')
+    parser.add_argument('--table-files', action='store_true', default=None,
+                        help='also write outputs as binary columnar .col tables, read by later stages and the loader (overrides config)')
+    parser.add_argument('--profile', action='store_true', default=None,
+                        help='write output_directory/profile/report.json of step times, rows/sec, peak RSS and cache hit rates (overrides config)')
+    parser.add_argument('--cprofile', action='store_true', default=None,
+                        help='as --profile, also dumping cProfile stats of each step to output_directory/profile (overrides config)')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='rows per insert batch when loading staging tables (overrides config)')
+    parser.add_argument('--no-load', dest='load', action='store_false',
+                        help='with sync, write the delta outputs without loading them (load-delta loads them later)')
+    parser.add_argument('command', choices=['filter', 'normalize', 'validate', 'run', 'load', 'tables', 'load-tables', 'sqlite', 'sync', 'load-delta', 'query', 'search', 'serve'],
+                        help='filter raw CSVs, normalize filtered CSVs, check allele and plasmid references of normalize outputs, '
+                             'run filter and normalize, load outputs into the staging tables, '
+                             'write the database tables with ids assigned to db_tables/, load them into the tables of script 3, '
+                             'build them into a SQLite database file, '
+                             'incrementally filter, normalize and load rows changed since the last sync, '
+                             'load the delta of a sync --no-load, '
+                             'print strains matching a query of the normalize outputs, '
+                             'print strains with a name, expanded name or genotype containing the search text, '
+                             'or serve lookups and queries of the database tables over HTTP/JSON')
+    parser.add_argument('expression', nargs='*',
+                        help='with query, e.g. "plasmid:pCY118 and plasmid:pCY168 and not plasmid:pCY155" '
+                             '(fields: plasmid, allele, gene, chromosome); with search, e.g. "Is53"')
+    parser.add_argument('--fuzzy', type=int, default=None, metavar='N',
+                        help='with search, print strains with a name within N edits of the search text instead')
+    parser.add_argument('--port', type=int, default=None,
+                        help='with serve, port to listen on (overrides config)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+    if args.combined is not None: config.combined_filter_normalize = args.combined
+    if args.write_strain_csv is not None: config.write_strain_csv = args.write_strain_csv
+    if args.workers is not None: config.workers = args.workers
+    if args.parallel_tables is not None: config.parallel_tables = args.parallel_tables
+    if args.columnar is not None: config.columnar = args.columnar
+    if args.table_files is not None: config.table_files = args.table_files
+    if args.batch_size is not None: config.load_batch_size = args.batch_size
+    if args.profile is not None: config.profile = args.profile
+    if args.cprofile is not None: config.cprofile = args.cprofile
+
+    with Profiler.from_config(config, args.command):
+        run_command(config, args)
+
+
+def run_command(config, args):
+    if args.command in ('filter', 'run'):
+        filter_all(config)
+    if args.command in ('normalize', 'run'):
+        normalize_all(config)
+    if args.command == 'validate':
+        with instrument.step('validate_references'):
+            validate_references(config)
+    if args.command == 'load':
+        load_all(config)
+    if args.command == 'tables':
+        with instrument.step('db_tables'):
+            write_db_tables(config)
+    if args.command == 'load-tables':
+        load_db_tables(config)
+    if args.command == 'sqlite':
+        with instrument.step('sqlite'):
+            build_sqlite_db(config)
+    if args.command == 'sync':
+        sync(config, load=args.load)
+    if args.command == 'load-delta':
+        load_delta(config)
+    if args.command == 'query':
+        with instrument.step('query'):
+            names = StrainIndex.from_config(config).query(' '.join(args.expression))
+        for name in names:
+            print(name)
+    if args.command == 'search':
+        with instrument.step('search'):
+            index = SearchIndex.from_config(config)
+            text = ' '.join(args.expression)
+            ids = index.substring(text) if args.fuzzy is None else index.fuzzy(text, args.fuzzy)
+        for name in index.names(ids):
+            print(name)
+    if args.command == 'serve':
+        run_service(config, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,107 @@
 ''' Parse YAML config file '''
 
 import yaml
+from collections import OrderedDict
 from pathlib import Path
 
-# Read config file
-config_filepath = Path(__file__).parent.joinpath('config.yaml')
-with open(config_filepath) as f:
-    config = yaml.load(f, Loader=yaml.Loader)
+default_config_filepath = Path(__file__).parent.joinpath('config.yaml')
 
-rawCSV = {}
-rawCSV['allele']  = Path(config['raw_csv']['allele'])
-rawCSV['plasmid'] = Path(config['raw_csv']['plasmid'])
-rawCSV['strain']  = Path(config['raw_csv']['strain'])
-              
-output_directory = Path(config['output_directory'])
 
+class Config:  # pipeline settings, usually read from config.yaml by load_config()
+
+    def __init__(self, settings):  # settings is a dict with the layout of config.yaml.template
+        self.settings = settings
+
+        self.rawCSV = OrderedDict()
+        self.rawCSV['allele']  = Path(settings['raw_csv']['allele'])
+        self.rawCSV['plasmid'] = Path(settings['raw_csv']['plasmid'])
+        self.rawCSV['strain']  = Path(settings['raw_csv']['strain'])
+
+        self.output_directory = Path(settings['output_directory'])
+
+        # Optional: filter stage passes parsed genotypes straight to strain_allele flattening
+        self.combined_filter_normalize = settings.get('combined_filter_normalize', False)
+        self.write_strain_csv = settings.get('write_strain_csv', True)  # strain.csv is only needed by the normalize stage outside combined mode
+
+        self.workers = settings.get('workers', 1)  # processes used to parse genotypes in the filter stage
+        self.parallel_tables = settings.get('parallel_tables', False)  # filter strain, allele and plasmid tables in separate processes
+        self.columnar = settings.get('columnar', False)  # filter stage validates raw rows in batches, a column at a time
+        self.table_files = settings.get('table_files', False)  # stages also write binary columnar tables (.col), which later stages and the loader read
+
+        # Optional: instrumentation (straindb.instrument), written to output_directory/profile
+        self.profile = settings.get('profile', False)    # write report.json of per-step times, rows/sec, peak RSS and cache hit rates
+        self.cprofile = settings.get('cprofile', False)  # also dump cProfile stats of each step (implies profile)
+
+        self.validate_references = settings.get('validate_references', True)  # normalize stage writes validate/strain_allele.csv without strains the ETL would roll back
+        self.write_index = settings.get('write_index', True)  # normalize stage writes normalize/strain_index.bin for straindb.query
+        self.write_search_index = settings.get('write_search_index', True)  # normalize stage writes normalize/search_index.bin for straindb.search
+        self.write_db_tables = settings.get('write_db_tables', False)  # normalize stage writes db_tables/, the database tables with ids assigned (straindb.db_tables)
+
+        # Optional: embedded SQLite database of the tables of 3_create_db_tables.sql (straindb.sqlite_db)
+        self.write_sqlite = settings.get('write_sqlite', False)  # normalize stage builds the SQLite database
+
+        # Optional: staging table loader (straindb.load)
+        self.mysql = settings.get('mysql', {})  # keyword arguments of mysql.connector.connect
+        self.load_batch_size = settings.get('load_batch_size', 5000)  # rows per executemany call
+
+        # Optional: read-only lookup service (straindb.service)
+        self.service_backend = settings.get('service_backend', 'sqlite')  # database read: sqlite (sqlite_database) or mysql (the mysql section)
+        self.service_host = settings.get('service_host', '127.0.0.1')
+        self.service_port = settings.get('service_port', 8765)
+        self.service_pool_size = settings.get('service_pool_size', 4)  # connections, and so queries run at once
+        self.service_cache_size = settings.get('service_cache_size', 10000)  # responses kept until the load generation changes
+        self.service_check_seconds = settings.get('service_check_seconds', 1.0)  # how often the load generation is read
+
+    @property
+    def filter_dir(self):
+        return self.output_directory / 'filter'
+
+    @property
+    def filter_errdir(self):
+        return self.output_directory / 'filter_errorlog'
+
+    @property
+    def normalize_dir(self):
+        return self.output_directory / 'normalize'
+
+    @property
+    def validate_dir(self):
+        return self.output_directory / 'validate'
+
+    @property
+    def validate_errdir(self):
+        return self.output_directory / 'validate_errorlog'
+
+    @property
+    def db_tables_dir(self):
+        return self.output_directory / 'db_tables'
+
+    @property
+    def profile_dir(self):
+        return self.output_directory / 'profile'
+
+    @property
+    def sqlite_database(self):  # sqlite_database of the settings, or output_directory/straindb.sqlite
+        path = self.settings.get('sqlite_database')
+        return Path(path) if path else self.output_directory / 'straindb.sqlite'
+
+
+def load_config(config_filepath=None):  # read config file (default: straindb/config.yaml)
+    config_filepath = Path(config_filepath) if config_filepath else default_config_filepath
+    with open(config_filepath) as f:
+        return Config(yaml.load(f, Loader=yaml.Loader))
+
+
+_default_config = None
+
+def default_config():  # straindb/config.yaml, read on first use
+    global _default_config
+    if _default_config is None:
+        _default_config = load_config()
+    return _default_config
+
+
+def __getattr__(name):  # module attributes of earlier versions (e.g., config.rawCSV), read lazily from straindb/config.yaml
+    if name in ('rawCSV', 'output_directory', 'combined_filter_normalize', 'write_strain_csv'):
+        return getattr(default_config(), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
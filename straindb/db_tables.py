@@ -0,0 +1,303 @@
+''' Assign database ids in Python and write the database tables as bulk load files (replaces script 4)
+
+4_load_db_tables.sql looks up each id with a query per row (select @strain_id := id from
+strain where name = ...), as it does for gene, allele, alleleset and plasmid ids. This stage
+assigns the ids with dictionaries from names to ids instead, in the order
+4_load_db_tables_set_based.sql assigns them, and writes each table of 3_create_db_tables.sql,
+ids included, to db_tables/<table>.csv: strain, gene, allele, alleleset, plasmid,
+allele_plasmid, alleleset_allele, and the materialized strain_plasmid and strain_view. Strains
+with an unresolved allele or plasmid reference are excluded (see validate_references), and the
+error tables of script 4 are written to db_tables/ too.
+
+db_tables/load_db_tables.sql loads all of them with one LOAD DATA per table and foreign key
+checks off, bumps the load generation (see straindb.service), then checks each foreign key
+once. Run it after script 3, instead of scripts 2 and 4 (no staging tables are needed).
+load_db_tables() does the same over a DB-API connection (for MySQL, set allow_local_infile:
+true in the mysql section of config.yaml).
+
+Strain ids follow the order strains first appear in strain_allele.csv. (Script 2 loads
+staging_strain with select distinct, whose order depends on the query plan: through the
+strain_name index, MySQL and SQLite return names in sorted order.) strain_view lists names
+in alleleset, allele and plasmid order, without the group_concat_max_len truncation of
+script 4.
+'''
+
+import sqlite3
+from collections import OrderedDict
+from straindb import instrument
+from straindb.config import load_config
+from straindb.fileio import get_writer, mkparent
+from straindb.load import StagingLoader, connect, null_to_none, read_rows
+from straindb.pipeline import Pipeline, ReadCSV, ReadTable, WRITE_BUFFER_SIZE
+from straindb.table_file import input_file
+from straindb.validate_references import References, ReferenceErrors, ValidateReferences, error_tables
+
+# Tables of 3_create_db_tables.sql, in load order, with their columns
+db_tables = OrderedDict([
+    ('strain', ['id', 'name', 'other_names', 'source', 'comment']),
+    ('gene', ['id', 'name']),
+    ('allele', ['id', 'name', 'allele_type', 'gene_id', 'comment']),
+    ('alleleset', ['id', 'alleleset_binaryid', 'strain_id', 'chromosome_name']),
+    ('plasmid', ['id', 'name', 'expanded_name', 'source', 'parent1', 'parent2', 'restriction_site', 'date']),
+    ('allele_plasmid', ['allele_id', 'plasmid_id']),
+    ('alleleset_allele', ['alleleset_id', 'allele_id', 'heterozygous']),
+    ('strain_plasmid', ['plasmid_id', 'strain_id']),
+    ('strain_view', ['strain_id', 'strain_name', 'allele_names', 'chromosome_names', 'plasmids', 'plasmid_expanded_names',
+                     'gene_names', 'strain_source']),
+])
+
+# Foreign keys of 3_create_db_tables.sql: (table, column, referenced table)
+foreign_keys = [
+    ('alleleset', 'strain_id', 'strain'),
+    ('allele_plasmid', 'allele_id', 'allele'),
+    ('allele_plasmid', 'plasmid_id', 'plasmid'),
+    ('alleleset_allele', 'alleleset_id', 'alleleset'),
+    ('alleleset_allele', 'allele_id', 'allele'),
+    ('strain_plasmid', 'strain_id', 'strain'),
+    ('strain_plasmid', 'plasmid_id', 'plasmid'),
+    ('strain_view', 'strain_id', 'strain'),
+]
+
+
+class ForeignKeyError(Exception):  # loaded rows reference ids missing from the referenced table
+    pass
+
+
+class AssignIds:  # sink stage for validated strain_allele rows: assign strain, gene, allele, alleleset and plasmid ids as they are first used
+
+    def __init__(self, references, plasmid_rows):  # references of the normalize outputs; plasmid_rows: plasmid.csv rows, with None for NULL
+        self.references = references
+        self.plasmid_rows = OrderedDict()
+        for r in plasmid_rows:
+            self.plasmid_rows.setdefault(r[1], r)
+
+        self.tables = OrderedDict((table, []) for table in db_tables)
+        self.strain_ids = OrderedDict()     # name -> id
+        self.gene_ids = OrderedDict()
+        self.allele_ids = OrderedDict()
+        self.plasmid_ids = OrderedDict()
+        self.alleleset_ids = OrderedDict()  # (strain id, alleleset_binaryid, chromosome) -> id
+        self.allele_plasmids = {}           # allele id -> plasmid ids
+        self.strain_alleles = OrderedDict() # strain id -> [(alleleset id, allele id)] in row order
+
+    def __call__(self, records):  # rows are kept as tuples, which the garbage collector stops tracking
+        for rec in records:
+            if not rec.failed:
+                self.add(null_to_none(rec.raw))
+            yield rec
+        self.add_strain_tables()
+
+    def add(self, r):  # one strain_allele row of a loaded strain
+        (_, strain_name, chromosome, alleleset_binaryid, allele_name, gene_name, heterozygous, other_names, source, comment) = r
+
+        strain_id = self.strain_ids.get(strain_name)
+        if strain_id is None:  # attributes come from the strain's first row
+            strain_id = self.strain_ids[strain_name] = len(self.strain_ids) + 1
+            self.tables['strain'].append((strain_id, strain_name, other_names, source, comment))
+            self.strain_alleles[strain_id] = []
+        if allele_name is None:
+            return
+
+        key = (strain_id, alleleset_binaryid, chromosome)
+        alleleset_id = self.alleleset_ids.get(key)
+        if alleleset_id is None:
+            alleleset_id = self.alleleset_ids[key] = len(self.alleleset_ids) + 1
+            self.tables['alleleset'].append((alleleset_id, alleleset_binaryid, strain_id, chromosome))
+
+        allele_id = self.allele_ids.get(allele_name)
+        if allele_id is None:
+            allele_id = self.add_allele(allele_name, gene_name)
+        self.tables['alleleset_allele'].append((alleleset_id, allele_id, heterozygous))
+        self.strain_alleles[strain_id].append((alleleset_id, allele_id))
+
+    def add_allele(self, allele_name, gene_name):  # add an allele at its first use, with its gene and plasmids; return its id
+        (_, _, allele_type, first_gene_name, _, comment) = self.references.first_allele[allele_name]
+        if gene_name is None:
+            gene_name = first_gene_name
+        gene_id = None
+        if gene_name is not None:
+            gene_id = self.gene_ids.get(gene_name)
+            if gene_id is None:
+                gene_id = self.gene_ids[gene_name] = len(self.gene_ids) + 1
+                self.tables['gene'].append((gene_id, gene_name))
+
+        allele_id = self.allele_ids[allele_name] = len(self.allele_ids) + 1
+        self.tables['allele'].append((allele_id, allele_name, allele_type, gene_id, comment))
+
+        plasmid_ids = self.allele_plasmids[allele_id] = []
+        for plasmid_name in self.references.allele_plasmids[allele_name]:  # in allele.csv order
+            plasmid_id = self.plasmid_ids.get(plasmid_name)
+            if plasmid_id is None:
+                plasmid_id = self.plasmid_ids[plasmid_name] = len(self.plasmid_ids) + 1
+                self.tables['plasmid'].append((plasmid_id,) + tuple(self.plasmid_rows[plasmid_name][1:]))
+            if plasmid_id not in plasmid_ids:
+                plasmid_ids.append(plasmid_id)
+                self.tables['allele_plasmid'].append((allele_id, plasmid_id))
+        return allele_id
+
+    def add_strain_tables(self):  # strain_plasmid and strain_view rows, as refresh_strain computes them
+        strains = self.tables['strain']
+        allelesets = self.tables['alleleset']
+        alleles = self.tables['allele']
+        genes = self.tables['gene']
+        plasmids = self.tables['plasmid']
+        for (strain_id, strain_name, _, source, _) in strains:
+            names = [[] for _ in range(5)]  # allele, chromosome, plasmid, expanded and gene names of the view's joined rows
+            strain_plasmids = []
+            for (alleleset_id, allele_id) in self.strain_alleles[strain_id]:
+                (_, allele_name, _, gene_id, _) = alleles[allele_id - 1]
+                chromosome = allelesets[alleleset_id - 1][3]
+                gene_name = genes[gene_id - 1][1] if gene_id is not None else None
+                for plasmid_id in self.allele_plasmids[allele_id] or [None]:  # left join: one row for an allele without plasmids
+                    plasmid = plasmids[plasmid_id - 1] if plasmid_id is not None else (None,)*3
+                    for values, value in zip(names, (allele_name, chromosome, plasmid[1], plasmid[2], gene_name)):
+                        if value is not None:
+                            values.append(value)
+                    if plasmid_id is not None and plasmid_id not in strain_plasmids:
+                        strain_plasmids.append(plasmid_id)
+            self.tables['strain_plasmid'].extend((plasmid_id, strain_id) for plasmid_id in strain_plasmids)
+            self.tables['strain_view'].append((strain_id, strain_name) + tuple(', '.join(v) if v else None for v in names) + (source,))
+
+
+def write_table(csvfile, header, rows):  # CSV in the format of the other outputs, with NULL for None
+    mkparent(csvfile)
+    with open(csvfile, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+        writer = get_writer(f)
+        writer.writerow(header)
+        writer.writerows(r if None not in r else ['NULL' if x is None else x for x in r] for r in rows)
+
+
+def table_files(config):  # table -> CSV file, for the database tables and then the error tables
+    return OrderedDict((table, config.db_tables_dir / f'{table}.csv') for table in list(db_tables) + list(error_tables))
+
+
+def error_table_statements(table):  # drop and create statements of an error table of script 4
+    columns = [f"{c} {'int' if c.endswith('line_number') else 'varchar(100)'}" for c in error_tables[table]]
+    return [f'drop table if exists {table}', f"create table {table} ({', '.join(columns)})"]
+
+
+def generation_statements(sqlite=False):  # create the load_generation table of script 3 and its row, unless they exist
+    return ['create table if not exists load_generation (id int primary key, generation int not null, loaded_at datetime default null)',
+            f"insert {'or ignore' if sqlite else 'ignore'} into load_generation (id, generation) values (1, 0)"]
+
+
+def bump_generation_statement(sqlite=False):  # count a load of the database tables (see straindb.service)
+    now = "datetime('now')" if sqlite else 'now()'
+    return f'update load_generation set generation = generation + 1, loaded_at = {now} where id = 1'
+
+
+def load_data_statement(table, csvfile):  # LOAD DATA of a CSV written by write_table (as in 2_load_staging_tables.sql)
+    path = str(csvfile.resolve()).replace('\\', '\\\\').replace("'", "\\'")
+    columns = db_tables.get(table) or error_tables[table]
+    return (f"load data local infile '{path}' into table {table}"
+            f" fields terminated by ',' optionally enclosed by '\"' escaped by '\"' lines terminated by '\\r\\n'"
+            f" ignore 1 lines ({', '.join(columns)})")
+
+
+def foreign_key_check(table, column, referenced):  # query of the number of rows of table whose column references no row of the referenced table
+    return (f"select '{table}.{column}' as foreign_key, count(*) as missing from {table} t left join {referenced} r on r.id = t.{column}"
+            f' where t.{column} is not null and r.id is null')
+
+
+def write_load_script(config):  # write db_tables/load_db_tables.sql
+    lines = ['-- Generated by straindb.db_tables: load the database tables from the files of this directory.',
+             '-- Run after 3_create_db_tables.sql, instead of 2_load_staging_tables.sql and 4_load_db_tables.sql.',
+             '',
+             'set global local_infile = 1;',
+             'set foreign_key_checks = 0;',
+             'set unique_checks = 0;']
+    lines += [f'{s};' for s in generation_statements()]
+    for table in error_tables:  # DDL commits implicitly in MySQL, so it must come before the transaction
+        lines += [f'{s};' for s in error_table_statements(table)]
+    lines += ['start transaction;',
+              '']
+    for table, csvfile in table_files(config).items():
+        lines += [f'{load_data_statement(table, csvfile)};', '']
+    lines += [f'{bump_generation_statement()};',
+              'commit;',
+              'set unique_checks = 1;',
+              'set foreign_key_checks = 1;',
+              '',
+              '-- Foreign keys, checked once: every count must be 0']
+    lines += ['\nunion all\n'.join(foreign_key_check(*fk) for fk in foreign_keys) + ';']
+    script = config.db_tables_dir / 'load_db_tables.sql'
+    mkparent(script)
+    script.write_text('\n'.join(lines) + '\n')
+    return script
+
+
+def assign_db_ids(config):  # AssignIds holding the rows of the database tables, after writing the error tables to db_tables/
+    strain_allele = input_file(config, config.normalize_dir / 'strain_allele.csv')
+    references = References.from_config(config)
+    assign = AssignIds(references, read_rows(input_file(config, config.filter_dir / 'plasmid.csv')))
+    validate = ValidateReferences(references, ReferenceErrors(config.db_tables_dir))
+    with validate.errors:
+        Pipeline(ReadTable(strain_allele) if config.table_files else ReadCSV(strain_allele), validate, assign).run()
+    return assign
+
+
+def write_db_tables(config):  # write the database tables, error tables and load script to db_tables/
+    assign = assign_db_ids(config)
+    files = table_files(config)
+    for table, header in db_tables.items():
+        write_table(files[table], header, assign.tables[table])
+    write_load_script(config)
+
+    print(f'\nDATABASE TABLES:')
+    for table in db_tables:
+        print(f'  {table}: {len(assign.tables[table])} rows')
+    return assign
+
+
+def execute(connection, statements):  # run statements that return no rows, and commit
+    cursor = connection.cursor()
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def check_foreign_keys(connection):  # raise ForeignKeyError if any foreign key of the database tables is violated
+    cursor = connection.cursor()
+    try:
+        violations = []
+        for (table, column, referenced) in foreign_keys:
+            cursor.execute(foreign_key_check(table, column, referenced))
+            (_, missing) = cursor.fetchone()
+            if missing:
+                violations.append(f'{table}.{column}: {missing} rows reference missing {referenced} ids')
+    finally:
+        cursor.close()
+    if violations:
+        raise ForeignKeyError('; '.join(violations))
+
+
+def load_db_tables(config, connection=None):  # load db_tables/ into the tables of script 3, connecting with config.mysql unless a connection is given
+    own_connection = connection is None
+    if own_connection:
+        connection = connect(config)
+    try:
+        with instrument.step('load_db_tables'):
+            bulk = not isinstance(connection, sqlite3.Connection)  # SQLite has no LOAD DATA: insert rows in batches instead
+            loader = StagingLoader(connection, config.load_batch_size)
+            execute(connection, ['set foreign_key_checks = 0'] if bulk else [])
+            for table in error_tables:
+                execute(connection, error_table_statements(table))
+            for table, csvfile in table_files(config).items():
+                if bulk:
+                    loader.execute(table, load_data_statement(table, csvfile))
+                else:
+                    loader.load_table(table, db_tables.get(table) or error_tables[table], read_rows(csvfile))
+            execute(connection, ['set foreign_key_checks = 1'] if bulk else [])
+            check_foreign_keys(connection)
+            execute(connection, generation_statements(sqlite=not bulk) + [bump_generation_statement(sqlite=not bulk)])
+            return loader.stats
+    finally:
+        if own_connection:
+            connection.close()
+
+
+if __name__ == '__main__':
+    write_db_tables(load_config())
@@ -0,0 +1,19 @@
+''' Hash index of names seen so far, used to detect duplicate rows in constant time '''
+
+
+class DuplicateIndex:  # maps each name to the line number on which it was first seen
+
+    def __init__(self):
+        self.first_seen = {}
+
+    def __len__(self):
+        return len(self.first_seen)
+
+    def __contains__(self, name):
+        return name in self.first_seen
+
+    def check(self, name, linenum):  # return line number of earlier occurrence of name, or None if name is new
+        first_linenum = self.first_seen.get(name)
+        if first_linenum is None:
+            self.first_seen[name] = linenum
+        return first_linenum
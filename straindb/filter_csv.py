@@ -1,371 +1,500 @@
 ''' Select rows and columns of strain, allele and plasmid CSV files, without altering table structure '''
 
-import csv, re
-from pathlib import Path
-from collections import OrderedDict
-from copy import copy
-import datetime, dateutil
-from dateutil.parser import parse
-from straindb.config import rawCSV, output_directory
-from straindb.parse_genotype import parse_genotype
-from straindb.fileio import get_reader, get_writer, read_header, write_header, mkparent
-from straindb.parse_allele import parse_allele
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from straindb.config import load_config
+from straindb import instrument
+from straindb.parse_genotype import default_parser, parse_genotype_compact
+from straindb.parse_allele import AlleleClassifier, parse_allele
+from straindb.parse_date import DateParser
+from straindb.duplicate_index import DuplicateIndex
+from straindb.pipeline import Pipeline, ReadCSV, ReadCSVBatches, ErrorLog, output_stages
+from straindb.strain_allele import strain_allele_header
+from straindb.normalize_csv import NormalizeStrain
+from straindb.table_file import table_path
 
 DEBUG = False
+debug_row_limit = 250  # rows read from each raw CSV when DEBUG is set
+columnar_batch_size = 2000  # rows per Batch in columnar mode (larger Batches keep more rows alive through garbage collections)
 
-outdir = output_directory / 'filter'
-errdir = output_directory / 'filter_errorlog'
-errstats_file = errdir / 'errstats.txt'
-
-        
-def err_item(fileroot, err_name):  #err_item is container for error file attributes
-    basename = fileroot + '.' + err_name + '.csv'  # name of error file
-    return (
-        OrderedDict(
-            [('file', errdir / basename),
-             ('err_count', 0),
-             ('writer', None)])
-    )
-
-
-def write_failure(err_item, row):
-    # Increment error count for this err_item
-    err_item['err_count'] += 1
-
-    # Write failing row to error file
-    err_item['writer'].writerow(row)
-
-
-def write_errfile_headers(raw_header, err):  #write a header line to all error files
-    err_header = copy(raw_header)
-    err_header.insert(0,'Original Line Number')
-    for err_item in err.values():
-        errfile = err_item['file']
-        mkparent(errfile)
-        write_header(errfile, err_header)
-
-        
-def initialize_errorlog(): # create errstats.txt and write initial log information
-    mkparent(errstats_file)
-    with open(errstats_file, 'w') as f:
+strain_header = ['strain_original_line_number', 'strain_name', 'genotype', 'source', 'other_names', 'comment']
+allele_header = ['allele_original_line_number', 'allele_name', 'allele_type', 'gene_name', 'plasmids', 'comment']
+plasmid_header = ['plasmid_original_line_number', 'name', 'expanded_name', 'source', 'parent1', 'parent2', 'restriction_site', 'date']
+
+strain_name_re   = re.compile(r'CHB[0-9]+')
+plasmid_name_re  = re.compile(r'p[a-zA-Z]+[0-9]+')
+genotype_char_re = re.compile(r'^[-+.\]\[)(a-zA-Z0-9\s/;]+$')
+
+
+def errstats_file(config):
+    return config.filter_errdir / 'errstats.txt'
+
+
+def writes_strain_table(config):  # strain.csv is optional in combined mode
+    return config.write_strain_csv or not config.combined_filter_normalize
+
+
+def output_files(config):  # list of files written by the filter stage
+    files = [config.filter_dir / 'strain.csv'] if writes_strain_table(config) else []
+    if config.combined_filter_normalize:
+        files += [config.normalize_dir / 'strain_allele.csv']
+    files += [config.filter_dir / 'allele.csv', config.filter_dir / 'plasmid.csv']
+    if config.table_files:
+        files += [table_path(f) for f in files]
+    return files
+
+
+def initialize_errorlog(config): # create errstats.txt and write initial log information
+    errstats_file(config).parent.mkdir(parents=True, exist_ok=True)
+    with open(errstats_file(config), 'w') as f:
         f.write('Script: \n  ' + __file__ + '\n\n')
-        f.write('Input files: \n  ' + '\n  '.join([str(x) for x in rawCSV.values()]) + '\n\n')
-        f.write('Output files: \n  ' + '\n  '.join(f'{outdir / x}.csv' for x in ['strain','allele','plasmid']) + '\n\n')
-        f.write('Error log directory: \n  ' + str(errdir) + '\n\n')
-        f.write('ERROR STATISTICS\n----------------\n')        
+        f.write('Input files: \n  ' + '\n  '.join([str(x) for x in config.rawCSV.values()]) + '\n\n')
+        f.write('Output files: \n  ' + '\n  '.join(str(x) for x in output_files(config)) + '\n\n')
+        f.write('Error log directory: \n  ' + str(config.filter_errdir) + '\n\n')
+        f.write('ERROR STATISTICS\n----------------\n')
+
+
+def write_errstats(config, errstats):  # print statistics and append them to error log
+    print('\n'.join(errstats))
+    with open(errstats_file(config), 'a') as f:
+        f.write('\n'.join(errstats) + '\n')
+
+
+def success_rate(num_successes, num_rows):  # percentage, truncated to an integer
+    return int(100*num_successes/num_rows) if num_rows else 100
+
+
+def read_raw(config, table):  # source stage for a raw CHB CSV file: Records, or Batches in columnar mode
+    limit = debug_row_limit if DEBUG else None
+    if config.columnar:
+        return ReadCSVBatches(config.rawCSV[table], columnar_batch_size, limit=limit)
+    return ReadCSV(config.rawCSV[table], limit=limit)
+
+
+def null_field(x):  # an empty field as NULL
+    return x if x != '' else 'NULL'
+
+
+def comment_field(x):  # an empty comment as NULL, newlines as spaces
+    return 'NULL' if x == '' else x.replace('\n', ' ')
+
+
+def null_column(column):
+    return list(map(null_field, column))
+
+
+def comment_column(column):
+    return list(map(comment_field, column))
+
+
+def valid_plasmid_name(name):  # False for invalid (or empty) names
+    return plasmid_name_re.match(name) is not None
+
+
+def valid_strain_name(name):  # False for invalid (or empty) names
+    return strain_name_re.match(name) is not None
+
+
+def logged(rec, batch):  # rec, with the raw fields written to error files (Records of a Batch get them on demand)
+    return batch.with_raw(rec) if batch is not None else rec
+
+
+class ValidatePlasmid:  # validate stage for raw plasmid rows; check() holds the rules, which ColumnarValidatePlasmid applies to Batches
+
+    def __init__(self, err, plasmid_names=None):
+        self.err = err
+        self.plasmid_names = plasmid_names if plasmid_names is not None else DuplicateIndex()
+        self.dates = DateParser()
+        self.num_successes = 0
 
+    def __call__(self, records):
+        for rec in records:
+            r = rec.raw
+            yield self.check(rec, None, r[2], r[5], valid_plasmid_name(r[5]), self.parse_date(r[6]),
+                             null_field(r[13]), null_field(r[7]), null_field(r[8]), null_field(r[9]))
 
-def write_plasmids():  # Write valid plasmids to plasmid.csv and invalid plasmids to error files
+    def parse_date(self, date):  # allow date to be empty (NULL); None for an invalid date
+        return self.dates.parse(date) if date != '' else 'NULL'
+
+    def check(self, rec, batch, expanded_name, plasmid_name, valid_name, date, source, parent1, parent2, restriction_site):  # fields of one row (batch: its Batch, in columnar mode)
+        err = self.err
+
+        # Check error conditions
+        if not valid_name:
+
+            err.fail('invalid_plasmid_name', logged(rec, batch))
+
+        elif (first_linenum := self.plasmid_names.check(plasmid_name, rec.linenum)) is not None:
+
+            err.fail('duplicate_plasmid', logged(rec, batch), [first_linenum])
+
+        if date is None:  # an invalid date is logged and loaded as NULL, without rejecting the row
+
+            err.fail('invalid_date', logged(rec, batch), reject=False)
+            date = 'NULL'
+
+        if expanded_name == '':
+
+            err.fail('invalid_expanded_name', logged(rec, batch))
+
+        if not rec.failed: # success! set clean plasmid table row
+            rec.row = [rec.linenum, plasmid_name, expanded_name, source, parent1, parent2, restriction_site, date]
+            self.num_successes += 1
+
+        return rec
+
+
+class ColumnarValidatePlasmid(ValidatePlasmid):  # ValidatePlasmid for Batches: names, dates and NULLs are handled a column at a time
+
+    def __call__(self, batches):
+        for batch in batches:
+            plasmid_names = batch.column(5)
+            columns = zip(batch.records(), batch.column(2), plasmid_names, map(valid_plasmid_name, plasmid_names),
+                          map(self.parse_date, batch.column(6)), null_column(batch.column(13)),
+                          null_column(batch.column(7)), null_column(batch.column(8)), null_column(batch.column(9)))
+
+            # Duplicates are checked, and errors logged, row by row in line order
+            for (rec, *fields) in columns:
+                yield self.check(rec, batch, *fields)
+
+
+def write_plasmids(config, source=None, log=True):  # Write valid plasmids to plasmid.csv and invalid plasmids to error files; return error statistics
+
+    plasmid_raw = source if source is not None else read_raw(config, 'plasmid')  # source must provide header and rows_read, like read_raw
 
-    raw_header = read_header(rawCSV['plasmid'])
-    
     # Define error files
-    err = OrderedDict()
-    err['duplicate_plasmid']     = err_item('plasmid', 'duplicate_plasmid')    
-    err['invalid_plasmid_name']  = err_item('plasmid', 'invalid_plasmid_name')
-    err['invalid_expanded_name'] = err_item('plasmid', 'invalid_expanded_name')
-    err['invalid_date']          = err_item('plasmid', 'invalid_date')    
-    
-    # Define and initialize plasmid table file
-    plasmid_outfile = outdir / 'plasmid.csv'
-    plasmid_header = ['plasmid_original_line_number', 'name', 'expanded_name', 'source', 'parent1', 'parent2', 'restriction_site', 'date']
-    write_header(plasmid_outfile, plasmid_header)    
-
-    # Initialize error files by writing header line to each file
-    write_errfile_headers(raw_header, err)    
-
-    #open all output files
-    with open(err['duplicate_plasmid']['file'], 'a')     as duplicate_plasmid_fout, \
-         open(err['invalid_plasmid_name']['file'], 'a')  as invalid_plasmid_name_fout, \
-         open(err['invalid_expanded_name']['file'], 'a') as invalid_expanded_name_fout, \
-         open(err['invalid_date']['file'], 'a')          as invalid_date_fout, \
-         open(rawCSV['plasmid'], 'r')                    as plasmid_raw_fin, \
-         open(plasmid_outfile, 'a')                      as plasmid_fout:
-
-        err['duplicate_plasmid']['writer']     = get_writer(duplicate_plasmid_fout)         
-        err['invalid_plasmid_name']['writer']  = get_writer(invalid_plasmid_name_fout)
-        err['invalid_expanded_name']['writer'] = get_writer(invalid_expanded_name_fout)
-        err['invalid_date']['writer']          = get_writer(invalid_date_fout)        
-
-        plasmid_raw   = get_reader(plasmid_raw_fin)
-        plasmid       = get_writer(plasmid_fout)
-
-        # Write valid rows to outfile and invalid rows to error log files        
-        num_successes = 0
-        next(plasmid_raw) # skip header line
-        linenum = 1
-        plasmid_names = []
-        for r in plasmid_raw: 
-            linenum += 1
-            r = [x.strip() for x in r]
-
-            expanded_name    = r[2]
-            plasmid_name     = r[5]
-            date             = r[6]
-            parent1          = r[7]
-            parent2          = r[8]
-            restriction_site = r[9]
-            source           = r[13]
-
-            # Check error conditions
-            failure = False
-            if plasmid_name == '' or not re.match(r'p[a-zA-Z]+[0-9]+', plasmid_name):
-
-                write_failure(err['invalid_plasmid_name'], [linenum] + r)
-                failure = True
-
-            elif plasmid_name in plasmid_names:
-
-                write_failure(err['duplicate_plasmid'], [linenum] + r)
-                failure = True
-
-            else:
-
-                plasmid_names.append(plasmid_name)
-                
-            if date == '':  # allow date to be empty
-
-                date = 'NULL'
-
-            else: # validate date 
-                try:
-                    dt = parse(date, fuzzy=True)
-                except dateutil.parser._parser.ParserError:
-                    write_failure(err['invalid_date'], [linenum] + r)                    
-                date = f'{dt.year}-{dt.month}-{dt.day}'
-                
-            if expanded_name == '':
-
-                write_failure(err['invalid_expanded_name'], [linenum] + r)
-                failure = True
-
-            if not failure: # success! write clean plasmid table row to output file
-                if parent1 == '': parent1 = 'NULL';
-                if parent2 == '': parent2 = 'NULL';
-                if restriction_site == '': restriction_site = 'NULL';
-                if source == '': source = 'NULL';                
-                plasmid.writerow([linenum, plasmid_name, expanded_name, source, parent1, parent2, restriction_site, date])
-                num_successes += 1
-                
-            if DEBUG and linenum > 250: break
-
-    num_raw_plasmids = linenum - 1 # subtract 1 for header line
+    err = ErrorLog(config.filter_errdir, 'plasmid', plasmid_raw.header)
+    err.add_duplicate('duplicate_plasmid')
+    err.add('invalid_plasmid_name')
+    err.add('invalid_expanded_name')
+    err.add('invalid_date')
+
+    validate = (ColumnarValidatePlasmid if config.columnar else ValidatePlasmid)(err)
+    with err:
+        Pipeline(plasmid_raw, validate, *output_stages(config, config.filter_dir / 'plasmid.csv', plasmid_header)).run()
+    dates = validate.dates
+    instrument.record_cache('date_memo', dates.memo_hits, dates.strict_hits + dates.fuzzy_parses)
+
+    num_raw_plasmids = plasmid_raw.rows_read
+    num_successes = validate.num_successes
     errstats = []
     errstats += [f'\nPLASMIDS:']
     errstats += [f'  Rows processed: {num_raw_plasmids}']
     errstats += [f'  Valid rows: {num_successes}']
-    errstats += [f"    Invalid plasmid_name: {err['invalid_plasmid_name']['err_count']}"]
-    errstats += [f"    Invalid expanded_name: {err['invalid_expanded_name']['err_count']}"]
-    errstats += [f'  Success Rate: {int(100*num_successes/num_raw_plasmids)}%']
-    
-    print('\n'.join(errstats))
-          
-    #write statistics to error log
-    with open(errstats_file, 'a') as f:
-        f.write('\n'.join(errstats) + '\n')
+    errstats += [f"    Invalid plasmid_name: {err.count('invalid_plasmid_name')}"]
+    errstats += [f"    Invalid expanded_name: {err.count('invalid_expanded_name')}"]
+    errstats += [f'  Success Rate: {success_rate(num_successes, num_raw_plasmids)}%']
+    errstats += [f'  Date fast-path hit rate: {int(100*dates.fast_path_rate())}% of {dates.num_parsed()} dates'
+                 f' ({dates.memo_hits} repeated, {dates.strict_hits} strict format, {dates.fuzzy_parses} fuzzy)']
+    if log:
+        write_errstats(config, errstats)
+    return errstats
+
+
+class ValidateAllele:  # validate stage for raw allele rows; check() holds the rules, which ColumnarValidateAllele applies to Batches
+
+    def __init__(self, err, allele_names=None):
+        self.err = err
+        self.allele_names = allele_names if allele_names is not None else DuplicateIndex()
+        self.num_successes = 0
+
+    def __call__(self, records):
+        for rec in records:
+            r = rec.raw
+            yield self.check(rec, None, parse_allele(r[2]), null_field(r[3]), r[8], comment_field(r[5]))
+
+    def check(self, rec, batch, parsed_name, gene_name, plasmids, comment):  # fields of one row, with parse_allele of its allele name
+        err = self.err
+        (allele_name, allele_type, allele_err_key) = parsed_name
+
+        # Check error conditions
+        if allele_err_key:
+
+            err.fail(allele_err_key, logged(rec, batch))
+
+        elif (first_linenum := self.allele_names.check(allele_name, rec.linenum)) is not None:
+
+            err.fail('duplicate_allele', logged(rec, batch), [first_linenum])
+
+        if not rec.failed: # success! set clean allele table row
+            rec.row = [rec.linenum, allele_name, allele_type, gene_name, plasmids, comment]
+            self.num_successes += 1
+
+        return rec
+
+
+class ColumnarValidateAllele(ValidateAllele):  # ValidateAllele for Batches: allele names and NULLs are handled a column at a time
 
-        
-def write_alleles():  # Write valid alleles to allele.csv and invalid alleles to error files
+    def __init__(self, err, allele_names=None):
+        super().__init__(err, allele_names)
+        self.classifier = AlleleClassifier()
+
+    def __call__(self, batches):
+        for batch in batches:
+            columns = zip(batch.records(), self.classifier.classify_many(batch.column(2)), null_column(batch.column(3)),
+                          batch.column(8), comment_column(batch.column(5)))
+            for (rec, *fields) in columns:
+                yield self.check(rec, batch, *fields)
+
+
+def write_alleles(config, source=None, log=True):  # Write valid alleles to allele.csv and invalid alleles to error files; return error statistics
+
+    allele_raw = source if source is not None else read_raw(config, 'allele')  # source must provide header and rows_read, like read_raw
 
-    raw_header = read_header(rawCSV['allele'])
-    
     # Define error files
-    err = OrderedDict()
-    err['duplicate_allele']    = err_item('allele', 'duplicate_allele')    
-    err['invalid_allele_name'] = err_item('allele', 'invalid_allele_name')
-    
-    # Initialize error files by writing header line
-    write_errfile_headers(raw_header, err)        
-
-    # Define and initialize allele table file
-    allele_outfile = outdir / 'allele.csv'
-    allele_header = ['allele_original_line_number', 'allele_name', 'allele_type', 'gene_name', 'plasmids', 'comment']
-    write_header(allele_outfile, allele_header)
-
-    #open all output files    
-    with open(err['duplicate_allele']['file'], 'a')     as duplicate_allele_fout, \
-         open(err['invalid_allele_name']['file'], 'a')  as invalid_allele_name_fout, \
-         open(rawCSV['allele'], 'r')                    as allele_raw_fin, \
-         open(allele_outfile, 'a')                      as allele_fout:
-
-        err['invalid_allele_name']['writer'] = get_writer(invalid_allele_name_fout)
-        err['duplicate_allele']['writer']    = get_writer(duplicate_allele_fout)        
-
-        allele_raw   = get_reader(allele_raw_fin)
-        allele = get_writer(allele_fout)
-
-        # Write valid rows to outfile and invalid rows to error log files        
-        num_successes = 0
-        next(allele_raw) # skip header line
-        linenum = 1
-        allele_names = []
-        for r in allele_raw:
-            linenum += 1
-            r = [x.strip() for x in r]
-
-            allele_name = r[2]
-            gene_name   = r[3]
-            comment     = r[5]
-            plasmids    = r[8]
-
-            # Parse allele_name
-            (allele_name, allele_type, allele_err_key) = parse_allele(allele_name)
-
-            # Check error conditions
-            failure = False
-            if allele_err_key:
-
-                write_failure(err[allele_err_key], [linenum] + r)
-                failure = True
-            
-            elif allele_name in allele_names:
-
-                write_failure(err['duplicate_allele'], [linenum] + r)
-                failure = True
-                
-            else:
-
-                allele_names.append(allele_name)
-
-            if not failure: # success! write clean allele data to output file
-
-                if gene_name == '': gene_name = 'NULL'
-
-                comment = 'NULL' if comment == '' else re.sub(r'\n', ' ', comment) 
-                
-                allele.writerow([linenum, allele_name, allele_type, gene_name, plasmids, comment])
-                num_successes += 1
-                
-            if DEBUG and linenum > 250: break
-
-    num_raw_alleles = linenum - 1 # subtract 1 for header line
+    err = ErrorLog(config.filter_errdir, 'allele', allele_raw.header)
+    err.add_duplicate('duplicate_allele')
+    err.add('invalid_allele_name')
+
+    validate = (ColumnarValidateAllele if config.columnar else ValidateAllele)(err)
+    with err:
+        Pipeline(allele_raw, validate, *output_stages(config, config.filter_dir / 'allele.csv', allele_header)).run()
+
+    if config.columnar:
+        instrument.record_cache('allele_memo', validate.classifier.memo_hits, len(validate.classifier.memo))
+
+    num_raw_alleles = allele_raw.rows_read
+    num_successes = validate.num_successes
     errstats = []
     errstats += [f'\nALLELES:']
     errstats += [f'  Rows processed: {num_raw_alleles}']
     errstats += [f'  Valid rows: {num_successes}']
-    errstats += [f"    Invalid allele_name: {err['invalid_allele_name']['err_count']}"]
-    errstats += [f'  Success Rate: {int(100*num_successes/num_raw_alleles)}%']
-    
-    print('\n'.join(errstats))
-          
-    #write statistics to error log
-    with open(errstats_file, 'a') as f:
-        f.write('\n'.join(errstats) + '\n')
+    errstats += [f"    Invalid allele_name: {err.count('invalid_allele_name')}"]
+    errstats += [f'  Success Rate: {success_rate(num_successes, num_raw_alleles)}%']
+    if log:
+        write_errstats(config, errstats)
+    return errstats
+
+
+class ValidateStrain:  # validate stage for raw strain rows: strain name and duplicate checks
+
+    def __init__(self, err, strain_names=None):
+        self.err = err
+        self.strain_names = strain_names if strain_names is not None else DuplicateIndex()
+
+    def __call__(self, records):
+        for rec in records:
+            strain_name = rec.raw[2]
+            self.check_name(rec, None, strain_name, valid_strain_name(strain_name))
+            yield rec
+
+    def check_name(self, rec, batch, strain_name, valid_name):  # batch: the Batch of rec, in columnar mode
+        if not valid_name:
+
+            self.err.fail('invalid_strain_name', logged(rec, batch))
+
+        elif (first_linenum := self.strain_names.check(strain_name, rec.linenum)) is not None:
+
+            self.err.fail('duplicate_strain', logged(rec, batch), [first_linenum])
+
+
+class ColumnarValidateStrain(ValidateStrain):  # ValidateStrain, ParseGenotype and FormatStrain's NULLs for Batches; genotypes are parsed on worker processes if workers > 1
+
+    def __init__(self, err, workers=1, chunksize=1000, strain_names=None):
+        super().__init__(err, strain_names)
+        self.workers = workers
+        self.chunksize = chunksize
+        self.max_pending = 2*workers  # chunks in flight, across batches, as in ParallelParseGenotype
+
+    def __call__(self, batches):
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                yield from self.validate_parallel(batches, pool)
+        else:
+            for batch in batches:
+                yield from self.validate(batch, map(check_genotype, batch.column(8)))
+
+    def validate_parallel(self, batches, pool):  # validate batches while the genotypes of the next ones are parsed on pool
+        batches = iter(batches)
+        pending = deque()  # (batch, futures of its chunks), in input order
+        num_pending = 0    # chunks in pending
+        while True:
+            while num_pending < self.max_pending:
+                batch = next(batches, None)
+                if batch is None: break
+                genotypes = batch.column(8)
+                futures = [pool.submit(check_genotype_chunk, genotypes[i:i + self.chunksize]) for i in range(0, len(genotypes), self.chunksize)]
+                pending.append((batch, futures))
+                num_pending += len(futures)
+            if not pending: break
+
+            # results are consumed in submission order, so duplicates are checked in line order
+            (batch, futures) = pending.popleft()
+            num_pending -= len(futures)
+            yield from self.validate(batch, chain.from_iterable(future.result() for future in futures))
+
+    def validate(self, batch, checked_genotypes):  # checked_genotypes: check_genotype results for the batch's genotype column
+        strain_names = batch.column(2)
+        columns = zip(batch.records(), strain_names, map(valid_strain_name, strain_names), checked_genotypes,
+                      null_column(batch.column(9)), null_column(batch.column(15)), comment_column(batch.column(11)))
+
+        # Duplicates are checked, errors logged and (without workers) genotypes parsed, row by row in line order
+        for (rec, strain_name, valid_name, checked, source, other_names, comment) in columns:
+            self.check_name(rec, batch, strain_name, valid_name)
+            set_genotype(self.err, rec, checked, batch)
+            rec.row = strain_row(rec, strain_name, source, other_names, comment)  # for FormatStrain, which counts successes
+            yield rec
+
+
+def check_genotype(genotype):  # return (valid, parsed Genotype); an empty genotype is valid and parses to None
+
+    if genotype.upper == 'WT': genotype = ''
+
+    if genotype == '':  #allow empty genotype string
+        return (True, None)
+
+    if not genotype_char_re.match(genotype):
+        return (False, None)
+
+    parsed = parse_genotype_compact(genotype)
+    if parsed is None:
+        if DEBUG: print(f'Could not parse genotype: {genotype}')
+        return (False, None)
+
+    return (True, parsed)
+
+
+def check_genotype_chunk(genotypes):  # worker task for ParallelParseGenotype
+    return [check_genotype(genotype) for genotype in genotypes]
 
-        
-def write_strains():  # Write valid strains to strain.csv and invalid strains to error files
 
-    raw_header = read_header(rawCSV['strain'])
-    
+def set_genotype(err, rec, checked, batch=None):  # set rec.genotype from a check_genotype result, logging an invalid genotype
+    (valid, rec.genotype) = checked
+    if not valid:
+        err.fail('invalid_genotype', logged(rec, batch))
+
+
+class ParseGenotype:  # parse stage for raw strain rows: validate and parse genotype
+
+    def __init__(self, err):
+        self.err = err
+
+    def __call__(self, records):
+        for rec in records:
+            set_genotype(self.err, rec, check_genotype(rec.raw[8]))
+            yield rec
+
+
+class ParallelParseGenotype:  # ParseGenotype, with genotypes parsed in chunks on a pool of worker processes
+
+    def __init__(self, err, workers, chunksize=1000):
+        self.err = err
+        self.workers = workers
+        self.chunksize = chunksize
+        self.max_pending = 2*workers  # chunks in flight; bounds memory use regardless of input size
+
+    def __call__(self, records):
+        records = iter(records)
+        pending = deque()  # (records, future) pairs, in input order
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while len(pending) < self.max_pending:
+                    chunk = list(islice(records, self.chunksize))
+                    if not chunk: break
+                    pending.append((chunk, pool.submit(check_genotype_chunk, [rec.raw[8] for rec in chunk])))
+                if not pending: break
+
+                # results are consumed in submission order, so downstream stages see records in line order
+                (chunk, future) = pending.popleft()
+                for rec, checked in zip(chunk, future.result()):
+                    set_genotype(self.err, rec, checked)
+                    yield rec
+
+
+def strain_row(rec, strain_name, source, other_names, comment):  # clean strain table row (genotype column is filled in by strain_csv_row)
+    return [rec.linenum, strain_name, None, source, other_names, comment]
+
+
+class FormatStrain:  # set clean strain table row for each strain that passed validation and parsing
+
+    def __init__(self):
+        self.num_successes = 0
+
+    def __call__(self, records):
+        for rec in records:
+            if not rec.failed: # success! set clean strain table row
+                if rec.row is None:  # (ColumnarValidateStrain sets rows itself)
+                    r = rec.raw
+                    rec.row = strain_row(rec, r[2], null_field(r[9]), null_field(r[15]), comment_field(r[11]))
+                self.num_successes += 1
+
+            yield rec
+
+
+def strain_csv_row(rec):  # strain.csv row, with the parsed genotype serialized as a Python literal
+    return rec.row[:2] + [str(rec.genotype.to_dicts()) if rec.genotype is not None else 'NULL'] + rec.row[3:]
+
+
+def strain_table_row(rec):  # strain.col row, with the parsed genotype in a json column (None for NULL)
+    return rec.row[:2] + [rec.genotype.to_dicts() if rec.genotype is not None else None] + rec.row[3:]
+
+
+def write_strains(config, source=None, log=True):  # Write valid strains to strain.csv and invalid strains to error files; return error statistics
+
+    strain_raw = source if source is not None else read_raw(config, 'strain')  # source must provide header and rows_read, like read_raw
+
     # Define error files
-    err = OrderedDict()
-    err['duplicate_strain']    = err_item('strain', 'duplicate_strain')    
-    err['invalid_strain_name'] = err_item('strain', 'invalid_strain_name')
-    err['invalid_genotype']    = err_item('strain', 'invalid_genotype')
-    
-    # Initialize error files by writing header line
-    write_errfile_headers(raw_header, err)        
-
-    # Define and initialize strain table file
-    strain_outfile = outdir / 'strain.csv'
-    strain_header = ['strain_original_line_number', 'strain_name', 'genotype', 'source', 'other_names', 'comment']
-    write_header(strain_outfile, strain_header)
-  
-    with open(err['duplicate_strain']['file'], 'a')    as duplicate_strain_fout, \
-         open(err['invalid_strain_name']['file'], 'a') as invalid_strain_name_fout, \
-         open(err['invalid_genotype']['file'], 'a')    as invalid_genotype_fout, \
-         open(rawCSV['strain'], 'r')                   as strain_raw_fin, \
-         open(strain_outfile, 'a')                     as strain_fout:
-
-        err['duplicate_strain']['writer']    = get_writer(duplicate_strain_fout)
-        err['invalid_strain_name']['writer'] = get_writer(invalid_strain_name_fout)        
-        err['invalid_genotype']['writer']    = get_writer(invalid_genotype_fout)
-
-        strain_raw = get_reader(strain_raw_fin)
-        strain     = get_writer(strain_fout)
-
-        # Write valid rows to outfile and invalid rows to error log files
-        num_successes = 0
-        next(strain_raw) # skip header line
-        linenum = 1
-        strain_names = []
-        for r in strain_raw: 
-            linenum += 1
-            r = [x.strip() for x in r]
-
-            strain_name = r[2]
-            genotype    = r[8]
-            source      = r[9]
-            comment     = r[11]
-            other_names = r[15]
-
-            if genotype.upper == 'WT': genotype = ''
-            
-            # Check error conditions
-            failure = False
-            if strain_name == '' or not re.match(r'CHB[0-9]+', strain_name):
-
-                write_failure(err['invalid_strain_name'], [linenum] + r)
-                failure = True
-
-            elif strain_name in strain_names:
-
-                write_failure(err['duplicate_strain'], [linenum] + r)
-                failure = True                
-
-            else:
-
-                strain_names.append(strain_name)
-                
-            if genotype != '':  #allow empty genotype string
-
-                if not re.match(r'^[-+.\]\[)(a-zA-Z0-9\s/;]+$', genotype):
-
-                    write_failure(err['invalid_genotype'], [linenum] + r)
-                    failure = True
-
-                else:
-                    genotype_dict = parse_genotype(genotype)
-
-                    if genotype_dict is None:
-                        if DEBUG: print(f'Could not parse genotype: {genotype}')
-                        write_failure(err['invalid_genotype'], [linenum] + r)                        
-                        failure = True
-                    else:
-                        genotype = str(genotype_dict)
-
-            if not failure: # success! write clean strain data to output file
-
-                if other_names == '': other_names = 'NULL'
-
-                if genotype == '': genotype = 'NULL'
-
-                if source == '': source = 'NULL'
-
-                comment = 'NULL' if comment == '' else re.sub(r'\n', ' ', comment) 
-
-                strain.writerow([linenum, strain_name, genotype, source, other_names, comment])
-                num_successes += 1
-                
-            if DEBUG and linenum > 250: break
-
-    num_raw_strains = linenum - 1  # subtract 1 for header line
+    err = ErrorLog(config.filter_errdir, 'strain', strain_raw.header)
+    err.add_duplicate('duplicate_strain')
+    err.add('invalid_strain_name')
+    err.add('invalid_genotype')
+
+    # With worker processes, genotypes are parsed first; duplicate detection in ValidateStrain then runs in line order
+    format = FormatStrain()
+    if config.columnar:
+        stages = [ColumnarValidateStrain(err, config.workers), format]
+    elif config.workers > 1:
+        stages = [ParallelParseGenotype(err, config.workers), ValidateStrain(err), format]
+    else:
+        stages = [ValidateStrain(err), ParseGenotype(err), format]
+    if writes_strain_table(config):
+        stages += output_stages(config, config.filter_dir / 'strain.csv', strain_header, format=strain_csv_row,
+                                table_format=strain_table_row, json_columns=['genotype'])
+    if config.combined_filter_normalize:  # flatten parsed genotypes directly into the normalized strain_allele table
+        stages += [NormalizeStrain(), *output_stages(config, config.normalize_dir / 'strain_allele.csv', strain_allele_header)]
+
+    cache = default_parser.cache_info()  # genotypes parsed in this process (not by workers)
+    with err:
+        Pipeline(strain_raw, *stages).run()
+    instrument.record_cache('genotype_cache', default_parser.hits - cache['hits'], default_parser.misses - cache['misses'])
+
+    num_raw_strains = strain_raw.rows_read
+    num_successes = format.num_successes
     errstats = []
     errstats += [f'\nSTRAINS:']
     errstats += [f'  Rows processed: {num_raw_strains}']
     errstats += [f'  Valid rows: {num_successes}']
-    errstats += [f"    Invalid strain_name: {err['invalid_strain_name']['err_count']}"]
-    errstats += [f"    Invalid genotype: {err['invalid_genotype']['err_count']}"]
-    errstats += [f'  Success Rate: {int(100*num_successes/num_raw_strains)}%']
-    
-    print('\n'.join(errstats))
-          
-    #write statistics to error log
-    with open(errstats_file, 'a') as f:
-        f.write('\n'.join(errstats) + '\n')
+    errstats += [f"    Invalid strain_name: {err.count('invalid_strain_name')}"]
+    errstats += [f"    Invalid genotype: {err.count('invalid_genotype')}"]
+    errstats += [f'  Success Rate: {success_rate(num_successes, num_raw_strains)}%']
+    if log:
+        write_errstats(config, errstats)
+    return errstats
+
+
+table_writers = OrderedDict([('strain', write_strains), ('allele', write_alleles), ('plasmid', write_plasmids)])
+
+
+def filter_table(config, table):  # worker task for filter_all: filter one table without logging, returning its error statistics
+    with instrument.step(f'filter.{table}'):
+        return table_writers[table](config, log=False)
+
+
+def filter_all(config):  # run the filter stage for all three tables
+    initialize_errorlog(config)
+    if config.parallel_tables:  # one process per table; statistics are logged in table order once all tables are done
+        with instrument.step('filter'), ProcessPoolExecutor(max_workers=len(table_writers)) as pool:
+            futures = [pool.submit(filter_table, config, table) for table in table_writers]
+            errstats = [future.result() for future in futures]
+        for table_errstats in errstats:
+            write_errstats(config, table_errstats)
+    else:
+        for table, write in table_writers.items():
+            with instrument.step(f'filter.{table}'):
+                write(config)
+
 
-        
-initialize_errorlog()
-write_strains()    
-write_alleles()
-write_plasmids()
+if __name__ == '__main__':
+    filter_all(load_config())
@@ -0,0 +1,108 @@
+''' Compact in-memory model of parsed genotypes
+
+parse_genotype returns a list of dicts per genotype (one dict per subunit, one dict per
+allele, with string keys repeated for every allele). Genotype holds the same information
+in __slots__ objects and tuples: allele, gene and chromosome names are interned, and Allele
+objects are shared between genotypes that mention the same allele with the same gene and
+heterozygosity, through an allele table passed to Genotype.from_dicts. Each GenotypeParser
+keeps its own table, cleared with its cache or when it reaches ALLELE_TABLE_SIZE entries.
+Genotype.from_dicts and Genotype.to_dicts convert losslessly between the two forms.
+'''
+
+import sys
+
+ALLELE_TABLE_SIZE = 100000  # max Alleles in an allele table before it is cleared (Genotypes keep the Alleles they hold)
+
+
+class Allele:  # treated as immutable, since instances are shared (see make_allele)
+
+    __slots__ = ('name', 'gene', 'heterozygous')
+
+    def __init__(self, name, gene, heterozygous):
+        self.name = name
+        self.gene = gene  # None if genotype string names no gene for this allele
+        self.heterozygous = heterozygous
+
+    def __eq__(self, other):
+        return isinstance(other, Allele) and (self.name, self.gene, self.heterozygous) == (other.name, other.gene, other.heterozygous)
+
+    def __hash__(self):
+        return hash((self.name, self.gene, self.heterozygous))
+
+    def __repr__(self):
+        return f'Allele({self.name!r}, {self.gene!r}, {self.heterozygous!r})'
+
+    def to_dict(self):
+        allele = {'allele_name': self.name}
+        if self.gene is not None:
+            allele['gene_name'] = self.gene
+        allele['heterozygous'] = self.heterozygous
+        return allele
+
+
+def make_allele(name, gene, heterozygous, table):  # return the Allele shared through table ((name, gene, heterozygous) -> Allele), interning its names
+    key = (name, gene, heterozygous)
+    allele = table.get(key)
+    if allele is None:
+        if len(table) >= ALLELE_TABLE_SIZE:
+            table.clear()
+        allele = table[key] = Allele(sys.intern(name), sys.intern(gene) if gene is not None else None, heterozygous)
+    return allele
+
+
+class GenotypeItem:  # one genotype subunit, e.g. "tm290/e189 III"
+
+    __slots__ = ('chromosome', 'allelesets')
+
+    def __init__(self, chromosome, allelesets):
+        self.chromosome = chromosome  # interned chromosome name, or None
+        self.allelesets = allelesets  # tuple of allelesets (1 or 2), each a tuple of Alleles
+
+    def __eq__(self, other):
+        return isinstance(other, GenotypeItem) and (self.chromosome, self.allelesets) == (other.chromosome, other.allelesets)
+
+    def __repr__(self):
+        return f'GenotypeItem({self.chromosome!r}, {self.allelesets!r})'
+
+
+class Genotype:  # parsed genotype: tuple of GenotypeItems
+
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+    def __eq__(self, other):
+        return isinstance(other, Genotype) and self.items == other.items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return f'Genotype({self.items!r})'
+
+    @classmethod
+    def from_dicts(cls, genotype, alleles=None):  # convert output of parse_genotype, sharing Alleles through the allele table alleles; None stays None
+        if genotype is None:
+            return None
+        if alleles is None:
+            alleles = {}
+        items = []
+        for item in genotype:
+            allelesets = []
+            for i, (key, aset) in enumerate(item['allelesets'].items()):
+                if key != 'alleleset' + str(i+1):
+                    raise ValueError(f'Unexpected alleleset key: {key}')
+                allelesets.append(tuple(make_allele(a['allele_name'], a.get('gene_name'), a['heterozygous'], alleles) for a in aset))
+            chromosome = item['chromosome']
+            items.append(GenotypeItem(sys.intern(chromosome) if chromosome is not None else None, tuple(allelesets)))
+        return cls(tuple(items))
+
+    def to_dicts(self):  # convert to the form returned by parse_genotype (a new, independent list)
+        return [{'chromosome': item.chromosome,
+                 'allelesets': {'alleleset' + str(i+1): [allele.to_dict() for allele in aset]
+                                for i, aset in enumerate(item.allelesets)}}
+                for item in self.items]
@@ -0,0 +1,217 @@
+''' Incremental ingest: push only inserted, changed and deleted rows through filter, normalize and load
+
+Each raw CSV row is hashed, and rows are grouped by key (strain name, allele name without
+suffix, or plasmid name); the hashes of the previous run are kept in
+output_directory/state. Rows whose key is new or whose hash changed are filtered and
+normalized into output_directory/delta, then staging rows of every inserted, changed and
+deleted key are deleted and the delta rows are loaded. (Keys are inserted relative to the
+state, not to the staging tables: without a state file, as after a straindb load, every key
+counts as inserted and its rows are replaced.) Parsing, validation and loading therefore cost
+time proportional to the diff; only hashing reads the full raw CSVs. Staging rows of
+unchanged keys keep the original line numbers of the run that loaded them.
+
+The state advances only once the delta is loaded. sync(load=False) (straindb sync --no-load)
+leaves it as it was, and keeps the keys to delete in delta/removals.csv and the new hashes in
+delta/state; load_delta (straindb load-delta) applies that delta later, then advances the state.
+'''
+
+import copy, hashlib
+from collections import OrderedDict
+from straindb import instrument
+from straindb.config import load_config
+from straindb.fileio import get_reader, get_writer, mkparent
+from straindb.filter_csv import initialize_errorlog, read_raw, write_strains, write_alleles, write_plasmids
+from straindb.normalize_csv import normalize_all
+from straindb.parse_allele import parse_allele
+from straindb.load import StagingLoader, connect
+
+
+def allele_key(r):  # alleles differing only in suffix (e.g. oy706a, oy706) collide in filter_csv, so share a key
+    return parse_allele(r[2].strip())[0] or r[2].strip()
+
+
+key_functions = OrderedDict([
+    ('strain',  lambda r: r[2].strip()),
+    ('allele',  allele_key),
+    ('plasmid', lambda r: r[5].strip()),
+])
+
+# staging table columns holding each raw table's key
+staging_keys = OrderedDict([
+    ('strain',  [('staging_strain_allele', 'strain_name'), ('staging_strain', 'strain_name')]),
+    ('allele',  [('staging_allele', 'name')]),
+    ('plasmid', [('staging_plasmid', 'name')]),
+])
+
+
+def state_file(config, table):
+    return config.output_directory / 'state' / f'{table}.hashes.csv'
+
+
+def removals_file(config):  # keys whose staging rows a pending delta deletes
+    return config.output_directory / 'delta' / 'removals.csv'
+
+
+def delta_config(config):  # same settings, with outputs written under output_directory/delta
+    delta = copy.copy(config)
+    delta.output_directory = config.output_directory / 'delta'
+    delta.validate_references = False  # references of delta rows may resolve to unchanged rows, which are not in the delta
+    delta.columnar = False  # DeltaSource selects Records, not Batches
+    delta.write_db_tables = False  # these hold all rows, and would be rebuilt from the delta rows alone
+    delta.write_sqlite = False
+    delta.write_search_index = False
+    delta.write_index = False
+    return delta
+
+
+def hash_table(csvfile, key):  # key -> content hash of all raw rows with that key
+    hashes = OrderedDict()
+    with open(csvfile, 'r') as fin:
+        reader = get_reader(fin)
+        next(reader) # skip header line
+        for r in reader:
+            k = key(r)
+            h = hashes.get(k)
+            if h is None:
+                h = hashes[k] = hashlib.blake2b(digest_size=16)
+            h.update('\x1f'.join(x.strip() for x in r).encode() + b'\x1e')
+    return OrderedDict((k, h.hexdigest()) for k, h in hashes.items())
+
+
+def read_state(csvfile):  # key -> hash from the previous run (empty on the first run)
+    if not csvfile.exists():
+        return {}
+    with open(csvfile, 'r') as fin:
+        reader = get_reader(fin)
+        next(reader) # skip header line
+        return {k: h for (k, h) in reader}
+
+
+def write_state(csvfile, hashes):
+    mkparent(csvfile)
+    with open(csvfile, 'w') as fout:
+        writer = get_writer(fout)
+        writer.writerow(['key', 'hash'])
+        writer.writerows(hashes.items())
+
+
+def write_removals(csvfile, removals):  # removals: table -> keys
+    mkparent(csvfile)
+    with open(csvfile, 'w') as fout:
+        writer = get_writer(fout)
+        writer.writerow(['table', 'key'])
+        writer.writerows((table, k) for table, keys in removals.items() for k in keys)
+
+
+def read_removals(csvfile):  # table -> keys, as written by write_removals
+    removals = OrderedDict((table, []) for table in key_functions)
+    with open(csvfile, 'r') as fin:
+        reader = get_reader(fin)
+        next(reader) # skip header line
+        for (table, k) in reader:
+            removals[table].append(k)
+    return removals
+
+
+class Delta:  # keys inserted, changed and deleted since the previous run
+
+    def __init__(self, old, new):
+        self.inserted = [k for k in new if k not in old]
+        self.changed  = [k for k in new if k in old and old[k] != new[k]]
+        self.deleted  = [k for k in old if k not in new]
+
+    def upserts(self):  # keys whose current rows must be filtered, normalized and loaded
+        return set(self.inserted) | set(self.changed)
+
+    def removals(self):  # keys whose staging rows must be deleted before loading (inserted keys may already be loaded)
+        return self.inserted + self.changed + self.deleted
+
+    def __str__(self):
+        return f'{len(self.inserted)} inserted, {len(self.changed)} changed, {len(self.deleted)} deleted'
+
+
+class DeltaSource:  # source stage: rows of a raw CSV whose key is in keys, with their original line numbers
+
+    def __init__(self, read, key, keys):
+        self.read = read
+        self.key = key
+        self.keys = keys
+        self.header = read.header
+        self.rows_read = 0
+
+    def __iter__(self):
+        for rec in self.read:
+            if self.key(rec.raw) in self.keys:
+                self.rows_read += 1
+                yield rec
+
+
+def sync(config, connection=None, load=True):  # run filter, normalize and (optionally) load on changed rows only
+
+    deltas = OrderedDict()
+    hashes = OrderedDict()
+    for table, key in key_functions.items():
+        with instrument.step(f'sync.hash.{table}'):
+            hashes[table] = hash_table(config.rawCSV[table], key)
+        deltas[table] = Delta(read_state(state_file(config, table)), hashes[table])
+        print(f'{table}: {deltas[table]}')
+
+    delta = delta_config(config)
+    initialize_errorlog(delta)
+    for table, write in (('strain', write_strains), ('allele', write_alleles), ('plasmid', write_plasmids)):
+        with instrument.step(f'filter.{table}'):
+            write(delta, DeltaSource(read_raw(delta, table), key_functions[table], deltas[table].upserts()))
+    normalize_all(delta)
+
+    removals = OrderedDict((table, deltas[table].removals()) for table in key_functions)
+    if not load:  # keep what load_delta needs; the state stays at the last loaded run
+        write_removals(removals_file(config), removals)
+        for table in key_functions:
+            write_state(state_file(delta, table), hashes[table])
+        return deltas
+
+    apply_delta(config, removals, connection)
+    # Record hashes only once the delta has been applied, so a failed run is retried in full
+    for table in key_functions:
+        write_state(state_file(config, table), hashes[table])
+    discard_pending(config)
+    return deltas
+
+
+def apply_delta(config, removals, connection=None):  # delete the staging rows of removed keys, then load the delta outputs
+    own_connection = connection is None
+    if own_connection:
+        connection = connect(config)
+    try:
+        loader = StagingLoader(connection, config.load_batch_size)
+        with instrument.step('load'):
+            for table, columns in staging_keys.items():
+                for (staging_table, column) in columns:
+                    loader.delete_keys(staging_table, column, removals[table])
+            loader.load_staging_tables(delta_config(config))
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def discard_pending(config):  # remove the removals and hashes of a delta written by sync(load=False)
+    delta = delta_config(config)
+    for path in [removals_file(config)] + [state_file(delta, table) for table in key_functions]:
+        if path.exists():
+            path.unlink()
+
+
+def load_delta(config, connection=None):  # load the delta of the last sync(load=False), then advance the state to it
+    delta = delta_config(config)
+    if not removals_file(config).exists():
+        raise FileNotFoundError(f'No pending delta in {delta.output_directory}: run straindb sync --no-load first')
+    apply_delta(config, read_removals(removals_file(config)), connection)
+    for table in key_functions:
+        pending = state_file(delta, table)
+        mkparent(state_file(config, table))
+        pending.replace(state_file(config, table))
+    removals_file(config).unlink()
+
+
+if __name__ == '__main__':
+    sync(load_config())
@@ -0,0 +1,255 @@
+''' Binary index file of strain names and posting lists, read through mmap
+
+Opening an index file maps it into memory without parsing it, so it takes milliseconds and
+its pages are shared by all processes that open it. Layout (native byte order, recorded in
+the metadata; sections are 8-byte aligned):
+
+    magic      b'STRAINIX'
+    version    u32, FORMAT_VERSION
+    length     u32, length of metadata
+    metadata   JSON: byte order, source file fingerprints, payload checksum, section offsets
+    sections   strings:              UTF-8 names, each distinct name stored once
+               strain_offsets/ends:  u32 start and end offsets of strain names in strings, in strain number order
+               <field>_name_offsets/ends: u32 start and end offsets of the field's names, sorted by name
+               <field>_post_offsets: u32 offsets into <field>_postings, one per name plus an end offset
+               <field>_postings:     u32 strain numbers, sorted, for each name in turn
+
+Source fingerprints (size, modification time and blake2b digest of each CSV the index was
+built from) detect a stale index: files whose size and modification time are unchanged are
+trusted, and others are re-hashed. An empty, truncated or unreadable file is treated as stale
+too, so readers fall back to the CSVs. The payload checksum is checked when the index is
+written (the file is read back before it replaces the old index), and by IndexFile.verify.
+'''
+
+import hashlib, json, mmap, os, struct, sys
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+MAGIC = b'STRAINIX'
+FORMAT_VERSION = 1
+header_struct = struct.Struct('<8sII')
+
+
+class StaleIndexError(Exception):  # index file is missing, of another format version, or older than its sources
+    pass
+
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return OrderedDict([('size', stat.st_size), ('mtime_ns', stat.st_mtime_ns), ('blake2b', file_digest(path))])
+
+
+def align(n):
+    return (n + 7) & ~7
+
+
+class StringTable:  # interns names into one UTF-8 blob, returning the offset of each name
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = {}
+
+    def add(self, name):  # offset of name; an end offset is name offset + encoded length
+        encoded = name.encode()
+        if encoded not in self.offsets:
+            self.offsets[encoded] = len(self.blob)
+            self.blob += encoded
+        return self.offsets[encoded]
+
+
+def offsets_array(strings, names):  # u32 start and end offset of each name (names must each be interned in strings)
+    starts = array('I')
+    ends = array('I')
+    for name in names:
+        start = strings.add(name)
+        starts.append(start)
+        ends.append(start + len(name.encode()))
+    return starts, ends
+
+
+def write_index_file(path, strain_names, postings, sources):  # postings: field -> name -> sorted strain numbers; sources: CSV paths
+    strings = StringTable()
+    sections = OrderedDict()
+
+    starts, ends = offsets_array(strings, strain_names)
+    sections['strain_offsets'] = starts
+    sections['strain_ends'] = ends
+
+    for field, names in postings.items():
+        sorted_names = sorted(names, key=lambda name: name.encode())
+        starts, ends = offsets_array(strings, sorted_names)
+        sections[f'{field}_name_offsets'] = starts
+        sections[f'{field}_name_ends'] = ends
+        post_offsets = array('I', [0])
+        ids = array('I')
+        for name in sorted_names:
+            ids.extend(names[name])
+            post_offsets.append(len(ids))
+        sections[f'{field}_post_offsets'] = post_offsets
+        sections[f'{field}_postings'] = ids
+
+    sections = OrderedDict([('strings', bytes(strings.blob))] + [(k, v.tobytes()) for k, v in sections.items()])
+
+    layout = OrderedDict()
+    payload = bytearray()
+    for name, data in sections.items():
+        payload += b'\0' * (align(len(payload)) - len(payload))
+        layout[name] = [len(payload), len(data)]
+        payload += data
+
+    metadata = OrderedDict([('byteorder', sys.byteorder),
+                            ('fields', list(postings)),
+                            ('num_strains', len(strain_names)),
+                            ('sources', OrderedDict((str(Path(p).name), fingerprint(p)) for p in sources)),
+                            ('checksum', hashlib.blake2b(payload, digest_size=16).hexdigest()),
+                            ('sections', layout)])
+    encoded = json.dumps(metadata).encode()
+    header = header_struct.pack(MAGIC, FORMAT_VERSION, len(encoded)) + encoded
+    header += b'\0' * (align(len(header)) - len(header))
+
+    tmp = Path(str(path) + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+    with open(tmp, 'rb') as f:  # read back what reached the disk, so a bad write never replaces the index
+        written = memoryview(f.read())
+    verify_payload(tmp, *read_header(tmp, written))
+    os.replace(tmp, path)  # readers see the old index or the new one, never a partial file
+
+
+class NameTable:  # sequence of names stored in a string blob; sorted tables support find()
+
+    def __init__(self, strings, starts, ends):
+        self.strings = strings
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def encoded(self, i):
+        return bytes(self.strings[self.starts[i]:self.ends[i]])
+
+    def __getitem__(self, i):
+        return self.encoded(i).decode()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def find(self, name):  # position of name in a sorted table, or -1
+        target = name.encode()
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.encoded(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self.encoded(lo) == target else -1
+
+
+class PostingTable:  # name -> strain numbers (a zero-copy memoryview), for one field
+
+    def __init__(self, names, post_offsets, postings):
+        self.names = names
+        self.post_offsets = post_offsets
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return self.names.find(name) >= 0
+
+    def get(self, name, default=None):
+        i = self.names.find(name)
+        if i < 0:
+            return default
+        return self.postings[self.post_offsets[i]:self.post_offsets[i+1]]
+
+    def at(self, i):  # strain numbers of the i-th name
+        return self.postings[self.post_offsets[i]:self.post_offsets[i+1]]
+
+    def items(self):
+        return ((name, self.at(i)) for i, name in enumerate(self.names))
+
+
+def read_header(path, view):  # (metadata, payload) of an index file's bytes; raise StaleIndexError unless they hold a whole index
+    if len(view) < header_struct.size:
+        raise StaleIndexError(f'{path}: truncated index file')
+    magic, version, length = header_struct.unpack_from(view)
+    if magic != MAGIC:
+        raise StaleIndexError(f'{path}: not an index file')
+    if version != FORMAT_VERSION:
+        raise StaleIndexError(f'{path}: index format version {version}, expected {FORMAT_VERSION}')
+    try:
+        metadata = json.loads(bytes(view[header_struct.size:header_struct.size + length]))
+        byteorder = metadata['byteorder']
+        end = max((start + size for start, size in metadata['sections'].values()), default=0)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:  # JSONDecodeError and UnicodeDecodeError are ValueErrors
+        raise StaleIndexError(f'{path}: unreadable index metadata ({e})')
+    if byteorder != sys.byteorder:
+        raise StaleIndexError(f'{path}: written on a {byteorder}-endian machine')
+    payload = view[align(header_struct.size + length):]
+    if len(payload) < end:
+        raise StaleIndexError(f'{path}: truncated index file')
+    return metadata, payload
+
+
+def verify_payload(path, metadata, payload):  # raise StaleIndexError if payload does not match its checksum (reads all of it)
+    if hashlib.blake2b(payload, digest_size=16).hexdigest() != metadata['checksum']:
+        raise StaleIndexError(f'{path}: checksum mismatch')
+
+
+class IndexFile:  # memory-mapped index file; keep it open while its names and postings are in use
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            try:
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # an empty file cannot be mapped
+                raise StaleIndexError(f'{self.path}: empty index file')
+        view = memoryview(self.mmap)
+        self.metadata, self.payload = read_header(self.path, view)
+
+        try:
+            sections = {name: self.payload[start:start + size] for name, (start, size) in self.metadata['sections'].items()}
+            u32 = lambda name: sections[name].cast('I')
+            strings = sections['strings']
+            self.strain_names = NameTable(strings, u32('strain_offsets'), u32('strain_ends'))
+            self.postings = OrderedDict((field, PostingTable(NameTable(strings, u32(f'{field}_name_offsets'), u32(f'{field}_name_ends')),
+                                                             u32(f'{field}_post_offsets'), u32(f'{field}_postings')))
+                                        for field in self.metadata['fields'])
+        except (KeyError, TypeError, ValueError) as e:  # missing sections, or sizes that are not whole u32 arrays
+            raise StaleIndexError(f'{self.path}: unreadable index sections ({e})')
+
+    def check_sources(self, sources):  # raise StaleIndexError unless sources are the files the index was built from
+        recorded = self.metadata['sources']
+        if sorted(recorded) != sorted(Path(p).name for p in sources):
+            raise StaleIndexError(f'{self.path}: built from {", ".join(recorded)}')
+        for p in sources:
+            expected = recorded[Path(p).name]
+            try:
+                stat = os.stat(p)
+            except FileNotFoundError:
+                raise StaleIndexError(f'{self.path}: source {p} is missing')
+            if (stat.st_size, stat.st_mtime_ns) == (expected['size'], expected['mtime_ns']):
+                continue
+            if stat.st_size != expected['size'] or file_digest(p) != expected['blake2b']:
+                raise StaleIndexError(f'{self.path}: source {p} changed since the index was written')
+
+    def verify(self):  # raise StaleIndexError if the payload does not match its checksum (reads the whole file)
+        verify_payload(self.path, self.metadata, self.payload)
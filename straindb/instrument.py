@@ -0,0 +1,247 @@
+''' Instrumentation of straindb runs: where filter, normalize and load time goes
+
+With profile: true in config.yaml (or straindb --profile), each step of a run (filter.strain,
+normalize.allele, load, ...) records its wall and CPU time, rows/sec, peak RSS and the time
+spent in each stage of its pipelines. Parse functions are timed, and cache hit rates are
+recorded. The report is written to <output_directory>/profile/report.json, e.g.
+
+    {"command": "run", "wall_seconds": 41.2, ...,
+     "steps": [{"step": "filter.strain", "wall_seconds": 15.1, "cpu_seconds": 14.9, "rows": 250000,
+                "rows_per_second": 16556, "peak_rss_mb": 212.4,
+                "stages": [{"stage": "ReadCSV", "seconds": 1.9, "records": 250000}, ...],
+                "stats": {"genotype_cache": {"hits": 36164, "misses": 153836, ...}}}, ...],
+     "timers": {"parse_genotype.parse_normalized": {"seconds": 6.9, "calls": 153836}, ...}}
+
+With cprofile: true (or --cprofile), each step is also run under cProfile, and its stats are
+dumped to profile/<step>.prof (read them with pstats or snakeviz).
+
+Instrumentation is off unless a Profiler is active: Pipeline.run and step() then check one
+module attribute, and parse functions are only wrapped in timers while a Profiler runs.
+Steps run in worker processes (parallel_tables) report to their own copy of the Profiler,
+which is discarded; the parent records the whole filter step instead.
+'''
+
+import cProfile, json, sys, time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from straindb.genotype_model import Genotype
+from straindb.parse_allele import AlleleClassifier
+from straindb.parse_date import DateParser
+from straindb.parse_genotype import GenotypeParser
+
+current = None  # active Profiler, or None when instrumentation is off
+
+# Functions timed while a Profiler is active: (timer name, class, attribute)
+timed_methods = [
+    ('parse_genotype.normalize', GenotypeParser, 'normalize'),                # bracket and line number regexes, on every genotype
+    ('parse_genotype.parse_normalized', GenotypeParser, 'parse_normalized'),  # genotype grammar regexes, on cache misses
+    ('genotype_model.from_dicts', Genotype, 'from_dicts'),                    # compact Genotype construction, on cache misses
+    ('parse_allele.classify', AlleleClassifier, 'classify'),                  # allele name pattern
+    ('parse_date.parse', DateParser, 'parse'),                                # strict formats and fuzzy parsing
+]
+
+
+def rusage(children=False):  # resource usage of this process or its waited-for children, or None without the resource module (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+
+
+def peak_rss_mb(children=False):  # peak resident set size so far, of this process or its largest waited-for child (None if unknown)
+    usage = rusage(children)
+    if usage is None:
+        return None
+    return usage.ru_maxrss / 2**20 if sys.platform == 'darwin' else usage.ru_maxrss / 2**10  # bytes on macOS, KiB elsewhere
+
+
+def children_cpu_seconds():  # CPU time of waited-for child processes, e.g. genotype workers (None if unknown)
+    usage = rusage(children=True)
+    return usage.ru_utime + usage.ru_stime if usage is not None else None
+
+
+def elapsed(start, end):  # end - start, or None if either is unknown
+    return end - start if start is not None and end is not None else None
+
+
+class Timer:  # accumulated wall time and number of calls of a timed function
+
+    __slots__ = ('seconds', 'calls')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+    def wrap(self, f):
+        clock = time.perf_counter
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                self.seconds += clock() - start
+                self.calls += 1
+        return timed
+
+
+class StageTimer:  # iterate over the output of a pipeline stage, timing each step (including the stages upstream of it)
+
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+        self.seconds = 0.0
+        self.count = 0
+
+    def __iter__(self):
+        clock = time.perf_counter
+        items = iter(self.items)
+        while True:
+            start = clock()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.seconds += clock() - start
+                return
+            self.seconds += clock() - start
+            self.count += 1
+            yield item
+
+
+def round_floats(d):
+    return OrderedDict((k, round(v, 4) if isinstance(v, float) else v) for k, v in d.items())
+
+
+class Profiler:  # records a report of one run; use as a context manager around the run
+
+    def __init__(self, profile_dir, command=None, cprofile=False):
+        self.profile_dir = profile_dir
+        self.command = command
+        self.cprofile = cprofile
+        self.steps = []
+        self.step_stack = []
+        self.timers = OrderedDict((name, Timer()) for (name, _, _) in timed_methods)
+        self.originals = []
+
+    @classmethod
+    def from_config(cls, config, command=None):  # Profiler for the run, or a null context if profiling is off
+        if not (config.profile or config.cprofile):
+            return nullcontext()
+        return cls(config.profile_dir, command, config.cprofile)
+
+    def __enter__(self):
+        global current
+        for (name, cls, attr) in timed_methods:  # wrap each timed function, keeping the original for __exit__
+            original = cls.__dict__[attr]
+            self.originals.append((cls, attr, original))
+            if isinstance(original, (staticmethod, classmethod)):
+                setattr(cls, attr, type(original)(self.timers[name].wrap(original.__func__)))
+            else:
+                setattr(cls, attr, self.timers[name].wrap(original))
+        self.start = (time.perf_counter(), time.process_time(), children_cpu_seconds())
+        current = self
+        return self
+
+    def __exit__(self, *exc):
+        global current
+        current = None
+        for (cls, attr, original) in reversed(self.originals):
+            setattr(cls, attr, original)
+        self.originals = []
+        self.write()
+
+    @contextmanager
+    def step(self, name):  # record one step of the run (e.g. filter.strain); steps may nest
+        step = OrderedDict([('step', name)])
+        if self.step_stack:
+            step['parent'] = self.step_stack[-1]['step']
+        step['stages'] = []
+        step['stats'] = OrderedDict()
+        step['rows'] = 0
+        self.steps.append(step)
+        self.step_stack.append(step)
+
+        profile = cProfile.Profile() if self.cprofile and len(self.step_stack) == 1 else None  # nested steps are in their parent's profile
+        wall, cpu, children_cpu = time.perf_counter(), time.process_time(), children_cpu_seconds()
+        if profile: profile.enable()
+        try:
+            yield step
+        finally:
+            if profile: profile.disable()
+            step['wall_seconds'] = time.perf_counter() - wall
+            step['cpu_seconds'] = time.process_time() - cpu
+            step['children_cpu_seconds'] = elapsed(children_cpu, children_cpu_seconds())
+            step['rows_per_second'] = step['rows'] / step['wall_seconds'] if step['wall_seconds'] else 0.0
+            step['peak_rss_mb'] = peak_rss_mb()
+            step['children_peak_rss_mb'] = peak_rss_mb(children=True)
+            if profile:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                step['cprofile'] = str(self.profile_dir / f'{name}.prof')
+                profile.dump_stats(step['cprofile'])
+            self.step_stack.pop()
+
+    def run_pipeline(self, pipeline):  # Pipeline.run, timing each stage; stage times exclude the stages upstream of them
+        if not self.step_stack:  # a pipeline run outside any step is a step of its own
+            with self.step(type(pipeline.source).__name__):
+                return self.run_pipeline(pipeline)
+
+        timers = [StageTimer(type(pipeline.source).__name__, pipeline.source)]
+        for stage in pipeline.stages:
+            timers.append(StageTimer(type(stage).__name__, stage(iter(timers[-1]))))
+        for _ in timers[-1]:
+            pass
+
+        step = self.step_stack[-1]
+        step['rows'] += getattr(pipeline.source, 'rows_read', timers[0].count)
+        upstream = 0.0
+        for timer in timers:
+            step['stages'].append(round_floats(OrderedDict([('stage', timer.name), ('seconds', timer.seconds - upstream),
+                                                            ('records', timer.count)])))
+            upstream = timer.seconds
+
+    def record(self, name, value):  # add a statistic (e.g. cache hits) to the current step
+        if self.step_stack:
+            self.step_stack[-1]['stats'][name] = value
+
+    def report(self):
+        (wall, cpu, children_cpu) = self.start
+        steps = []
+        for step in self.steps:  # timings first, then stages and statistics
+            keys = ['step', 'parent', 'wall_seconds', 'cpu_seconds', 'children_cpu_seconds', 'rows', 'rows_per_second',
+                    'peak_rss_mb', 'children_peak_rss_mb', 'cprofile', 'stages', 'stats']
+            steps.append(round_floats(OrderedDict((k, step[k]) for k in keys if k in step)))
+        report = round_floats(OrderedDict([
+            ('command', self.command),
+            ('wall_seconds', time.perf_counter() - wall),
+            ('cpu_seconds', time.process_time() - cpu),
+            ('children_cpu_seconds', elapsed(children_cpu, children_cpu_seconds())),
+            ('peak_rss_mb', peak_rss_mb()),
+        ]))
+        report['steps'] = steps
+        report['timers'] = OrderedDict((name, OrderedDict([('seconds', round(t.seconds, 4)), ('calls', t.calls)]))
+                                       for name, t in self.timers.items() if t.calls)
+        return report
+
+    def write(self):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.profile_dir / 'report.json', 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
+
+
+def step(name):  # context manager recording a step of the run, if a Profiler is active
+    return current.step(name) if current is not None else nullcontext()
+
+
+def record(name, value):  # add a statistic to the current step, if a Profiler is active
+    if current is not None:
+        current.record(name, value)
+
+
+def count_rows(num_rows):  # add rows processed outside pipelines (e.g. rows loaded) to the current step, if a Profiler is active
+    if current is not None and current.step_stack:
+        current.step_stack[-1]['rows'] += num_rows
+
+
+def record_cache(name, hits, misses):  # add cache hits, misses and hit rate to the current step, if a Profiler is active
+    record(name, OrderedDict([('hits', hits), ('misses', misses), ('hit_rate', round(hits/(hits + misses), 4) if hits + misses else None)]))
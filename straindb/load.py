@@ -0,0 +1,153 @@
+''' Load filter and normalize outputs into the staging tables (replaces 2_load_staging_tables.sql)
+
+Rows are streamed from the CSV files (or from their table files, with table_files: true) and inserted with batched executemany calls over a
+single connection; each table is loaded in one transaction. Any DB-API connection with
+the staging tables of 1_create_staging_tables.sql can be used, e.g. a sqlite3 connection
+for testing.
+'''
+
+import sqlite3, time
+from collections import OrderedDict
+from straindb import instrument
+from straindb.config import load_config
+from straindb.pipeline import ReadCSV, ReadTable
+from straindb.table_file import input_file
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def staging_files(config):  # staging table -> (CSV file, columns loaded from it, in CSV column order)
+    files = OrderedDict()
+    files['staging_plasmid'] = (config.filter_dir / 'plasmid.csv',
+                                ['plasmid_original_line_number', 'name', 'expanded_name', 'source', 'parent1', 'parent2',
+                                 'restriction_site', 'datestr'])
+    files['staging_allele'] = (config.normalize_dir / 'allele.csv',
+                               ['allele_original_line_number', 'name', 'allele_type', 'gene_name', 'plasmid_name', 'comment'])
+    strain_allele_dir = config.validate_dir if config.validate_references else config.normalize_dir
+    files['staging_strain_allele'] = (strain_allele_dir / 'strain_allele.csv',
+                                      ['strain_original_line_number', 'strain_name', 'chromosome', 'alleleset_binaryid',
+                                       'allele_name', 'gene_name', 'heterozygous', 'other_names', 'source', 'comment'])
+    return files
+
+
+def null_to_none(r):  # 'NULL' fields are loaded as SQL NULL, as LOAD DATA INFILE does
+    return [None if x == 'NULL' else x for x in r]
+
+
+def read_rows(path):  # stream rows of a filter or normalize output file: a CSV file, or a table file (.col)
+    source = ReadTable(path, replace={'NULL': None}) if path.suffix == '.col' else ReadCSV(path, clean=null_to_none)
+    for rec in source:
+        yield rec.raw
+
+
+def connect(config):  # connection from a single-connection mysql.connector pool, using the mysql section of config.yaml
+    from mysql.connector import pooling
+    pool = pooling.MySQLConnectionPool(pool_name='straindb', pool_size=1, **config.mysql)
+    return pool.get_connection()
+
+
+def placeholder_for(connection):  # DB-API parameter marker used by connection's driver
+    return '?' if isinstance(connection, sqlite3.Connection) else '%s'
+
+
+class StagingLoader:  # batched inserts into staging tables over one connection
+
+    def __init__(self, connection, batch_size=DEFAULT_BATCH_SIZE, verbose=True):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.verbose = verbose
+        self.placeholder = placeholder_for(connection)
+        self.stats = OrderedDict()  # table -> (rows loaded, seconds)
+
+    def insert_statement(self, table, columns):
+        return f"insert into {table} ({', '.join(columns)}) values ({', '.join([self.placeholder]*len(columns))})"
+
+    def load_table(self, table, columns, rows):  # insert rows into table in a single transaction; return number of rows
+        statement = self.insert_statement(table, columns)
+        start = time.perf_counter()
+        num_rows = 0
+        cursor = self.connection.cursor()
+        try:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    cursor.executemany(statement, batch)
+                    num_rows += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(statement, batch)
+                num_rows += len(batch)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.report(table, num_rows, time.perf_counter() - start)
+        instrument.count_rows(num_rows)
+        return num_rows
+
+    def execute(self, table, statement):  # run a single statement in its own transaction
+        start = time.perf_counter()
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(statement)
+            num_rows = cursor.rowcount
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.report(table, num_rows, time.perf_counter() - start)
+        return num_rows
+
+    def delete_keys(self, table, column, keys):  # delete rows whose column value is in keys, in a single transaction
+        statement = f'delete from {table} where {column} = {self.placeholder}'
+        start = time.perf_counter()
+        cursor = self.connection.cursor()
+        try:
+            keys = [(key,) for key in keys]
+            for i in range(0, len(keys), self.batch_size):
+                cursor.executemany(statement, keys[i:i + self.batch_size])
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.report(f'{table} (delete)', len(keys), time.perf_counter() - start)
+        return len(keys)
+
+    def report(self, table, num_rows, seconds):
+        self.stats[table] = (num_rows, seconds)
+        instrument.record(table, OrderedDict([('rows', num_rows), ('seconds', round(seconds, 4)),
+                                              ('rows_per_second', round(num_rows/max(seconds, 1e-9)))]))
+        if self.verbose:
+            print(f'{table}: {num_rows} rows in {seconds:.2f} s ({num_rows/max(seconds, 1e-9):.0f} rows/s)')
+
+    def load_staging_tables(self, config):  # load all staging tables from the outputs of the filter and normalize stages
+        for table, (csvfile, columns) in staging_files(config).items():
+            self.load_table(table, columns, read_rows(input_file(config, csvfile)))
+
+        # Load table of distinct strain names (only names not already present, so incremental loads can reuse this)
+        self.execute('staging_strain', 'insert into staging_strain (strain_name) select distinct strain_name from staging_strain_allele ssa'
+                                       ' where not exists (select * from staging_strain ss where ss.strain_name = ssa.strain_name)')
+        return self.stats
+
+
+def load_all(config, connection=None):  # load staging tables, connecting with config.mysql unless a connection is given
+    own_connection = connection is None
+    if own_connection:
+        connection = connect(config)
+    try:
+        with instrument.step('load'):
+            return StagingLoader(connection, config.load_batch_size).load_staging_tables(config)
+    finally:
+        if own_connection:
+            connection.close()
+
+
+if __name__ == '__main__':
+    load_all(load_config())
@@ -1,133 +1,137 @@
 ''' Normalize strain table (remove genotype dict) and allele table (remove plasmid list) '''
 
-import csv, re, ast
-from pathlib import Path
-from collections import OrderedDict
-from straindb.config import rawCSV, output_directory
-from straindb.fileio import get_writer, get_reader, mkparent
+import re, ast
+from straindb import instrument
+from straindb.config import load_config
+from straindb.db_tables import write_db_tables
+from straindb.genotype_model import Genotype
+from straindb.pipeline import Pipeline, Record, ReadCSV, ReadTable, output_stages
+from straindb.strain_allele import strain_allele_header, strain_allele_rows
+from straindb.query import write_index
+from straindb.search import write_search_index
+from straindb.sqlite_db import build_sqlite_db
+from straindb.table_file import table_path
+from straindb.validate_references import validate_references
 
 DEBUG = False
 debug_line_number = None # set DEBUG to True and debug_line_number to a line number in original strain CSV to debug
 
-indir = output_directory / 'filter'
-outdir = output_directory / 'normalize'
+strain_allele_outfile_header = strain_allele_header
+allele_outfile_header = ['allele_original_line_number', 'allele_name', 'allele_type', 'gene_name', 'plasmid_name', 'comment']
 
-strain_file = indir / 'strain.csv'
-allele_file = indir / 'allele.csv'
+plasmid_sep_re = re.compile(r'\s*[,;]\s*')
 
-strain_allele_outfile = outdir / 'strain_allele.csv'
-strain_allele_outfile_header = ['strain_original_line_number', 'strain_name', 'chromosome',
-                                'alleleset_binaryid', #alleleset_binaryid is either 1 or 2
-                                'allele_name', 'gene_name', 'heterozygous',
-                                'source', 'other_name', 'comment']  
 
-allele_outfile = outdir / 'allele.csv'
-allele_outfile_header = ['allele_original_line_number', 'allele_name', 'allele_type', 'gene_name', 'plasmid_name', 'comment']
+def null_fields(r):  # strip fields, replacing empty fields with 'NULL'
+    return [x.strip() if x != '' or None else 'NULL' for x in r]
 
-def normalize_strain(): # Normalize strain table (i.e., flatten genotype dict)
-
-    mkparent(strain_allele_outfile)
-    with open(strain_file, 'r') as strain_fin, \
-         open(strain_allele_outfile, 'w') as strain_allele_fout:
-         
-        strain_reader        = get_reader(strain_fin)
-        strain_allele_writer = get_writer(strain_allele_fout)
-
-        strain_allele_writer.writerow(strain_allele_outfile_header)
-
-        if DEBUG: print(strain_allele_outfile_header)
-        
-        next(strain_reader) #skip header line
-        rows_processed = 0
-        for r in strain_reader:
-            rows_processed += 1
-            r = [x.strip() for x in r] 
-
-            strain_original_line_number = r[0]
-            strain_name = r[1]
-            genotype = ast.literal_eval(r[2]) if r[2] != 'NULL' else None
-            source = r[3]
-            other_names = r[4]
-            comment = r[5]
 
-            if DEBUG and strain_original_line_number != str(debug_line_number): continue
-
-            if DEBUG: print('strain_original_line_number: ' + strain_original_line_number)
-            if DEBUG: print('genotype: ' + str(genotype))
-
-            if genotype is None:
-                tablerow = [strain_original_line_number, strain_name] + 5*['NULL'] + [source, other_names, comment]
-                strain_allele_writer.writerow(tablerow)
-                continue
-
-            #write one row in strain_allele file for each allele in each alleleset in genotype
-            for g in genotype:
-
-                allelesets_list = list(g['allelesets'].values())
-                chromosome = g['chromosome'] if g['chromosome'] else 'NULL'
-
-                #make first pass to retrieve alleleset membership in order to verify heterzygosity in second pass
-                nameslist = [[], []]
-                for i in range(0,len(allelesets_list)):
-                    aset = allelesets_list[i]
-                    for allele in aset:
-                        nameslist[i].append(allele['allele_name'])
-
-                #iterate over allelesets, writing rows to CSV file
-                for i in range(0,len(allelesets_list)):
-                    aset = allelesets_list[i]
-                    aset_binaryid = i + 1
-                    for allele in aset:
-                        allele_name = allele['allele_name']
-                        gene_name = allele['gene_name'] if 'gene_name' in allele.keys() else 'NULL'
-                        heterozygous = int(allele['heterozygous']) # cast to int for MySQL tinyint "boolean"
-
-                        # verify heterozygosity by checking if allele name appears in opposing allele set
-                        if i == 0: 
-                            if allele_name in nameslist[1]: heterozygous = int(False)
-                        elif i == 1:
-                            if allele_name in nameslist[0]: heterozygous = int(False)
-                            
-                        tablerow = [strain_original_line_number, strain_name, chromosome,
-                                    aset_binaryid, allele_name, gene_name, heterozygous,
-                                    other_names, source, comment]
-                        
-                        if DEBUG: print(tablerow)
-                        strain_allele_writer.writerow(tablerow)
-
-
-def normalize_allele(): #Normalize allele table (split plasmid list into separate rows in table)
-
-    mkparent(allele_outfile)
-    with open(allele_file, 'r') as allele_fobj, \
-         open(allele_outfile, 'w') as allele_outfile_fobj:
-
-        allele_reader = get_reader(allele_fobj)
-        allele_writer  = get_writer(allele_outfile_fobj)
-
-        allele_writer.writerow(allele_outfile_header)
-        if DEBUG: print(allele_outfile_header)
-        
-        next(allele_reader) #skip header line
-        rows_processed = 0
-        for r in allele_reader:
-            rows_processed += 1
-            r = [x.strip() if x != '' or None else 'NULL' for x in r] 
+def debug_skip(original_line_number):  # when debugging, only process debug_line_number
+    return DEBUG and str(original_line_number) != str(debug_line_number)
+
+
+class DecodeStrain:  # parse stage for rows of filter/strain.csv: rebuild Genotype from its Python-literal column
+
+    def __call__(self, records):
+        for rec in records:
+            r = rec.raw
+            rec.genotype = Genotype.from_dicts(ast.literal_eval(r[2])) if r[2] != 'NULL' else None
+            rec.row = r
+            yield rec
+
+
+class DecodedStrain:  # parse stage for rows of filter/strain.col, whose genotype column is already decoded from json
+
+    def __call__(self, records):
+        for rec in records:
+            rec.genotype = Genotype.from_dicts(rec.raw[2])
+            rec.row = rec.raw
+            yield rec
+
+
+class NormalizeStrain:  # normalize stage: flatten each strain's genotype into strain_allele rows
+
+    def __call__(self, records):
+        for rec in records:
+            if rec.failed: continue
+
+            (strain_original_line_number, strain_name, _, source, other_names, comment) = rec.row
+
+            if debug_skip(strain_original_line_number): continue
+
+            if DEBUG: print('strain_original_line_number: ' + str(strain_original_line_number))
+            if DEBUG: print('genotype: ' + str(rec.genotype))
+
+            #yield one row in strain_allele table for each allele in each alleleset in genotype
+            for tablerow in strain_allele_rows(strain_original_line_number, strain_name, rec.genotype, source, other_names, comment):
+                if DEBUG: print(tablerow)
+                yield Record(rec.linenum, rec.raw, tablerow)
+
+
+class NormalizeAllele:  # normalize stage: split each allele's plasmid list into separate rows
+
+    def __call__(self, records):
+        for rec in records:
+            if rec.failed: continue
+            r = rec.raw
 
             allele_original_line_number = r[0]
             allele_name = r[1]
-            allele_type = r[2]            
+            allele_type = r[2]
             gene_name = r[3]
-            plasmids = r[4]     
+            plasmids = r[4]
             comment = r[5]
 
-            if DEBUG and allele_original_line_number != str(debug_line_number): continue
+            if debug_skip(allele_original_line_number): continue
 
             #split plasmid list
-            plasmid_list = re.split(r'\s*[,;]\s*', plasmids)
+            plasmid_list = plasmid_sep_re.split(plasmids)
             for plasmid in plasmid_list:
-                allele_writer.writerow([allele_original_line_number, allele_name, allele_type, gene_name, plasmid, comment])
-
-            
-normalize_strain();
-normalize_allele();
+                yield Record(rec.linenum, r, [allele_original_line_number, allele_name, allele_type, gene_name, plasmid, comment])
+
+
+def normalize_strain(config): # Normalize strain table (i.e., flatten genotype dict)
+    if config.table_files:
+        read = [ReadTable(table_path(config.filter_dir / 'strain.csv')), DecodedStrain()]
+    else:
+        read = [ReadCSV(config.filter_dir / 'strain.csv'), DecodeStrain()]
+    Pipeline(*read,
+             NormalizeStrain(),
+             *output_stages(config, config.normalize_dir / 'strain_allele.csv', strain_allele_outfile_header)).run()
+
+
+def normalize_allele(config): #Normalize allele table (split plasmid list into separate rows in table)
+    if config.table_files:
+        read = ReadTable(table_path(config.filter_dir / 'allele.csv'), replace={'': 'NULL'})
+    else:
+        read = ReadCSV(config.filter_dir / 'allele.csv', clean=null_fields)
+    Pipeline(read,
+             NormalizeAllele(),
+             *output_stages(config, config.normalize_dir / 'allele.csv', allele_outfile_header)).run()
+
+
+def normalize_all(config):  # run the normalize stage for strain and allele tables, then check references and write the strain and search index files
+    if not config.combined_filter_normalize:  # in combined mode, the filter stage already wrote strain_allele.csv
+        with instrument.step('normalize.strain'):
+            normalize_strain(config)
+    with instrument.step('normalize.allele'):
+        normalize_allele(config)
+    if config.validate_references:
+        with instrument.step('validate_references'):
+            validate_references(config)
+    if config.write_index:
+        with instrument.step('write_index'):
+            write_index(config)
+    if config.write_search_index:
+        with instrument.step('write_search_index'):
+            write_search_index(config)
+    if config.write_db_tables:
+        with instrument.step('db_tables'):
+            write_db_tables(config)
+    if config.write_sqlite:
+        with instrument.step('sqlite'):
+            build_sqlite_db(config)
+
+
+if __name__ == '__main__':
+    normalize_all(load_config())
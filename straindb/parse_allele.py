@@ -4,39 +4,50 @@ import re
 
 DEBUG = False
 
-def parse_allele(allele_name):
-
-    if DEBUG: print('\nAllele: ' + allele_name)
-
-    allele_type = 'other'
-    err_key = None
-
-    if allele_name == '' or not re.match(r'^([a-zA-Z]+[0-9]+[a-z]*)+$', allele_name):
-
-        err_key = 'invalid_allele_name'
-        return (None, None, err_key)
+# Valid allele names are runs of letters and digits, optionally ending in a lowercase suffix. One pass of
+# this pattern removes the suffix and finds the type: the first alternative matching the name is its type.
+allele_re = re.compile(r'''
+    (?: (?P<mutant>(?:[a-z]{1,3}[0-9]+)+)                 # e.g. e1370, tm290
+      | (?P<transgene>[a-z]{1,3}(?:Ex|Is|Si)[0-9]+)        # e.g. nsIs53, kyEx1234
+      | (?P<rearrangement>[a-z]{1,3}(?:T|C|In|Df)[0-9]+)   # e.g. mIn1, hT2, nDf40
+      | (?P<other>(?:[a-zA-Z]+[0-9]+)+)
+    )
+    [a-z]*                                                 # suffix, removed from the name
+''', re.VERBOSE)
+
+
+class AlleleClassifier:  # parse_allele with one compiled pattern; classify_many memoizes results per distinct name
+
+    def __init__(self):
+        self.memo = {}
+        self.memo_hits = 0
+
+    @staticmethod
+    def classify(allele_name):  # (allele name without suffix, allele type, None), or (None, None, 'invalid_allele_name'); allele_name must be stripped
+        m = allele_re.fullmatch(allele_name)
+        if m is None:
+            return (None, None, 'invalid_allele_name')
+        return (m.group(m.lastgroup), m.lastgroup, None)
+
+    def classify_many(self, allele_names):  # list of classify results, in order
+        memo = self.memo
+        results = []
+        for allele_name in allele_names:
+            result = memo.get(allele_name)
+            if result is None:
+                result = memo[allele_name] = self.classify(allele_name)
+            else:
+                self.memo_hits += 1
+            results.append(result)
+        return results
 
-    # Remove any non-numeric suffix characters
-    allele_name = re.sub(r'[a-z]+$','',allele_name)
 
-    # Determine allele type
-    if re.match(r'^([a-z]{1,3}[0-9]+)+$', allele_name):
-
-        allele_type = 'mutant'
-        
-    elif re.match(r'^[a-z]{1,3}(Ex|Is|Si)[0-9]+$', allele_name):
-
-        allele_type = 'transgene'
-
-    elif re.match(r'^[a-z]{1,3}(T|C|In|Df)[0-9]+$', allele_name):
+def parse_allele(allele_name):
 
-         allele_type = 'rearrangement'
+    if DEBUG: print('\nAllele: ' + allele_name)
 
-    else:
-        
-        allele_type = 'other'
+    (allele_name, allele_type, err_key) = AlleleClassifier.classify(allele_name)
 
-    if DEBUG: print(f'allele_type: {allele_type}')
+    if DEBUG and err_key is None: print(f'allele_type: {allele_type}')
 
     return (allele_name, allele_type, err_key)
-    
@@ -0,0 +1,72 @@
+''' Normalize date string (e.g., "3/4/2019", "March 4, 2019") to YYYY-M-D '''
+
+import datetime, re
+from dateutil.parser import parse, parserinfo
+
+DEBUG = False
+
+month_names = parserinfo()  # month name lookup used by dateutil, so strict formats agree with fuzzy parsing
+
+# Strict formats tried before fuzzy parsing, with the order of (year, month, day) groups.
+# Month-first order matches dateutil's default (dayfirst=False); years below 1000 are left to
+# dateutil, which reads them relative to the current century.
+strict_formats = [
+    (re.compile(r'^([1-9][0-9]{3})-([0-9]{1,2})-([0-9]{1,2})$'), 'ymd'),  # 2019-03-04
+    (re.compile(r'^([1-9][0-9]{3})/([0-9]{1,2})/([0-9]{1,2})$'), 'ymd'),  # 2019/03/04
+    (re.compile(r'^([0-9]{1,2})/([0-9]{1,2})/([1-9][0-9]{3})$'), 'mdy'),  # 3/4/2019
+    (re.compile(r'^([0-9]{1,2})-([0-9]{1,2})-([1-9][0-9]{3})$'), 'mdy'),  # 3-4-2019
+    (re.compile(r'^([0-9]{1,2}) ([A-Za-z]+),? ([1-9][0-9]{3})$'), 'dmy'),  # 4 March 2019
+    (re.compile(r'^([A-Za-z]+) ([0-9]{1,2}),? ([1-9][0-9]{3})$'), 'mdy'),  # March 4, 2019
+]
+
+
+def parse_strict(date):  # return datetime.date, or None if date matches no strict format
+    for (regex, order) in strict_formats:
+        if m := regex.match(date):
+            fields = dict(zip(order, m.groups()))
+            month = fields['m']
+            month = int(month) if month.isdigit() else month_names.month(month)
+            if month is None:
+                return None
+            try:
+                return datetime.date(int(fields['y']), month, int(fields['d']))
+            except ValueError:  # e.g. 13/4/2019, which dateutil reads day first
+                return None
+    return None
+
+
+class DateParser:  # normalizes date strings, memoizing results per distinct string
+
+    def __init__(self):
+        self.memo = {}
+        self.memo_hits = 0    # dates already seen
+        self.strict_hits = 0  # new dates matching a strict format
+        self.fuzzy_parses = 0 # new dates needing fuzzy parsing
+
+    def parse(self, date):  # return date as YYYY-M-D, or None if it cannot be parsed
+
+        if date in self.memo:
+            self.memo_hits += 1
+            return self.memo[date]
+
+        dt = parse_strict(date)
+        if dt is not None:
+            self.strict_hits += 1
+        else:
+            self.fuzzy_parses += 1
+            try:
+                dt = parse(date, fuzzy=True)
+            except (ValueError, OverflowError):  # dateutil's ParserError is a ValueError
+                if DEBUG: print(f'Could not parse date: {date}')
+                dt = None
+
+        normalized = f'{dt.year}-{dt.month}-{dt.day}' if dt is not None else None
+        self.memo[date] = normalized
+        return normalized
+
+    def num_parsed(self):
+        return self.memo_hits + self.strict_hits + self.fuzzy_parses
+
+    def fast_path_rate(self):  # fraction of dates resolved without fuzzy parsing
+        num_parsed = self.num_parsed()
+        return (num_parsed - self.fuzzy_parses) / num_parsed if num_parsed else 1.0
@@ -1,92 +1,142 @@
 ''' Parse genotype string (e.g., "tm290/e189 III; nsIs53 IV; kyIs136 X") '''
 
-from copy import deepcopy
+from collections import OrderedDict
 import re
 import json
+from straindb.genotype_model import Genotype
 
 DEBUG = False
 TEST = False
 
-genotype_item = {'chromosome': None,
-                 'allelesets': {}
-                 }
+CACHE_SIZE = 10000  # max number of distinct normalized genotype strings memoized by a GenotypeParser
+
+# Genotype grammar, compiled once at import
+bracket_re     = re.compile(r'\[.*?\]')          # bracketed substrings (may contain plasmid name, plasmid expanded name, etc)
+line_number_re = re.compile(r'\(line [0-9]+\)')  # substrings denoting line number
+item_sep_re    = re.compile(r'\s*;\s*')          # separates genotype subunits
+item_re        = re.compile(r'^(?P<nonchr>[-+.)(a-zA-Z0-9\s/]+?)\s*(?P<chr>I|II|III|IV|V|X)?$')  # subunit, with optional chromosome name
+aset_sep_re    = re.compile(r'\s*/\s*')          # separates allele sets
+allele_re      = re.compile(r'(?P<gene>[-.a-zA-Z0-9]+)\s*\((?P<allele_of_gene>[-a-zA-Z0-9]+)\)|(?P<allele>[-a-zA-Z0-9]+)')  # allele, potentially with a gene name
+
 
 def gprint(genotype):
     print('Parsed:\n' + json.dumps(genotype, indent=4) + '\n')
 
-def parse_genotype(genotype_str):
 
-    genotype = []
+class GenotypeParser:  # parses genotype strings, memoizing compact Genotypes in a bounded LRU cache keyed on the normalized string
+
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.alleles = {}  # allele table of the cached Genotypes (see genotype_model)
+        self.hits = 0
+        self.misses = 0
+
+    def cache_info(self):
+        return OrderedDict([('hits', self.hits), ('misses', self.misses),
+                            ('size', len(self.cache)), ('cache_size', self.cache_size)])
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.alleles.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def normalize(self, genotype_str):  # strip whitespace, bracketed substrings and line number annotations
+        genotype_str = genotype_str.strip()
+        genotype_str = bracket_re.sub('', genotype_str)
+        return line_number_re.sub('', genotype_str)
+
+    def parse(self, genotype_str):  # return list of genotype subunit dicts, or None if genotype could not be parsed
+        # Builds new dicts on every call, cache hits included (so callers cannot alter memoized results),
+        # which costs about as much as a cache hit saves: use parse_compact where a Genotype will do
+        genotype = self.parse_compact(genotype_str)
+        return genotype.to_dicts() if genotype is not None else None
+
+    def parse_compact(self, genotype_str):  # return Genotype (shared, do not modify), or None if genotype could not be parsed
+
+        if DEBUG: print('\nGenotype String: ' + genotype_str.strip())
 
-    genotype_str = genotype_str.strip()
+        key = self.normalize(genotype_str)
 
-    if DEBUG: print('\nGenotype String: ' + genotype_str)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            genotype = self.cache[key]
+        else:
+            self.misses += 1
+            genotype = Genotype.from_dicts(self.parse_normalized(key), self.alleles)
+            self.cache[key] = genotype
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)  # evict least recently used genotype
 
-    # Remove bracketed substrings (may contain plasmid name, plasmid expanded name, etc)
-    genotype_str = re.sub(r'\[.*?\]', '', genotype_str)
+        if DEBUG and genotype is not None: gprint(genotype.to_dicts())
 
-    # Remove substrings denoting line number
-    genotype_str = re.sub(r'\(line [0-9]+\)', '', genotype_str)
+        return genotype
 
-    # Split genotype string into subunits
-    genotype_item_strs = re.split(r'\s*;\s*', genotype_str)
+    def parse_normalized(self, genotype_str):  # parse genotype string already passed through normalize()
 
-    # Iterate over genotype subunits
-    for item_str in genotype_item_strs:
+        genotype = []
 
-        if DEBUG: print('  Item: ' + item_str)
+        # Iterate over genotype subunits
+        for item_str in item_sep_re.split(genotype_str):
 
-        item = deepcopy(genotype_item)
+            if DEBUG: print('  Item: ' + item_str)
 
-        # capture chromosome name, if present
-        if m := re.match(r'^(?P<nonchr>[-+.)(a-zA-Z0-9\s/]+?)\s*(?P<chr>I|II|III|IV|V|X)?$', item_str):
-            chr = item_str[m.start('chr'):m.end('chr')]
-            nonchr = item_str[m.start('nonchr'):m.end('nonchr')]
-            if DEBUG: print(f'    chr: __{chr}__')            
+            m = item_re.match(item_str)
+            if not m:  # genotype item could not be parsed
+                if DEBUG: print('Genotype could not be parsed')
+                return None  # failure return value
+
+            item = {'chromosome': None,
+                    'allelesets': {}
+                    }
+
+            # capture chromosome name, if present
+            chr = m.group('chr') or ''
+            nonchr = m.group('nonchr')
+            if DEBUG: print(f'    chr: __{chr}__')
             if DEBUG: print(f'    nonchr: __{nonchr}__')
 
             if chr:
                 item['chromosome'] = chr
 
-            asets_list = re.split(r'\s*/\s*', nonchr) # seperate allele sets, if needed
+            asets_list = aset_sep_re.split(nonchr)  # seperate allele sets, if needed
 
             heterozygous = False
             if len(asets_list) == 2:
                 heterozygous = True
                 if '+' in asets_list: asets_list.remove('+')  # do not track wild type allele
 
-            for i in range(0,len(asets_list)):  # asets_list is length 1 or 2
-                aset_str = asets_list[i]
-                item['allelesets']['alleleset' + str(i+1)] = []
+            for i in range(0, len(asets_list)):  # asets_list is length 1 or 2
+                aset = []
+                item['allelesets']['alleleset' + str(i+1)] = aset
 
                 # list of alleles, each potentially with a gene name
-                regex = re.compile(r'(?P<gene>[-.a-zA-Z0-9]+)\s*\((?P<allele_of_gene>[-a-zA-Z0-9]+)\)|(?P<allele>[-a-zA-Z0-9]+)')
-                for m in regex.finditer(aset_str):
-                    allele_dict = {}
-                   
-                    match_dict = m.groupdict()
-                    if match_dict['allele']:
-                        allele_dict['allele_name'] = match_dict['allele']
-                    elif match_dict['allele_of_gene']:
-                        allele_dict['allele_name'] = match_dict['allele_of_gene']
-                        allele_dict['gene_name'] = match_dict['gene']                        
-                        
-                    if allele_dict:
-                        allele_dict['heterozygous'] = heterozygous
-                        item['allelesets']['alleleset' + str(i+1)].append(allele_dict)
+                for m in allele_re.finditer(asets_list[i]):
+                    allele_of_gene = m.group('allele_of_gene')
+                    if allele := m.group('allele'):
+                        aset.append({'allele_name': allele, 'heterozygous': heterozygous})
+                    elif allele_of_gene:
+                        aset.append({'allele_name': allele_of_gene, 'gene_name': m.group('gene'), 'heterozygous': heterozygous})
 
             genotype.append(item)
-            
-        else:  #genotype item could not be parsed
-            if DEBUG: print('Genotype could not be parsed')
-            return None #failure return value
-            
-    if DEBUG: gprint(genotype)
 
-    return genotype  #dict
+        return genotype
+
+
+default_parser = GenotypeParser()
+
 
+def parse_genotype(genotype_str):  # parse genotype string with the shared, memoizing default_parser
+    return default_parser.parse(genotype_str)
 
-if TEST:    
+
+def parse_genotype_compact(genotype_str):  # parse_genotype, returning the shared Genotype of default_parser's cache (do not modify)
+    return default_parser.parse_compact(genotype_str)
+
+
+if TEST:
     gens = [
         'e123/dec-2(e200) e321 X',
         'ced-3 (n717) IV; ok700/nT1 (qIs51); bec-1',
@@ -95,4 +145,3 @@ if TEST:
 
     for gen in gens:
         parse_genotype(gen)
-
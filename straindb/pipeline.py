@@ -0,0 +1,247 @@
+''' Streaming pipeline API
+
+A pipeline is a source stage (e.g., ReadCSV) followed by stages that each consume and
+yield Records: read -> validate -> parse -> normalize -> sink. Records are processed
+one at a time, so memory use does not grow with the size of the input (apart from the
+names held for duplicate detection). Table-specific stages live in filter_csv.py and
+normalize_csv.py.
+
+In columnar mode, ReadCSVBatches yields Batches of rows instead, and the first stage
+works a column at a time before turning each Batch into Records for the stages after it.
+Only the columns a stage uses are stripped; the raw fields of a Record are filled in
+when it fails.
+'''
+
+from collections import OrderedDict
+from copy import copy
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+from straindb import instrument
+from straindb.fileio import get_reader, get_writer, mkparent
+from straindb.table_file import TableFile, TableWriter, table_path
+
+WRITE_BUFFER_SIZE = 1 << 20  # bytes buffered by each output file, so rows reach the disk in large writes
+
+
+class Record:  # one row of a table flowing through a pipeline
+
+    __slots__ = ('linenum', 'raw', 'row', 'genotype', 'failed')
+
+    def __init__(self, linenum, raw, row=None, genotype=None, failed=False):
+        self.linenum = linenum    # line number in the stage's input file
+        self.raw = raw            # input fields, written to error files on failure
+        self.row = row            # output fields, set by validate and normalize stages
+        self.genotype = genotype  # parsed genotype (strain tables only)
+        self.failed = failed      # failed records are passed along (so later stages can log errors) but never written
+
+
+def strip_fields(r):
+    return [x.strip() for x in r]
+
+
+class ReadCSV:  # source stage: yield a Record for each data row of a CSV file
+
+    def __init__(self, csvfile, clean=strip_fields, limit=None):
+        self.csvfile = Path(csvfile)
+        self.clean = clean  # applied to the fields of each row
+        self.limit = limit  # maximum number of rows to read (None for no limit)
+        self.rows_read = 0
+        with open(self.csvfile, 'r') as f:
+            self.header = next(get_reader(f))
+
+    def __iter__(self):
+        with open(self.csvfile, 'r') as fin:
+            reader = get_reader(fin)
+            next(reader) # skip header line
+            linenum = 1
+            for r in reader:
+                linenum += 1
+                self.rows_read += 1
+                yield Record(linenum, self.clean(r))
+                if self.limit is not None and self.rows_read >= self.limit: break
+
+
+class Batch:  # consecutive rows of a CSV file; fields are stripped a column at a time, as columns are used
+
+    __slots__ = ('linenum', 'rows')
+
+    def __init__(self, linenum, rows):  # linenum: line number of the first row
+        self.linenum = linenum
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, i):  # stripped i-th field of each row
+        return list(map(str.strip, map(itemgetter(i), self.rows)))
+
+    def records(self):  # a Record for each row, without raw fields until with_raw() is called
+        return (Record(linenum, None) for linenum in range(self.linenum, self.linenum + len(self.rows)))
+
+    def with_raw(self, rec):  # rec, with the stripped fields of its row as raw fields (e.g. before it is written to an error file)
+        if rec.raw is None:
+            rec.raw = strip_fields(self.rows[rec.linenum - self.linenum])
+        return rec
+
+
+class ReadCSVBatches(ReadCSV):  # source stage for columnar stages: yield a Batch of up to batch_size data rows at a time
+
+    def __init__(self, csvfile, batch_size=2000, limit=None):
+        super().__init__(csvfile, limit=limit)
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        with open(self.csvfile, 'r') as fin:
+            reader = get_reader(fin)
+            next(reader) # skip header line
+            linenum = 2
+            while True:
+                size = self.batch_size
+                if self.limit is not None: size = min(size, self.limit - self.rows_read)
+                rows = list(islice(reader, size))
+                if not rows: break
+                self.rows_read += len(rows)
+                yield Batch(linenum, rows)
+                linenum += len(rows)
+
+
+class WriteCSV:  # sink stage: write each successful Record to a CSV file, then pass it downstream
+
+    def __init__(self, csvfile, header, format=None):
+        self.csvfile = Path(csvfile)
+        self.header = header
+        self.format = format  # function mapping a Record to its output row (default: Record.row)
+        self.rows_written = 0
+
+    def __call__(self, records):
+        mkparent(self.csvfile)
+        with open(self.csvfile, 'w', buffering=WRITE_BUFFER_SIZE) as fout:
+            writer = get_writer(fout)
+            writer.writerow(self.header)
+            for rec in records:
+                if not rec.failed:
+                    writer.writerow(self.format(rec) if self.format else rec.row)
+                    self.rows_written += 1
+                yield rec
+
+
+class ReadTable:  # source stage: yield a Record for each row of a table file (see table_file.py), numbered as in the CSV file
+
+    def __init__(self, path, clean=None, replace=None):
+        self.table = TableFile(path)
+        self.clean = clean  # applied to the fields of each row (table files hold stripped fields)
+        self.replace = replace  # field -> value, applied once to each distinct value of a column (e.g. {'NULL': None}) rather than to each row
+        self.header = self.table.header
+        self.rows_read = 0
+
+    def __iter__(self):
+        linenum = 1
+        clean = self.clean
+        for r in self.table.rows(self.replace):
+            linenum += 1
+            self.rows_read += 1
+            yield Record(linenum, clean(r) if clean else r)
+
+
+class WriteTable:  # sink stage: write each successful Record to a table file when the pipeline is drained, passing it downstream
+
+    def __init__(self, path, header, format=None, json_columns=()):
+        self.path = Path(path)
+        self.header = header
+        self.format = format  # function mapping a Record to its output row (default: Record.row)
+        self.json_columns = json_columns  # columns holding JSON-serializable values rather than CSV fields
+        self.rows_written = 0
+
+    def __call__(self, records):
+        writer = TableWriter(self.path, self.header, self.json_columns)
+        for rec in records:
+            if not rec.failed:
+                writer.writerow(self.format(rec) if self.format else rec.row)
+                self.rows_written += 1
+            yield rec
+        writer.close()
+
+
+def output_stages(config, csvfile, header, format=None, table_format=None, json_columns=()):  # sinks for a stage output: its CSV file, and its table file if config.table_files is set
+    stages = [WriteCSV(csvfile, header, format=format)]
+    if config.table_files:
+        stages += [WriteTable(table_path(csvfile), header, format=table_format or format, json_columns=json_columns)]
+    return stages
+
+
+class Pipeline:  # source followed by stages; iterate to stream Records out of the last stage
+
+    def __init__(self, source, *stages):
+        self.source = source
+        self.stages = list(stages)
+
+    def __iter__(self):
+        records = iter(self.source)
+        for stage in self.stages:
+            records = stage(records)
+        return records
+
+    def run(self):  # drain the pipeline, for pipelines that end in sink stages
+        if instrument.current is not None:  # time each stage
+            instrument.current.run_pipeline(self)
+            return
+        for _ in self:
+            pass
+
+
+def err_item(errdir, fileroot, err_name, extra_header=()):  #err_item is container for error file attributes
+    basename = fileroot + '.' + err_name + '.csv'  # name of error file
+    return (
+        OrderedDict(
+            [('file', Path(errdir) / basename),
+             ('err_count', 0),
+             ('extra_header', list(extra_header)),  # columns written between line number and raw row
+             ('writer', None)])
+    )
+
+
+class ErrorLog:  # error files for one table; use as a context manager around the pipeline run
+
+    def __init__(self, errdir, fileroot, raw_header):
+        self.errdir = Path(errdir)
+        self.fileroot = fileroot
+        self.raw_header = raw_header
+        self.err = OrderedDict()
+        self.fouts = []
+
+    def add(self, err_name, extra_header=()):  # define an error file
+        self.err[err_name] = err_item(self.errdir, self.fileroot, err_name, extra_header)
+
+    def add_duplicate(self, err_name):  # duplicate error files also record the line number of the first occurrence
+        self.add(err_name, extra_header=['First Seen Line Number'])
+
+    def __enter__(self):  # create each error file and write its header line
+        err_header = copy(self.raw_header)
+        err_header.insert(0,'Original Line Number')
+        for item in self.err.values():
+            errfile = item['file']
+            mkparent(errfile)
+            fout = open(errfile, 'w', buffering=WRITE_BUFFER_SIZE)
+            self.fouts.append(fout)
+            item['writer'] = get_writer(fout)
+            item['writer'].writerow(err_header[:1] + item['extra_header'] + err_header[1:])
+        return self
+
+    def __exit__(self, *exc):
+        for fout in self.fouts:
+            fout.close()
+        self.fouts = []
+
+    def __getitem__(self, err_name):
+        return self.err[err_name]
+
+    def count(self, err_name):
+        return self.err[err_name]['err_count']
+
+    def fail(self, err_name, rec, extra=(), reject=True):  # write failing row to error file; reject marks the Record failed
+        item = self.err[err_name]
+        item['err_count'] += 1
+        item['writer'].writerow([rec.linenum] + list(extra) + rec.raw)
+        if reject:
+            rec.failed = True
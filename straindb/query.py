@@ -0,0 +1,272 @@
+''' In-memory strain queries: AND/OR/NOT expressions over plasmid, allele, gene and chromosome names
+
+StrainIndex is built from the filter and normalize outputs, or mapped from the index file
+(normalize/strain_index.bin) that the normalize stage writes from them. It keeps the
+strains loaded by 4_load_db_tables.sql (strains with an allele missing from allele.csv, or
+an allele with a plasmid missing from plasmid.csv, are excluded), numbered in load order.
+Inverted indexes map each plasmid, allele, gene and chromosome name to a Bitmap of strain
+numbers, so queries are set operations instead of joins, e.g.
+
+    index = StrainIndex.from_config(load_config())
+    index.query('plasmid:pCY118 and plasmid:pCY168 and not plasmid:pCY155')
+'''
+
+import re, sys
+from array import array
+from collections import OrderedDict
+from straindb.config import load_config
+from straindb.load import read_rows
+from straindb.index_file import IndexFile, StaleIndexError, write_index_file
+from straindb.validate_references import References
+
+DEBUG = False
+
+FIELDS = ('plasmid', 'allele', 'gene', 'chromosome')
+
+token_re = re.compile(r'\s*(?:(?P<paren>[()])|(?P<term>(?P<field>[a-z]+):(?P<name>[^\s()]+))|(?P<op>[A-Za-z]+))')
+
+
+class Bitmap:  # set of strain numbers below n: a sorted array when sparse, an int bitset when dense (results of dense operands stay dense)
+
+    __slots__ = ('n', 'ids', 'bits')
+
+    def __init__(self, n, ids=None, bits=None):  # give exactly one of ids (sorted) or bits
+        self.n = n
+        self.ids = ids
+        self.bits = bits
+
+    @classmethod
+    def from_ids(cls, n, ids):  # ids must be sorted and distinct; a memoryview (e.g. of an index file) is used without copying
+        if cls.is_sparse(n, len(ids)):
+            return cls(n, ids=ids if isinstance(ids, memoryview) else array('I', ids))
+        return cls(n, bits=ids_to_bits(n, ids))
+
+    @staticmethod
+    def is_sparse(n, count):  # an array of count 4-byte ids is smaller than an n-bit bitset
+        return count * 32 < n
+
+    def as_bits(self):
+        return self.bits if self.bits is not None else ids_to_bits(self.n, self.ids)
+
+    def contains_all(self):  # membership test for many ids: returns a function of one id
+        if self.bits is None:
+            return set(self.ids).__contains__
+        bitset = self.bits.to_bytes((self.n + 7) // 8, 'little')
+        return lambda i: bitset[i >> 3] >> (i & 7) & 1
+
+    def __and__(self, other):
+        if self.bits is not None and other.bits is not None:
+            return Bitmap(self.n, bits=self.bits & other.bits)
+        sparse, other = (self, other) if self.bits is None else (other, self)
+        contains = other.contains_all()
+        return Bitmap(self.n, ids=array('I', [i for i in sparse.ids if contains(i)]))
+
+    def __or__(self, other):
+        if self.bits is None and other.bits is None:
+            return Bitmap.from_ids(self.n, sorted(set(self.ids) | set(other.ids)))
+        return Bitmap(self.n, bits=self.as_bits() | other.as_bits())
+
+    def __sub__(self, other):
+        if self.bits is None:
+            contains = other.contains_all()
+            return Bitmap(self.n, ids=array('I', [i for i in self.ids if not contains(i)]))
+        return Bitmap(self.n, bits=self.bits & ~other.as_bits())
+
+    def __iter__(self):
+        return iter(self.ids) if self.bits is None else iter_bits(self.bits, self.n)
+
+    def __len__(self):
+        return len(self.ids) if self.bits is None else bin(self.bits).count('1')
+
+
+def ids_to_bits(n, ids):
+    bitset = bytearray((n + 7) // 8)
+    for i in ids:
+        bitset[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bitset, 'little')
+
+
+def iter_bits(bits, n):  # positions of set bits, in increasing order
+    bitset = bits.to_bytes((n + 63) // 64 * 8, 'little')
+    for word_index in range(len(bitset) // 8):
+        word = int.from_bytes(bitset[word_index * 8:word_index * 8 + 8], 'little')
+        while word:
+            low = word & -word
+            yield word_index * 64 + low.bit_length() - 1
+            word ^= low
+
+
+def strain_postings(strain_allele_rows, allele_rows, plasmid_names):  # loaded strain names, and field -> name -> strain numbers
+
+    # Strains, with their strain_allele rows; a strain fails if any of its references fails (see validate_references)
+    references = References(allele_rows, plasmid_names)
+    strain_rows = OrderedDict()
+    failed = set()
+    for r in strain_allele_rows:
+        strain_rows.setdefault(r[1], []).append(r)
+        if references.check(r[0], r[1], r[4]) is not None:
+            failed.add(r[1])
+
+    strain_names = [name for name in strain_rows if name not in failed]
+    postings = OrderedDict((field, OrderedDict()) for field in FIELDS)
+
+    def post(field, name, strain_id):
+        ids = postings[field].setdefault(name, [])
+        if not ids or ids[-1] != strain_id:
+            ids.append(strain_id)
+
+    allele_gene = {}  # gene of each allele: from the first strain_allele row using it, else from allele.csv
+    for strain_id, strain_name in enumerate(strain_names):
+        for (_, _, chromosome, _, allele_name, gene_name, _, _, _, _) in strain_rows[strain_name]:
+            if allele_name is None:
+                continue
+            if allele_name not in allele_gene:
+                allele_gene[allele_name] = gene_name if gene_name is not None else references.first_allele[allele_name][3]
+            post('allele', allele_name, strain_id)
+            if chromosome is not None:
+                post('chromosome', chromosome, strain_id)
+            if allele_gene[allele_name] is not None:
+                post('gene', allele_gene[allele_name], strain_id)
+            for plasmid_name in references.allele_plasmids[allele_name]:
+                post('plasmid', plasmid_name, strain_id)
+
+    return strain_names, postings
+
+
+def index_sources(config):  # CSV files an index is built from
+    return [config.filter_dir / 'plasmid.csv', config.normalize_dir / 'allele.csv', config.normalize_dir / 'strain_allele.csv']
+
+
+def index_path(config):
+    return config.normalize_dir / 'strain_index.bin'
+
+
+def read_postings(config):  # strain_postings of the filter and normalize outputs
+    plasmid_csv, allele_csv, strain_allele_csv = index_sources(config)
+    return strain_postings(read_rows(strain_allele_csv), read_rows(allele_csv), (r[1] for r in read_rows(plasmid_csv)))
+
+
+def write_index(config):  # write normalize/strain_index.bin from the filter and normalize outputs
+    write_index_file(index_path(config), *read_postings(config), index_sources(config))
+
+
+class StrainIndex:  # strain names and inverted indexes from plasmid, allele, gene and chromosome names to strain Bitmaps
+
+    def __init__(self, strain_names, postings, index_file=None):  # postings: field -> name -> sorted strain numbers
+        self.strain_names = strain_names
+        self.postings = postings
+        self.index_file = index_file  # IndexFile that strain_names and postings point into, if any
+        self.bitmaps = {}  # (field, name) -> Bitmap, built on first use
+        n = len(strain_names)
+        self.all = Bitmap(n, bits=(1 << n) - 1)
+        self.none = Bitmap(n, ids=array('I'))
+
+    @classmethod
+    def from_rows(cls, strain_allele_rows, allele_rows, plasmid_names):  # rows as in normalize outputs, with None for NULL
+        return cls(*strain_postings(strain_allele_rows, allele_rows, plasmid_names))
+
+    @classmethod
+    def from_index_file(cls, path):
+        index_file = IndexFile(path)
+        return cls(index_file.strain_names, index_file.postings, index_file)
+
+    @classmethod
+    def from_config(cls, config):  # map normalize/strain_index.bin, or read the CSVs if it is missing or stale
+        try:
+            index = cls.from_index_file(index_path(config))
+            index.index_file.check_sources(index_sources(config))
+            return index
+        except (FileNotFoundError, StaleIndexError) as e:
+            if DEBUG: print(f'Reading CSVs: {e}')
+            return cls(*read_postings(config))
+
+    def strains(self, field, name):  # Bitmap of strains with the named plasmid, allele, gene or chromosome
+        if field not in self.postings:
+            raise ValueError(f'Unknown field: {field} (expected one of {", ".join(FIELDS)})')
+        bitmap = self.bitmaps.get((field, name))
+        if bitmap is None:
+            ids = self.postings[field].get(name)
+            bitmap = self.bitmaps[field, name] = Bitmap.from_ids(len(self.strain_names), ids) if ids is not None else self.none
+        return bitmap
+
+    def names(self, bitmap):  # strain names, in load order
+        return [self.strain_names[i] for i in bitmap]
+
+    def evaluate(self, expression):  # Bitmap of strains matching expression, e.g. "allele:mIn1 and not allele:ia4"
+        return QueryParser(self, expression).parse()
+
+    def query(self, expression):
+        return self.names(self.evaluate(expression))
+
+
+class QueryParser:  # recursive descent parser: expr := term (or term)*, term := factor (and factor)*, factor := not factor | ( expr ) | field:name
+
+    def __init__(self, index, expression):
+        self.index = index
+        self.tokens = self.tokenize(expression)
+        self.pos = 0
+
+    @staticmethod
+    def tokenize(expression):
+        tokens = []
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            m = token_re.match(expression, pos)
+            if not m:
+                raise ValueError(f'Cannot parse query at: {expression[pos:]}')
+            if m.group('op') and m.group('op').lower() not in ('and', 'or', 'not'):
+                raise ValueError(f'Expected and, or, not or field:name, got: {m.group("op")}')
+            tokens.append(m.group('paren') or (m.group('op') or '').lower() or (m.group('field'), m.group('name')))
+            pos = m.end()
+        return tokens
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def parse(self):
+        result = self.expr()
+        if self.peek() is not None:
+            raise ValueError(f'Unexpected token: {self.peek()}')
+        return result
+
+    def expr(self):
+        result = self.term()
+        while self.peek() == 'or':
+            self.take()
+            result = result | self.term()
+        return result
+
+    def term(self):
+        result = self.factor()
+        while self.peek() == 'and':
+            self.take()
+            if self.peek() == 'not':  # "a and not b" as a set difference
+                self.take()
+                result = result - self.factor()
+            else:
+                result = result & self.factor()
+        return result
+
+    def factor(self):
+        token = self.take() if self.peek() is not None else None
+        if token == 'not':
+            return self.index.all - self.factor()
+        if token == '(':
+            result = self.expr()
+            if self.peek() != ')':
+                raise ValueError('Expected )')
+            self.take()
+            return result
+        if isinstance(token, tuple):
+            return self.index.strains(*token)
+        raise ValueError(f'Expected not, ( or field:name, got: {token}')
+
+
+if __name__ == '__main__':
+    for name in StrainIndex.from_config(load_config()).query(' '.join(sys.argv[1:])):
+        print(name)
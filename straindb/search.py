@@ -0,0 +1,287 @@
+''' Trigram index for substring and fuzzy search over allele, gene and plasmid names, expanded names and genotypes
+
+Curators search for fragments ("Is53", "dec-2", part of an expanded name), which in SQL are
+like '%...%' scans of allele.name, plasmid.expanded_name and the strain_view columns. The search
+index maps each trigram (three consecutive characters of a lowercased term, padded with PAD at
+both ends) to the terms containing it, and each term to the strains it occurs in:
+
+    allele, gene, plasmid   names, with their strains as in StrainIndex (query.strain_postings)
+    expanded_name           plasmid expanded names, with the strains of their plasmids
+    genotype                genotype strings of the raw strain CSV, with their strain
+
+A substring query intersects the two shortest posting lists among its trigrams and checks the
+text of each term left; a query of one or two characters, which has no trigram, checks every
+term. The lowercased, padded text of every term is computed once, when the index is opened
+(about 0.3 seconds for 200000 strains). A fuzzy query (edit distance at most max_distance, over
+names) splits the padded query into max_distance + 1 pieces, one of which occurs unchanged in
+any match, and computes a bounded edit distance for the terms containing a piece. Matching
+terms are ranked (exact, prefix, then other substring matches, or by edit distance; then by
+field, length and name) and their strains are returned in that order, as strain ids:
+StrainIndex strain numbers + 1, the ids straindb.db_tables assigns. Case is ignored.
+
+The normalize stage writes the index to normalize/search_index.bin, in the format of
+straindb.index_file (with a 'trigram' field of term ids instead of strain numbers), e.g.
+
+    index = SearchIndex.from_config(load_config())
+    index.names(index.substring('Is53'))
+    index.names(index.fuzzy('dec-3', max_distance=1))
+'''
+
+import sys
+from collections import OrderedDict
+from operator import itemgetter
+from straindb.config import load_config
+from straindb.index_file import IndexFile, PostingTable, StaleIndexError, write_index_file
+from straindb.load import read_rows
+from straindb.pipeline import ReadCSV
+from straindb.query import index_sources, strain_postings
+
+DEBUG = False
+
+PAD = '\x00'
+TERM_FIELDS = ('allele', 'gene', 'plasmid', 'expanded_name', 'genotype')
+NAME_FIELDS = ('allele', 'gene', 'plasmid', 'expanded_name')
+GENOTYPE_COLUMN = 8  # of the raw strain CSV
+
+
+def padded(text):  # lowercased text, with two PAD characters at each end
+    return PAD*2 + text.lower() + PAD*2
+
+
+def trigrams(text):  # distinct trigrams of text
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+def match_key(rank, field, length, term_id):  # int ordered as (rank, field, length, term_id), and sorted faster than the tuple
+    return (rank << 3 | field) << 56 | length << 32 | term_id
+
+
+def match_term(key):  # term number of a match_key
+    return key & 0xffffffff
+
+
+def edit_distance(a, b, max_distance):  # Levenshtein distance of a and b, or max_distance + 1 if it is larger
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # A common prefix and suffix do not change the distance; fuzzy candidates share one with the query
+    n = min(len(a), len(b))
+    start = 0
+    while start < n and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < n - start and a[-1-end] == b[-1-end]:
+        end += 1
+    a, b = a[start:len(a)-end], b[start:len(b)-end]
+    if not a or not b:
+        return min(len(a) + len(b), max_distance + 1)
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (ca != cb)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+
+def search_postings(strain_allele_rows, allele_rows, plasmid_rows, genotypes):  # strain names, and field -> term -> strain numbers
+    # rows as in normalize outputs, with None for NULL; genotypes: (line number, genotype) of raw strain rows.
+    # Terms of each field are sorted (as write_index_file stores them), and numbered in TERM_FIELDS order;
+    # the 'trigram' field maps each trigram to the numbers of the terms containing it.
+    strain_allele_rows = list(strain_allele_rows)
+    plasmid_rows = list(plasmid_rows)
+    strain_names, postings = strain_postings(strain_allele_rows, allele_rows, (r[1] for r in plasmid_rows))
+    numbers = {name: i for i, name in enumerate(strain_names)}
+    strain_of_line = {}
+    for r in strain_allele_rows:
+        if r[1] in numbers:
+            strain_of_line.setdefault(int(r[0]), numbers[r[1]])
+
+    terms = OrderedDict((field, postings[field]) for field in ('allele', 'gene', 'plasmid'))
+    terms['expanded_name'] = OrderedDict()
+    for r in plasmid_rows:
+        ids = postings['plasmid'].get(r[1])
+        if ids and r[2] is not None:
+            terms['expanded_name'].setdefault(r[2], set()).update(ids)
+    terms['genotype'] = OrderedDict()
+    for linenum, genotype in genotypes:
+        strain_id = strain_of_line.get(linenum)
+        if strain_id is not None and genotype:
+            terms['genotype'].setdefault(genotype, set()).add(strain_id)
+    for field, names in terms.items():
+        terms[field] = OrderedDict((name, sorted(names[name])) for name in sorted(names, key=lambda name: name.encode()))
+
+    trigram_terms = {}
+    term_id = 0
+    for names in terms.values():
+        for name in names:
+            for trigram in trigrams(padded(name)):
+                term_ids = trigram_terms.get(trigram)
+                if term_ids is None:
+                    term_ids = trigram_terms[trigram] = []
+                term_ids.append(term_id)
+            term_id += 1
+    terms['trigram'] = trigram_terms
+    return strain_names, terms
+
+
+def search_sources(config):  # CSV files a search index is built from
+    return index_sources(config) + [config.rawCSV['strain']]
+
+
+def search_index_path(config):
+    return config.normalize_dir / 'search_index.bin'
+
+
+def read_search_postings(config):  # search_postings of the raw strain CSV and the filter and normalize outputs
+    plasmid_csv, allele_csv, strain_allele_csv = index_sources(config)
+    genotypes = ((rec.linenum, rec.raw.strip()) for rec in ReadCSV(config.rawCSV['strain'], clean=itemgetter(GENOTYPE_COLUMN)))
+    return search_postings(read_rows(strain_allele_csv), read_rows(allele_csv), read_rows(plasmid_csv), genotypes)
+
+
+def write_search_index(config):  # write normalize/search_index.bin
+    write_index_file(search_index_path(config), *read_search_postings(config), search_sources(config))
+
+
+class SearchIndex:  # ranked substring and fuzzy search of terms, returning the ids of the strains they occur in
+
+    def __init__(self, strain_names, postings, index_file=None):  # postings as returned by search_postings, or of an IndexFile
+        self.strain_names = strain_names
+        self.index_file = index_file  # IndexFile that strain_names and postings point into, if any
+        self.trigrams = postings['trigram']
+        self.terms = []         # names of each field, sorted
+        self.term_strains = []  # of each field: position of a name -> its strain numbers
+        self.bases = []         # of each field: number of its first term
+        self.term_fields = []   # field number of each term
+        self.num_terms = 0
+        for field in TERM_FIELDS:
+            table = postings[field]
+            if isinstance(table, PostingTable):
+                self.terms.append(table.names)
+                self.term_strains.append(table.at)
+            else:
+                self.terms.append(list(table))
+                self.term_strains.append(list(table.values()).__getitem__)
+            self.bases.append(self.num_terms)
+            self.term_fields += [len(self.bases) - 1] * len(table)
+            self.num_terms += len(table)
+        self.texts = [padded(name) for names in self.terms for name in names]  # padded, lowercased text of each term
+
+    @classmethod
+    def from_index_file(cls, path):
+        index_file = IndexFile(path)
+        return cls(index_file.strain_names, index_file.postings, index_file)
+
+    @classmethod
+    def from_config(cls, config):  # map normalize/search_index.bin, or read the CSVs if it is missing or stale
+        try:
+            index = cls.from_index_file(search_index_path(config))
+            index.index_file.check_sources(search_sources(config))
+            return index
+        except (FileNotFoundError, StaleIndexError) as e:
+            if DEBUG: print(f'Reading CSVs: {e}')
+            return cls(*read_search_postings(config))
+
+    def field(self, term_id):  # field number of a term
+        return self.term_fields[term_id]
+
+    def term(self, term_id):  # (field number, name) of a term
+        f = self.field(term_id)
+        return f, self.terms[f][term_id - self.bases[f]]
+
+    def text(self, term_id):  # padded, lowercased name of a term
+        return self.texts[term_id]
+
+    def field_numbers(self, fields):  # numbers of the named fields (all fields for None)
+        if fields is None:
+            return set(range(len(TERM_FIELDS)))
+        unknown = [field for field in fields if field not in TERM_FIELDS]
+        if unknown:
+            raise ValueError(f'Unknown field: {unknown[0]} (expected one of {", ".join(TERM_FIELDS)})')
+        return {TERM_FIELDS.index(field) for field in fields}
+
+    def candidates(self, piece):  # numbers of terms whose padded text may contain piece (3 or more characters)
+        # The two shortest posting lists are intersected as sets; callers check the text of each term left,
+        # which costs less than intersecting the longer lists too
+        lists = []
+        for trigram in trigrams(piece):
+            term_ids = self.trigrams.get(trigram)
+            if term_ids is None:
+                return ()
+            lists.append(term_ids)
+        if len(lists) == 1:
+            return lists[0]
+        lists.sort(key=len)
+        return set(lists[0]).intersection(lists[1])
+
+    def substring_matches(self, text, fields=None):  # sorted match_keys of terms containing text
+        wanted = self.field_numbers(fields)
+        q = text.lower()
+        exact, prefix = padded(q), PAD*2 + q
+        matches = []
+        texts, term_fields = self.texts, self.term_fields
+        for term_id in (self.candidates(q) if len(q) >= 3 else range(self.num_terms)):
+            t = texts[term_id]
+            if q in t:
+                f = term_fields[term_id]
+                if f in wanted:  # terms of a field are numbered in name order
+                    matches.append(match_key(0 if t == exact else 1 if t.startswith(prefix) else 2, f, len(t), term_id))
+        matches.sort()
+        return matches
+
+    def fuzzy_matches(self, text, max_distance=1, fields=NAME_FIELDS):  # sorted match_keys of terms within max_distance edits of text
+        wanted = self.field_numbers(fields)
+        q = text.lower()
+        p = padded(q)
+        size = len(p) // (max_distance + 1)
+        if size >= 3:  # a match contains one of max_distance + 1 pieces of the padded query unchanged
+            pieces = [p[i*size:(i+1)*size if i < max_distance else len(p)] for i in range(max_distance + 1)]
+        else:
+            pieces = [None]  # too short to split: check every term
+        matches = OrderedDict()
+        rejected = set()
+        texts, term_fields = self.texts, self.term_fields
+        for piece in pieces:
+            for term_id in (self.candidates(piece) if piece is not None else range(self.num_terms)):
+                if term_id in matches or term_id in rejected or term_fields[term_id] not in wanted:
+                    continue
+                t = texts[term_id]
+                if piece is not None and piece not in t:
+                    continue
+                distance = edit_distance(q, t[2:-2], max_distance) if abs(len(t) - len(p)) <= max_distance else max_distance + 1
+                if distance <= max_distance:
+                    matches[term_id] = match_key(distance, term_fields[term_id], len(t), term_id)
+                else:
+                    rejected.add(term_id)
+        return sorted(matches.values())
+
+    def strain_ids(self, matches, limit=None):  # ids of the strains of sorted match_keys, each once, in rank order
+        ids = []
+        seen = set()
+        term_fields, term_strains, bases = self.term_fields, self.term_strains, self.bases
+        for key in matches:
+            term_id = match_term(key)
+            f = term_fields[term_id]
+            for i in term_strains[f](term_id - bases[f]):
+                if i not in seen:
+                    seen.add(i)
+                    ids.append(i + 1)
+                    if limit is not None and len(ids) >= limit:
+                        return ids
+        return ids
+
+    def substring(self, text, fields=None, limit=None):  # strain ids of terms containing text, e.g. substring('Is53')
+        return self.strain_ids(self.substring_matches(text, fields), limit)
+
+    def fuzzy(self, text, max_distance=1, fields=NAME_FIELDS, limit=None):  # strain ids of names within max_distance edits of text
+        return self.strain_ids(self.fuzzy_matches(text, max_distance, fields), limit)
+
+    def names(self, strain_ids):
+        return [self.strain_names[i - 1] for i in strain_ids]
+
+
+if __name__ == '__main__':
+    index = SearchIndex.from_config(load_config())
+    for name in index.names(index.substring(' '.join(sys.argv[1:]))):
+        print(name)
@@ -0,0 +1,414 @@
+''' Local read-only lookup service: strain, allele, plasmid and gene lookups and strain set queries over HTTP/JSON
+
+Lab tools ask the same questions many times a day ("strains with allele X and plasmid Y"),
+each opening its own database connection and running the joins again. "straindb serve"
+answers them from one process, over a pool of read-only connections to the SQLite database of
+straindb.sqlite_db (service_backend: sqlite, the default) or to the MySQL database of the mysql
+section of config.yaml (service_backend: mysql):
+
+    GET /strains/<name>     strain, with its alleles (alleleset, chromosome, gene) and plasmids
+    GET /alleles/<name>     allele, with its gene, plasmids and strains
+    GET /plasmids/<name>    plasmid, with its alleles and strains
+    GET /genes/<name>       gene, with its alleles and strains
+    GET /query?q=<expr>     names of the strains matching a query of straindb.query, e.g.
+                            /query?q=allele:oyIs44%20and%20plasmid:pMH339 (run as SQL set operations)
+    GET /generation         load generation of the database, and pool and cache statistics
+
+Responses are JSON (404 for an unknown name or path, 400 for a query that does not parse).
+Queries run on the pool's connections in worker threads, so the event loop keeps serving, and
+identical requests arriving while one runs share its result. Responses are cached (least
+recently used first out) until the load generation changes: load_generation.generation is
+bumped by every load of the database tables (scripts 4, "straindb load-tables", "straindb
+sqlite"). It is read with a new connection at most every service_check_seconds (a rebuilt
+SQLite file replaces the old one, which open connections would keep reading); when it changes,
+the cache is cleared and the pool reconnects.
+
+The service never writes, so it can be pointed at a stand-in database to test tools, e.g. a
+SQLite file built from straindb.synthetic data (see benchmarks/bench_service.py).
+'''
+
+import asyncio, json, sqlite3, time
+from collections import OrderedDict
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+from straindb.config import load_config
+from straindb.load import placeholder_for
+from straindb.query import FIELDS, QueryParser
+
+DEBUG = False
+
+# SQL of the strains (as strain_id) with a plasmid, allele, gene or chromosome name
+term_queries = OrderedDict([
+    ('plasmid', 'select sp.strain_id from strain_plasmid sp join plasmid p on p.id = sp.plasmid_id where p.name = ?'),
+    ('allele', 'select ast.strain_id from alleleset ast join alleleset_allele aa on aa.alleleset_id = ast.id'
+               ' join allele a on a.id = aa.allele_id where a.name = ?'),
+    ('gene', 'select ast.strain_id from alleleset ast join alleleset_allele aa on aa.alleleset_id = ast.id'
+             ' join allele a on a.id = aa.allele_id join gene g on g.id = a.gene_id where g.name = ?'),
+    ('chromosome', 'select strain_id from alleleset where chromosome_name = ?'),
+])
+
+# Path prefix -> Database method looking up a name
+routes = OrderedDict([('strains', 'strain'), ('alleles', 'allele'), ('plasmids', 'plasmid'), ('genes', 'gene')])
+
+
+class NotFound(Exception):  # no row with the requested name, or no such path
+    pass
+
+
+class SqlSet:  # strain ids as a query selecting strain_id, combined with &, | and - as QueryParser combines Bitmaps
+
+    __slots__ = ('sql', 'params')
+
+    def __init__(self, sql, params=()):
+        self.sql = sql
+        self.params = tuple(params)
+
+    def __and__(self, other):
+        return SqlSet(f'select strain_id from ({self.sql}) x where strain_id in ({other.sql})', self.params + other.params)
+
+    def __or__(self, other):
+        return SqlSet(f'select strain_id from ({self.sql}) x union select strain_id from ({other.sql}) y', self.params + other.params)
+
+    def __sub__(self, other):
+        return SqlSet(f'select strain_id from ({self.sql}) x where strain_id not in ({other.sql})', self.params + other.params)
+
+
+class SqlSets:  # the index QueryParser evaluates a query with: SqlSets of its terms, and of all strains
+
+    all = SqlSet('select id as strain_id from strain')
+
+    def strains(self, field, name):
+        if field not in term_queries:
+            raise ValueError(f'Unknown field: {field} (expected one of {", ".join(FIELDS)})')
+        return SqlSet(term_queries[field], [name])
+
+
+class Database:  # lookups over one DB-API connection (called in a worker thread)
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.placeholder = placeholder_for(connection)
+
+    def rows(self, sql, params=()):  # result rows as OrderedDicts of column -> value
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(sql.replace('?', self.placeholder), params)
+            columns = [d[0] for d in cursor.description]
+            return [OrderedDict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def column(self, sql, params=()):  # first column of the result rows
+        return [next(iter(row.values())) for row in self.rows(sql, params)]
+
+    def one(self, kind, sql, name):  # the row with a name, or NotFound
+        rows = self.rows(sql, [name])
+        if not rows:
+            raise NotFound(f'No {kind} named {name}')
+        return rows[0]
+
+    def strain(self, name):
+        strain = self.one('strain', 'select id, name, other_names, source, comment from strain where name = ?', name)
+        strain['alleles'] = self.rows('select a.name, ast.alleleset_binaryid, ast.chromosome_name, aa.heterozygous, g.name as gene'
+                                      ' from alleleset ast join alleleset_allele aa on aa.alleleset_id = ast.id'
+                                      ' join allele a on a.id = aa.allele_id left join gene g on g.id = a.gene_id'
+                                      ' where ast.strain_id = ? order by ast.id, a.id', [strain['id']])
+        strain['plasmids'] = self.column('select p.name from strain_plasmid sp join plasmid p on p.id = sp.plasmid_id'
+                                         ' where sp.strain_id = ? order by p.id', [strain['id']])
+        return strain
+
+    def allele(self, name):
+        allele = self.one('allele', 'select a.id, a.name, a.allele_type, g.name as gene, a.comment'
+                                    ' from allele a left join gene g on g.id = a.gene_id where a.name = ?', name)
+        allele['plasmids'] = self.column('select p.name from allele_plasmid ap join plasmid p on p.id = ap.plasmid_id'
+                                         ' where ap.allele_id = ? order by p.id', [allele['id']])
+        allele['strains'] = self.column('select name from strain where id in (select ast.strain_id from alleleset ast'
+                                        ' join alleleset_allele aa on aa.alleleset_id = ast.id where aa.allele_id = ?)'
+                                        ' order by id', [allele['id']])
+        return allele
+
+    def plasmid(self, name):
+        plasmid = self.one('plasmid', 'select id, name, expanded_name, source, parent1, parent2, restriction_site, date'
+                                      ' from plasmid where name = ?', name)
+        plasmid['alleles'] = self.column('select a.name from allele_plasmid ap join allele a on a.id = ap.allele_id'
+                                         ' where ap.plasmid_id = ? order by a.id', [plasmid['id']])
+        plasmid['strains'] = self.column('select s.name from strain_plasmid sp join strain s on s.id = sp.strain_id'
+                                         ' where sp.plasmid_id = ? order by s.id', [plasmid['id']])
+        return plasmid
+
+    def gene(self, name):
+        gene = self.one('gene', 'select id, name from gene where name = ?', name)
+        gene['alleles'] = self.column('select name from allele where gene_id = ? order by id', [gene['id']])
+        gene['strains'] = self.column('select name from strain where id in (select ast.strain_id from alleleset ast'
+                                      ' join alleleset_allele aa on aa.alleleset_id = ast.id join allele a on a.id = aa.allele_id'
+                                      ' where a.gene_id = ?) order by id', [gene['id']])
+        return gene
+
+    def query(self, expression):  # names of the strains matching a query of straindb.query, in id order
+        strains = QueryParser(SqlSets(), expression).parse()
+        names = self.column(f'select name from strain where id in ({strains.sql}) order by id', strains.params)
+        return OrderedDict([('query', expression), ('count', len(names)), ('strains', names)])
+
+
+def request_query(target):  # function of a connection answering a GET of target (path and query string)
+    url = urlsplit(target)
+    if url.path == '/query':
+        expression = parse_qs(url.query).get('q')
+        if not expression:
+            raise ValueError('Expected /query?q=<query>, e.g. q=plasmid:pCY118 and not plasmid:pCY155')
+        return lambda connection: Database(connection).query(expression[0])
+    parts = url.path.split('/', 2)
+    if len(parts) == 3 and parts[1] in routes and parts[2]:
+        method, name = routes[parts[1]], unquote(parts[2])
+        return lambda connection: getattr(Database(connection), method)(name)
+    raise NotFound(f'No such path: {url.path}')
+
+
+def encode(result):  # JSON response body (dates as strings)
+    return json.dumps(result, default=str).encode()
+
+
+def sqlite_connector(path):  # function opening a read-only connection to a SQLite database file
+    uri = f'file:{path.resolve()}?mode=ro'
+    return lambda: sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+
+def mysql_connector(settings):  # function opening a connection to MySQL (autocommit, so each query sees the last load)
+    def connect():
+        import mysql.connector
+        connection = mysql.connector.connect(**settings)
+        connection.autocommit = True
+        return connection
+    return connect
+
+
+def read_generation(connect):  # load generation of the database, read with a new connection (0 without a load_generation table)
+    connection = connect()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('select generation from load_generation where id = 1')
+            row = cursor.fetchone()
+        except Exception as e:  # database loaded before load_generation was added
+            if DEBUG: print(f'No load generation: {e}')
+            row = None
+        finally:
+            cursor.close()
+        return row[0] if row else 0
+    finally:
+        connection.close()
+
+
+class ConnectionPool:  # up to size connections, opened as needed, each running one query at a time in a worker thread
+
+    def __init__(self, connect, size):
+        self.connect = connect
+        self.size = size
+        self.idle = []  # (epoch, connection)
+        self.epoch = 0  # connections of earlier epochs are closed instead of reused
+        self.available = None  # Semaphore of size, created in the running loop (before Python 3.10, it binds to the loop current when created)
+        self.opened = 0
+
+    async def run(self, query):  # query(connection), in a worker thread
+        loop = asyncio.get_running_loop()
+        if self.available is None:
+            self.available = asyncio.Semaphore(self.size)
+        async with self.available:
+            epoch, connection = self.idle.pop() if self.idle else (None, None)
+            if connection is not None and epoch != self.epoch:
+                connection.close()
+                connection = None
+            if connection is None:
+                epoch = self.epoch
+                connection = await loop.run_in_executor(None, self.connect)
+                self.opened += 1
+            reuse = False
+            try:
+                result = await loop.run_in_executor(None, query, connection)
+                reuse = True
+                return result
+            except (NotFound, ValueError):
+                reuse = True
+                raise
+            finally:
+                if reuse and epoch == self.epoch:
+                    self.idle.append((epoch, connection))
+                else:
+                    connection.close()
+
+    def reset(self):  # reconnect: close idle connections, and busy ones when their query completes
+        self.epoch += 1
+        for _, connection in self.idle:
+            connection.close()
+        self.idle = []
+
+    def close(self):
+        self.reset()
+
+
+class ResultCache:  # response of each request target, least recently used evicted first
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class LookupService:  # HTTP/JSON server of cached lookups over a ConnectionPool
+
+    def __init__(self, connect, pool_size=4, cache_size=10000, check_seconds=1.0):  # connect: function opening a read-only connection
+        self.connect = connect
+        self.pool = ConnectionPool(connect, pool_size)
+        self.cache = ResultCache(cache_size)
+        self.check_seconds = check_seconds
+        self.generation = None
+        self.checked_at = None
+        self.checking = None  # Future of a running generation check
+        self.pending = {}     # request target -> Future of its response, while its query runs
+        self.shared = 0       # requests answered by the query of an identical pending request
+
+    @classmethod
+    def from_config(cls, config):
+        if config.service_backend == 'sqlite':
+            connect = sqlite_connector(config.sqlite_database)
+        elif config.service_backend == 'mysql':
+            connect = mysql_connector(config.mysql)
+        else:
+            raise ValueError(f'Unknown service_backend: {config.service_backend} (expected sqlite or mysql)')
+        return cls(connect, config.service_pool_size, config.service_cache_size, config.service_check_seconds)
+
+    async def check_generation(self):  # clear the cache and reconnect the pool if the load generation changed
+        if self.checked_at is not None and time.monotonic() - self.checked_at < self.check_seconds:
+            return
+        if self.checking is not None:  # requests arriving during a check wait for it
+            return await asyncio.shield(self.checking)
+        self.checking = asyncio.get_running_loop().create_future()
+        try:
+            generation = await asyncio.get_running_loop().run_in_executor(None, read_generation, self.connect)
+            self.checked_at = time.monotonic()
+            if generation != self.generation:
+                if DEBUG: print(f'Load generation {self.generation} -> {generation}: clearing {len(self.cache.entries)} cached responses')
+                self.generation = generation
+                self.cache.clear()
+                self.pool.reset()
+        finally:
+            self.checking.set_result(None)
+            self.checking = None
+
+    def stats(self):
+        return OrderedDict([('generation', self.generation), ('cached', len(self.cache.entries)), ('hits', self.cache.hits),
+                            ('misses', self.cache.misses), ('shared', self.shared), ('connections_opened', self.pool.opened)])
+
+    async def respond(self, target):  # (status, JSON body) of a GET of target
+        try:
+            await self.check_generation()
+        except Exception as e:
+            return HTTPStatus.SERVICE_UNAVAILABLE, encode({'error': f'Cannot read the database: {e}'})
+        if target == '/generation':
+            return HTTPStatus.OK, encode(self.stats())
+        response = self.cache.get(target)
+        if response is not None:
+            return response
+        pending = self.pending.get(target)
+        if pending is not None:
+            self.shared += 1
+            return await asyncio.shield(pending)
+
+        generation = self.generation
+        future = self.pending[target] = asyncio.get_running_loop().create_future()
+        try:
+            response = HTTPStatus.OK, encode(await self.pool.run(request_query(target)))
+        except NotFound as e:
+            response = HTTPStatus.NOT_FOUND, encode({'error': str(e)})
+        except ValueError as e:
+            response = HTTPStatus.BAD_REQUEST, encode({'error': str(e)})
+        except Exception as e:
+            response = HTTPStatus.INTERNAL_SERVER_ERROR, encode({'error': f'{type(e).__name__}: {e}'})
+        except BaseException:  # cancelled: requests sharing the query are cancelled too
+            future.cancel()
+            raise
+        finally:
+            del self.pending[target]
+        if response[0] in (HTTPStatus.OK, HTTPStatus.NOT_FOUND) and generation == self.generation:
+            self.cache.put(target, response)
+        future.set_result(response)
+        return response
+
+    async def handle(self, reader, writer):  # serve the requests of one client connection (HTTP/1.1, kept alive)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    status, body = HTTPStatus.BAD_REQUEST, encode({'error': 'Malformed request line'})
+                elif parts[0] != 'GET':
+                    status, body = HTTPStatus.METHOD_NOT_ALLOWED, encode({'error': 'Only GET is served'})
+                else:
+                    status, body = await self.respond(parts[1])
+                keep_alive = parts[2:] == ['HTTP/1.1'] and headers.get('connection', '').lower() != 'close'
+                writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(body)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            if DEBUG: print(f'Client connection: {e}')
+        finally:
+            writer.close()
+
+    async def start(self, host, port):  # asyncio server listening on host and port (port 0: any free port)
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.pool.close()
+
+
+async def serve(service, host, port):  # serve until cancelled
+    server = await service.start(host, port)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f'Serving on http://{host}:{port}/ (GET /strains/<name>, /alleles/<name>, /plasmids/<name>, /genes/<name>, /query?q=..., /generation)')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def run_service(config, port=None):  # serve config's database until interrupted
+    service = LookupService.from_config(config)
+    try:
+        asyncio.run(serve(service, config.service_host, port if port is not None else config.service_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    run_service(load_config())
@@ -4,7 +4,8 @@ drop table if exists staging_strain;
 create table staging_strain (
     id int primary key auto_increment,
     strain_name varchar(100) not null,
-    processed int default 0
+    processed int default 0,
+    index (strain_name)
 );
 
 drop table if exists staging_strain_allele;
@@ -20,7 +21,9 @@ create table staging_strain_allele (
     other_names varchar(100), 
     source varchar(100), 
     comment text,
-    processed int default 0    
+    processed int default 0,
+    index (strain_name, processed),
+    index (allele_name)
 );
 
 drop table if exists staging_allele;
@@ -32,7 +35,9 @@ create table staging_allele (
     gene_name varchar(100),
     plasmid_name varchar(100),
     comment text,
-    processed int default 0        
+    processed int default 0,
+    index (name, processed),
+    index (plasmid_name)
 );
 
 
@@ -46,7 +51,8 @@ create table staging_plasmid (
     parent1 varchar(100),
     parent2 varchar(100),
     restriction_site varchar(100),
-    datestr varchar(50)
+    datestr varchar(50),
+    index (name)
 );
 
 
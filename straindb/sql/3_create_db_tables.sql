@@ -1,17 +1,22 @@
-    
+
+-- Names are unique keys (the ETL probes tables by name), and join tables are covered by
+-- indexes in both directions, so example queries and ETL lookups use index lookups instead of scans
+
 drop table if exists strain;
 create table strain (
     id int primary key auto_increment, 
     name varchar(100) not null, 
     other_names varchar(100) default null, 
     source varchar(100), 
-    comment text default null
+    comment text default null,
+    unique key (name)
 );
 
 drop table if exists gene;
 create table gene (
     id int primary key auto_increment,
-    name varchar(20) not null
+    name varchar(20) not null,
+    unique key (name)
 );
 
 drop table if exists allele;
@@ -20,7 +25,9 @@ create table allele (
     name varchar(100) not null,
     allele_type enum('mutant', 'transgene', 'rearrangement', 'other'),
     gene_id int default null,
-    comment text default null
+    comment text default null,
+    unique key (name),
+    key (gene_id)
 );
 
 drop table if exists alleleset;
@@ -29,6 +36,7 @@ create table alleleset (
     alleleset_binaryid tinyint,
     strain_id int not null, 
     chromosome_name varchar(100) default null,
+    unique key (strain_id, alleleset_binaryid, chromosome_name),
     foreign key (strain_id) references strain(id)
 );
 
@@ -41,13 +49,16 @@ create table plasmid (
     parent1 varchar(100) default null,
     parent2 varchar(100) default null,
     restriction_site varchar(100) default null,
-    date date default null
+    date date default null,
+    unique key (name)
 );
 
 drop table if exists allele_plasmid;
 create table allele_plasmid (
-    allele_id int,
-    plasmid_id int,
+    allele_id int not null,
+    plasmid_id int not null,
+    primary key (allele_id, plasmid_id),
+    key (plasmid_id, allele_id),
     foreign key (allele_id) references allele(id),
     foreign key (plasmid_id) references plasmid(id)
 );
@@ -57,7 +68,85 @@ create table alleleset_allele (
     alleleset_id int,
     allele_id int,
     heterozygous boolean,
+    key (alleleset_id, allele_id, heterozygous),  -- covering index for alleleset -> allele joins
+    key (allele_id, alleleset_id),                -- covering index for allele -> alleleset joins
     foreign key (alleleset_id) references alleleset(id),
     foreign key (allele_id) references allele(id)
 );
 
+
+-- Materialized mapping from strains to plasmids (one row per distinct pair), kept up to date by
+-- 4_load_db_tables.sql in the transaction that loads each strain
+drop table if exists strain_plasmid;
+create table strain_plasmid (
+    plasmid_id int not null,
+    strain_id int not null,
+    primary key (plasmid_id, strain_id),
+    key (strain_id),
+    foreign key (strain_id) references strain(id),
+    foreign key (plasmid_id) references plasmid(id)
+);
+
+-- Materialized convenience view of strains, refreshed with strain_plasmid
+drop table if exists strain_view;
+create table strain_view (
+    strain_id int primary key,
+    strain_name varchar(100) not null,
+    allele_names text default null,
+    chromosome_names text default null,
+    plasmids text default null,
+    plasmid_expanded_names text default null,
+    gene_names text default null,
+    strain_source varchar(100),
+    key (strain_name),
+    foreign key (strain_id) references strain(id)
+);
+
+-- Load generation, bumped by each load of the database tables (4_load_db_tables.sql, its set-based
+-- variant, and straindb load-tables), so caches of query results (straindb.service) know when the
+-- tables changed. Not dropped with the other tables, so the count survives reloads
+create table if not exists load_generation (
+    id int primary key,
+    generation int not null,
+    loaded_at datetime default null
+);
+insert ignore into load_generation (id, generation) values (1, 0);
+
+-- Recompute the strain_plasmid and strain_view rows of one strain (call inside the transaction that changes it)
+drop procedure if exists refresh_strain;
+delimiter //
+create procedure refresh_strain(in p_strain_id int)
+begin
+
+  delete from strain_plasmid where strain_id = p_strain_id;
+  insert into strain_plasmid (plasmid_id, strain_id)
+    select distinct ap.plasmid_id, ast.strain_id
+    from alleleset ast
+    join alleleset_allele aa on aa.alleleset_id = ast.id
+    join allele_plasmid ap on ap.allele_id = aa.allele_id
+    where ast.strain_id = p_strain_id;
+
+  delete from strain_view where strain_id = p_strain_id;
+  insert into strain_view
+      (strain_id, strain_name, allele_names, chromosome_names, plasmids, plasmid_expanded_names, gene_names, strain_source)
+    select
+      s.id,
+      s.name,
+      group_concat(a.name separator ', '),
+      group_concat(ast.chromosome_name separator ', '),
+      group_concat(p.name separator ', '),
+      group_concat(p.expanded_name separator ', '),
+      group_concat(g.name separator ', '),
+      s.source
+    from strain s
+    left outer join alleleset ast on ast.strain_id = s.id
+    left outer join alleleset_allele aa on aa.alleleset_id = ast.id
+    left outer join allele a on a.id = aa.allele_id
+    left outer join allele_plasmid ap on ap.allele_id = a.id
+    left outer join plasmid p on p.id = ap.plasmid_id
+    left outer join gene g on g.id = a.gene_id
+    where s.id = p_strain_id
+    group by s.id, s.name, s.source;
+
+end //
+delimiter ;
@@ -175,6 +175,12 @@ begin
       
     end while;  -- strain_allele loop
 
+    -- Refresh materialized strain_plasmid and strain_view rows in the same transaction
+    set @strain_id = (select id from strain where name = @strain_name);
+    if @strain_id is not null then
+      call refresh_strain(@strain_id);
+    end if;
+
     commit;
 
     set @strain_counter = @strain_counter + 1;
@@ -190,4 +196,7 @@ set SQL_SAFE_UPDATES = 0;
 
 call etl_tables();
 
+update load_generation set generation = generation + 1, loaded_at = now() where id = 1;
+commit;
+
 set autocommit = 1;
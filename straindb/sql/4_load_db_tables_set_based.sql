@@ -0,0 +1,249 @@
+
+-- Set-based alternative to 4_load_db_tables.sql: loads the same tables with insert ... select
+-- statements instead of the row-by-row etl_tables() procedure. Run one or the other after script 3.
+--
+-- Per-strain rollback semantics are kept: a strain with any allele missing from staging_allele, or
+-- any allele with a plasmid missing from staging_plasmid, is excluded entirely, and (as in
+-- etl_tables) the first missing reference found for that strain is recorded in an error table.
+-- Row ids are assigned in the order etl_tables() would assign them.
+
+-- Error tables
+drop table if exists allele_missing_from_staging_allele_table;
+create table allele_missing_from_staging_allele_table (
+  strain_original_line_number int,
+  strain_name varchar(100),
+  allele_name varchar(100)
+) engine = MyISAM; -- use MyISAM so error tables are unaffected by rollbacks
+
+drop table if exists plasmid_missing_from_staging_plasmid_table;
+create table plasmid_missing_from_staging_plasmid_table (
+  strain_original_line_number int,
+  strain_name varchar(100),
+  allele_original_line_number int,
+  allele_name varchar(100),
+  plasmid_name varchar(100)
+) engine = MyISAM;
+
+-- Work tables (dropped at the end of this script)
+
+-- First staging_allele row of each allele (source of allele_type, comment, default gene_name)
+drop table if exists etl_staging_allele_first;
+create table etl_staging_allele_first (
+  name varchar(100) primary key,
+  staging_allele_id int not null
+);
+
+-- Plasmid references in staging_allele that are missing from staging_plasmid
+drop table if exists etl_missing_plasmid;
+create table etl_missing_plasmid (
+  staging_allele_id int primary key,
+  allele_original_line_number int,
+  allele_name varchar(100) not null,
+  plasmid_name varchar(100) not null,
+  key (allele_name)
+);
+
+-- First staging_allele row of each allele with a missing plasmid
+drop table if exists etl_missing_plasmid_first;
+create table etl_missing_plasmid_first (
+  allele_name varchar(100) primary key,
+  staging_allele_id int not null
+);
+
+-- First failing staging_strain_allele row of each excluded strain
+drop table if exists etl_failed_strain;
+create table etl_failed_strain (
+  strain_name varchar(100) primary key,
+  staging_strain_allele_id int not null
+);
+
+-- Alleles used by loaded strains, with the staging_strain_allele row that first uses them
+drop table if exists etl_allele;
+create table etl_allele (
+  name varchar(100) primary key,
+  first_use_id int not null,
+  gene_name varchar(100),
+  key (first_use_id)
+);
+
+-- Name -> id maps of newly loaded rows, so joins on name use a primary key
+drop table if exists etl_strain_id;
+create table etl_strain_id (name varchar(100) primary key, id int not null);
+drop table if exists etl_gene_id;
+create table etl_gene_id (name varchar(20) primary key, id int not null);
+drop table if exists etl_allele_id;
+create table etl_allele_id (name varchar(100) primary key, id int not null);
+drop table if exists etl_plasmid_id;
+create table etl_plasmid_id (name varchar(100) primary key, id int not null);
+
+start transaction;
+
+insert into etl_staging_allele_first (name, staging_allele_id)
+  select name, min(id) from staging_allele group by name;
+
+insert into etl_missing_plasmid (staging_allele_id, allele_original_line_number, allele_name, plasmid_name)
+  select sa.id, sa.allele_original_line_number, sa.name, sa.plasmid_name
+  from staging_allele sa
+  where sa.plasmid_name is not null
+    and not exists (select * from staging_plasmid sp where sp.name = sa.plasmid_name);
+
+insert into etl_missing_plasmid_first (allele_name, staging_allele_id)
+  select allele_name, min(staging_allele_id) from etl_missing_plasmid group by allele_name;
+
+-- A strain_allele row fails if its allele is missing from staging_allele or has a missing plasmid
+insert into etl_failed_strain (strain_name, staging_strain_allele_id)
+  select ssa.strain_name, min(ssa.id)
+  from staging_strain_allele ssa
+  left join etl_staging_allele_first saf on saf.name = ssa.allele_name
+  left join etl_missing_plasmid_first mpf on mpf.allele_name = ssa.allele_name
+  where ssa.allele_name is not null
+    and (saf.name is null or mpf.allele_name is not null)
+  group by ssa.strain_name;
+
+-- Record the first missing reference of each excluded strain
+insert into allele_missing_from_staging_allele_table (strain_original_line_number, strain_name, allele_name)
+  select ssa.strain_original_line_number, ssa.strain_name, ssa.allele_name
+  from etl_failed_strain fs
+  join staging_strain_allele ssa on ssa.id = fs.staging_strain_allele_id
+  left join etl_staging_allele_first saf on saf.name = ssa.allele_name
+  where saf.name is null
+  order by ssa.id;
+
+insert into plasmid_missing_from_staging_plasmid_table
+    (strain_original_line_number, strain_name, allele_original_line_number, allele_name, plasmid_name)
+  select ssa.strain_original_line_number, ssa.strain_name, mp.allele_original_line_number, ssa.allele_name, mp.plasmid_name
+  from etl_failed_strain fs
+  join staging_strain_allele ssa on ssa.id = fs.staging_strain_allele_id
+  join etl_missing_plasmid_first mpf on mpf.allele_name = ssa.allele_name
+  join etl_missing_plasmid mp on mp.staging_allele_id = mpf.staging_allele_id
+  order by ssa.id;
+
+-- Strains: attributes come from each strain's first strain_allele row
+insert into strain (name, other_names, source, comment)
+  select ss.strain_name, ssa.other_names, ssa.source, ssa.comment
+  from staging_strain ss
+  join (select strain_name, min(id) as id from staging_strain_allele group by strain_name) first_row
+    on first_row.strain_name = ss.strain_name
+  join staging_strain_allele ssa on ssa.id = first_row.id
+  left join etl_failed_strain fs on fs.strain_name = ss.strain_name
+  where fs.strain_name is null
+  order by ss.id;
+
+insert into etl_strain_id (name, id) select name, id from strain;
+
+-- Alleles of loaded strains; gene_name comes from the first strain_allele row using the allele,
+-- or from staging_allele if that row names no gene
+insert into etl_allele (name, first_use_id, gene_name)
+  select first_use.allele_name, first_use.id, coalesce(ssa.gene_name, sa.gene_name)
+  from (select ssa.allele_name, min(ssa.id) as id
+          from staging_strain_allele ssa
+          join etl_strain_id s on s.name = ssa.strain_name
+          where ssa.allele_name is not null
+          group by ssa.allele_name) first_use
+  join staging_strain_allele ssa on ssa.id = first_use.id
+  join etl_staging_allele_first saf on saf.name = first_use.allele_name
+  join staging_allele sa on sa.id = saf.staging_allele_id;
+
+insert into gene (name)
+  select gene_name from etl_allele
+  where gene_name is not null
+  group by gene_name
+  order by min(first_use_id);
+
+insert into etl_gene_id (name, id) select name, id from gene;
+
+insert into allele (name, allele_type, gene_id, comment)
+  select ea.name, sa.allele_type, g.id, sa.comment
+  from etl_allele ea
+  join etl_staging_allele_first saf on saf.name = ea.name
+  join staging_allele sa on sa.id = saf.staging_allele_id
+  left join etl_gene_id g on g.name = ea.gene_name
+  order by ea.first_use_id;
+
+insert into etl_allele_id (name, id) select name, id from allele;
+
+-- Plasmids of loaded alleles, in the order the alleles are first used
+insert into plasmid (name, expanded_name, source, parent1, parent2, restriction_site, date)
+  select sp.name, sp.expanded_name, sp.source, sp.parent1, sp.parent2, sp.restriction_site, sp.datestr
+  from staging_plasmid sp
+  join (select sa.plasmid_name, min(cast(ea.first_use_id as unsigned) * 4294967296 + sa.id) as load_order
+          from etl_allele ea
+          join staging_allele sa on sa.name = ea.name
+          where sa.plasmid_name is not null
+          group by sa.plasmid_name) used on used.plasmid_name = sp.name
+  order by used.load_order;
+
+insert into etl_plasmid_id (name, id) select name, id from plasmid;
+
+insert into allele_plasmid (allele_id, plasmid_id)
+  select a.id, p.id
+  from etl_allele_id a
+  join staging_allele sa on sa.name = a.name
+  join etl_plasmid_id p on p.name = sa.plasmid_name
+  group by a.id, p.id
+  order by a.id, min(sa.id);
+
+-- Allelesets: one per (strain, alleleset_binaryid, chromosome), with null chromosomes grouped together
+insert into alleleset (alleleset_binaryid, strain_id, chromosome_name)
+  select ssa.alleleset_binaryid, s.id, ssa.chromosome
+  from staging_strain_allele ssa
+  join etl_strain_id s on s.name = ssa.strain_name
+  where ssa.allele_name is not null
+  group by s.id, ssa.alleleset_binaryid, ssa.chromosome
+  order by min(ssa.id);
+
+insert into alleleset_allele (alleleset_id, allele_id, heterozygous)
+  select ast.id, a.id, ssa.heterozygous
+  from staging_strain_allele ssa
+  join etl_strain_id s on s.name = ssa.strain_name
+  join alleleset ast
+    on ast.strain_id = s.id
+   and ast.alleleset_binaryid = ssa.alleleset_binaryid
+   and ast.chromosome_name <=> ssa.chromosome
+  join etl_allele_id a on a.name = ssa.allele_name
+  order by ssa.id;
+
+-- Materialized strain_plasmid and strain_view rows of the loaded strains (see refresh_strain in script 3)
+delete from strain_plasmid where strain_id in (select id from etl_strain_id);
+insert into strain_plasmid (plasmid_id, strain_id)
+  select distinct ap.plasmid_id, ast.strain_id
+  from etl_strain_id s
+  join alleleset ast on ast.strain_id = s.id
+  join alleleset_allele aa on aa.alleleset_id = ast.id
+  join allele_plasmid ap on ap.allele_id = aa.allele_id;
+
+delete from strain_view where strain_id in (select id from etl_strain_id);
+insert into strain_view
+    (strain_id, strain_name, allele_names, chromosome_names, plasmids, plasmid_expanded_names, gene_names, strain_source)
+  select
+    s.id,
+    s.name,
+    group_concat(a.name separator ', '),
+    group_concat(ast.chromosome_name separator ', '),
+    group_concat(p.name separator ', '),
+    group_concat(p.expanded_name separator ', '),
+    group_concat(g.name separator ', '),
+    s.source
+  from etl_strain_id es
+  join strain s on s.id = es.id
+  left outer join alleleset ast on ast.strain_id = s.id
+  left outer join alleleset_allele aa on aa.alleleset_id = ast.id
+  left outer join allele a on a.id = aa.allele_id
+  left outer join allele_plasmid ap on ap.allele_id = a.id
+  left outer join plasmid p on p.id = ap.plasmid_id
+  left outer join gene g on g.id = a.gene_id
+  group by s.id, s.name, s.source;
+
+update load_generation set generation = generation + 1, loaded_at = now() where id = 1;
+
+commit;
+
+drop table etl_staging_allele_first;
+drop table etl_missing_plasmid;
+drop table etl_missing_plasmid_first;
+drop table etl_failed_strain;
+drop table etl_allele;
+drop table etl_strain_id;
+drop table etl_gene_id;
+drop table etl_allele_id;
+drop table etl_plasmid_id;
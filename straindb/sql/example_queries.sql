@@ -8,21 +8,20 @@ set @plasmidX = 'pCY118';
 set @plasmidY = 'pCY168';
 set @plasmidZ = 'pCY155';
 
-select distinct s1.name
-  from strain s1
-  join strain s2 on s1.id = s2.id
-  join strain s3 on s3.id = s2.id    
-  join strain_plasmid sp1 on s1.id = sp1.strain_id
-  join strain_plasmid sp2 on s2.id = sp2.strain_id
-  join strain_plasmid sp3 on s3.id = sp3.strain_id
-  join plasmid p1 on p1.id = sp1.plasmid_id
-  join plasmid p2 on p2.id = sp2.plasmid_id
-  left outer join plasmid p3 on p3.id = sp3.plasmid_id and p3.name = @plasmidZ    
-  where p1.name = @plasmidX
-    and p2.name = @plasmidY
-    and p3.name is null;
+select s.name
+  from strain s
+  join strain_plasmid sp1 on sp1.strain_id = s.id
+  join plasmid p1 on p1.id = sp1.plasmid_id and p1.name = @plasmidX
+  join strain_plasmid sp2 on sp2.strain_id = s.id
+  join plasmid p2 on p2.id = sp2.plasmid_id and p2.name = @plasmidY
+  where not exists (
+    select * from strain_plasmid sp3
+      join plasmid p3 on p3.id = sp3.plasmid_id
+      where sp3.strain_id = s.id and p3.name = @plasmidZ);
 
--- Query result: CHB2524
+-- Query result of the former left join version of this query (not re-run since): CHB2524
+-- That version kept any strain with plasmids X and Y and one plasmid other than Z, so strains
+-- with plasmid Z and another plasmid were listed too; this query excludes them
 
 
 -- 2. Strains that have a mutation on gene X (i.e., strains whose genotype mentions gene X)
@@ -80,18 +79,20 @@ select s1.name
 set @alleleX = 'mIn1';
 set @alleleY = 'ia4';
 
-select distinct s1.name
-  from strain s1
-  join strain s2 on s1.id = s2.id
-  join alleleset ast1 on s1.id = ast1.strain_id
-  join alleleset ast2 on s2.id = ast2.strain_id
-  join alleleset_allele aa1 on aa1.alleleset_id = ast1.id
-  join alleleset_allele aa2 on aa2.alleleset_id = ast2.id  
-  join allele a1 on a1.id = aa1.allele_id  
-  left outer join allele a2 on a2.id = aa2.allele_id and a2.name = 'ia4'
-  where a1.name = @alleleX and a2.name is null;
-
--- Query results (11 strains):
+select distinct s.name
+  from strain s
+  join alleleset ast on ast.strain_id = s.id
+  join alleleset_allele aa on aa.alleleset_id = ast.id
+  join allele a on a.id = aa.allele_id and a.name = @alleleX
+  where not exists (
+    select * from alleleset ast2
+      join alleleset_allele aa2 on aa2.alleleset_id = ast2.id
+      join allele a2 on a2.id = aa2.allele_id
+      where ast2.strain_id = s.id and a2.name = @alleleY);
+
+-- Query results of the former left join version of this query (not re-run since), which kept
+-- any strain with allele X and one allele other than Y, so strains with both could be listed;
+-- this query excludes them (11 strains):
 -- CHB150
 -- CHB214
 -- CHB756
@@ -0,0 +1,91 @@
+''' Read the SQL scripts of straindb/sql: statements of a script, the tables of scripts 1 and 3, and the example queries
+
+The scripts are written for the mysql client. schema_statements and example_queries can also
+translate them for SQLite (straindb.sqlite_db and the benchmarks use this): auto_increment
+primary keys become integer primary keys, enums become text columns with a check constraint,
+keys become separate create index statements, and user variables (set @x = ...) are substituted
+into the queries.
+'''
+
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+sql_dir = Path(__file__).resolve().parent / 'sql'
+
+create_table_re = re.compile(r'create table (\w+) \((.*?)\n\);', re.S)
+index_re        = re.compile(r'^(primary key|unique key|key|index) \((.*)\)$')
+enum_re         = re.compile(r'^(\w+) enum\(([^)]*)\)')
+heading_re      = re.compile(r'^-- ([0-9]+)\. (.*)$', re.M)
+set_re          = re.compile(r"^set (@\w+) = ('[^']*');$")
+create_index_re = re.compile(r'^create (unique )?index ')
+
+
+def script_statements(path):  # statements of a mysql client script, split at its delimiter (see "delimiter //" blocks)
+    statements, lines, delimiter = [], [], ';'
+    for line in Path(path).read_text().split('\n'):
+        line = line.split('--')[0].rstrip()
+        if line.strip().lower().startswith('delimiter '):
+            delimiter = line.split()[1]
+            continue
+        lines.append(line)
+        if line.endswith(delimiter):
+            statement = '\n'.join(lines).strip()[:-len(delimiter)].strip()
+            if statement:
+                statements.append(statement)
+            lines = []
+    return statements
+
+
+def schema_statements(indexes=True, sqlite=False, script='3_create_db_tables.sql'):  # create statements for the tables of script 3 (or 1), with or without keys
+    statements = []
+    for table, body in create_table_re.findall((sql_dir / script).read_text()):
+        columns, keys = [], []
+        for line in body.split('\n'):
+            line = line.split('--')[0].strip().rstrip(',')
+            if not line:
+                continue
+            if m := index_re.match(line):
+                kind, cols = m.groups()
+                if kind == 'primary key':
+                    columns.append(line)
+                else:
+                    unique = 'unique ' if kind == 'unique key' else ''
+                    keys.append(f"create {unique}index {table}_{re.sub(r'[^a-z]+', '_', cols)} on {table} ({cols})")
+                continue
+            if sqlite:
+                line = line.replace('int primary key auto_increment', 'integer primary key')
+                line = enum_re.sub(r'\1 text check (\1 in (\2))', line)
+            columns.append(line)
+        if not indexes:
+            columns = [c for c in columns if not c.startswith('primary key')]
+            keys = []
+        statements.append(f'drop table if exists {table}')
+        statements.append(f"create table {table} ({', '.join(columns)})")
+        statements.extend(keys)
+    return statements
+
+
+def is_create_index(statement):  # a create index statement of schema_statements (run after bulk loads)
+    return create_index_re.match(statement) is not None
+
+
+def example_queries(sqlite=False, values=None):  # OrderedDict of title -> list of statements, from example_queries.sql
+    # values: user variable -> SQL literal, replacing the values of its set statements (e.g. {'@gene': "'unc-119'"})
+    text = (sql_dir / 'example_queries.sql').read_text()
+    headings = list(heading_re.finditer(text))
+    queries = OrderedDict()
+    for i, m in enumerate(headings):
+        block = text[m.end():headings[i+1].start() if i+1 < len(headings) else len(text)]
+        block = '\n'.join(line.split('--')[0] for line in block.split('\n'))
+        statements = [s.strip() for s in block.split(';') if s.strip()]
+        variables = OrderedDict(set_re.match(s + ';').groups() for s in statements if s.startswith('set '))
+        variables.update((name, value) for name, value in (values or {}).items() if name in variables)
+        if sqlite:  # no user variables: substitute values of set statements
+            statements = [s for s in statements if not s.startswith('set ')]
+            for name in sorted(variables, key=len, reverse=True):
+                statements = [s.replace(name, variables[name]) for s in statements]
+        else:
+            statements = [f'set {s.split()[1]} = {variables[s.split()[1]]}' if s.startswith('set ') else s for s in statements]
+        queries[f'{m.group(1)}. {m.group(2)}'] = statements
+    return queries
@@ -0,0 +1,95 @@
+''' Build an embedded SQLite database of the tables of 3_create_db_tables.sql, for queries without a MySQL server
+
+The tables are built from the normalize outputs: ids are assigned by straindb.db_tables (as
+4_load_db_tables_set_based.sql assigns them, so example_queries.sql returns the same strains),
+and every table, the error tables included, is inserted in one transaction into a new database
+file. The indexes of script 3 are created after the rows are in, then the views of
+5_create_views.sql, and analyze gathers statistics for the query planner. The file is built
+next to config.sqlite_database and renamed over it when complete, so it can be opened (e.g.
+with connect_sqlite, or the sqlite3 shell) while a new one is built. Its load_generation is one
+more than the replaced file's, so straindb.service sees the new tables.
+
+The stored procedure of script 3 (refresh_strain) has no SQLite equivalent and is not needed:
+strain_plasmid and strain_view are computed with the other tables. Queries are written as for
+MySQL, without user variables (example_queries(sqlite=True) substitutes them).
+'''
+
+import os, sqlite3
+from collections import OrderedDict
+from straindb.config import load_config
+from straindb.db_tables import assign_db_ids, db_tables, error_table_statements, generation_statements
+from straindb.load import read_rows
+from straindb.sql_scripts import is_create_index, schema_statements, script_statements, sql_dir
+from straindb.validate_references import error_tables
+
+
+def insert_rows(connection, table, columns, rows):  # executemany of all rows (SQLite reads them from the iterator)
+    placeholders = ', '.join('?' * len(columns))
+    connection.executemany(f"insert into {table} ({', '.join(columns)}) values ({placeholders})", rows)
+
+
+def sqlite_generation(path):  # load generation of a SQLite database file (0 if it is missing or has none)
+    try:
+        connection = sqlite3.connect(f'file:{path.resolve()}?mode=ro', uri=True)
+        try:
+            row = connection.execute('select generation from load_generation where id = 1').fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return 0
+    return row[0] if row else 0
+
+
+def build_sqlite_db(config, path=None):  # build the SQLite database at config.sqlite_database (or path); return table -> rows
+    path = path or config.sqlite_database
+    assign = assign_db_ids(config)
+    generation = sqlite_generation(path) + 1
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    if tmp_path.exists():
+        tmp_path.unlink()
+    connection = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        connection.execute('pragma journal_mode = off')  # the file is discarded unless the build completes
+        connection.execute('pragma synchronous = off')
+        connection.execute('begin')
+        statements = schema_statements(sqlite=True)
+        for statement in statements:
+            if not is_create_index(statement):
+                connection.execute(statement)
+        for table, columns in db_tables.items():
+            insert_rows(connection, table, columns, assign.tables[table])
+        for table, columns in error_tables.items():
+            for statement in error_table_statements(table):
+                connection.execute(statement)
+            insert_rows(connection, table, columns, read_rows(config.db_tables_dir / f'{table}.csv'))
+        for statement in statements:
+            if is_create_index(statement):
+                connection.execute(statement)
+        for statement in script_statements(sql_dir / '5_create_views.sql'):
+            connection.execute(statement)
+        for statement in generation_statements(sqlite=True):
+            connection.execute(statement)
+        connection.execute("update load_generation set generation = ?, loaded_at = datetime('now') where id = 1", (generation,))
+        connection.execute('commit')
+        connection.execute('analyze')
+        counts = OrderedDict((table, connection.execute(f'select count(*) from {table}').fetchone()[0])
+                             for table in list(db_tables) + list(error_tables))
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+    print(f'\nSQLITE DATABASE: {path} (load generation {generation})')
+    for table, count in counts.items():
+        print(f'  {table}: {count} rows')
+    return counts
+
+
+def connect_sqlite(config, path=None):  # read-only connection to the SQLite database
+    path = path or config.sqlite_database
+    return sqlite3.connect(f'file:{path.resolve()}?mode=ro', uri=True)
+
+
+if __name__ == '__main__':
+    build_sqlite_db(load_config())
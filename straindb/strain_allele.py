@@ -0,0 +1,45 @@
+''' Flatten a parsed genotype into rows of the strain_allele table '''
+
+strain_allele_header = ['strain_original_line_number', 'strain_name', 'chromosome',
+                        'alleleset_binaryid', #alleleset_binaryid is either 1 or 2
+                        'allele_name', 'gene_name', 'heterozygous',
+                        'source', 'other_name', 'comment']
+
+
+def strain_allele_rows(strain_original_line_number, strain_name, genotype, source, other_names, comment):
+    # Yield one strain_allele row for each allele in each alleleset in genotype (a Genotype, see genotype_model)
+
+    if genotype is None:
+        yield [strain_original_line_number, strain_name] + 5*['NULL'] + [source, other_names, comment]
+        return
+
+    for item in genotype:
+
+        allelesets_list = item.allelesets
+        chromosome = item.chromosome if item.chromosome else 'NULL'
+
+        #make first pass to retrieve alleleset membership in order to verify heterzygosity in second pass
+        nameslist = [[], []]
+        for i in range(0,len(allelesets_list)):
+            aset = allelesets_list[i]
+            for allele in aset:
+                nameslist[i].append(allele.name)
+
+        #iterate over allelesets, yielding table rows
+        for i in range(0,len(allelesets_list)):
+            aset = allelesets_list[i]
+            aset_binaryid = i + 1
+            for allele in aset:
+                allele_name = allele.name
+                gene_name = allele.gene if allele.gene is not None else 'NULL'
+                heterozygous = int(allele.heterozygous) # cast to int for MySQL tinyint "boolean"
+
+                # verify heterozygosity by checking if allele name appears in opposing allele set
+                if i == 0:
+                    if allele_name in nameslist[1]: heterozygous = int(False)
+                elif i == 1:
+                    if allele_name in nameslist[0]: heterozygous = int(False)
+
+                yield [strain_original_line_number, strain_name, chromosome,
+                       aset_binaryid, allele_name, gene_name, heterozygous,
+                       other_names, source, comment]
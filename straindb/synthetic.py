@@ -0,0 +1,241 @@
+''' Synthetic raw CSVs shaped like the CHB exports, for benchmarks
+
+The CHB exports cannot leave the lab, so benchmarks run on strain, allele and plasmid CSVs
+written here instead, in the column layouts filter_csv reads (strain name and genotype in
+columns 2 and 8, allele name, gene, comment and plasmids in columns 2, 3, 5 and 8, plasmid
+expanded name, name and date in columns 2, 5 and 6, ...). The genotypes use the whole grammar
+of parse_genotype (allele sets separated by ';', heterozygous '/+' and 'a/b' sets,
+gene(allele), chromosomes, bracketed plasmid notes, line number annotations). Alleles are
+reused across strains with a skewed distribution, as balancers and common transgenes are,
+and strains share genotype strings. Duplicate, invalid and dangling-reference rows occur at
+the rates of DEFAULT_RATES. The same seed and sizes always write the same files, e.g.
+
+    python3 -m straindb.synthetic /tmp/chb --strains 100000 --seed 1
+'''
+
+import argparse, csv, random
+from collections import OrderedDict
+from pathlib import Path
+from straindb.config import Config
+
+STRAIN_COLUMNS = 17
+ALLELE_COLUMNS = 10
+PLASMID_COLUMNS = 15
+
+ALLELES_PER_STRAIN = 1/6    # allele rows per strain row, as in the exports
+PLASMIDS_PER_STRAIN = 1/28  # plasmid rows per strain row
+GENES_PER_ALLELE = 1/8
+
+# Probability of each kind of row (or, for *_reuse, of reusing an earlier value)
+DEFAULT_RATES = OrderedDict([
+    ('genotype_reuse', 0.2),          # strain with the genotype string of an earlier strain
+    ('empty_genotype', 0.03),
+    ('invalid_genotype', 0.03),       # characters outside the genotype grammar
+    ('invalid_strain_name', 0.02),
+    ('duplicate_strain', 0.01),
+    ('missing_allele', 0.003),        # genotype allele absent from the allele CSV
+    ('invalid_allele_name', 0.005),   # extra allele row with an invalid name
+    ('duplicate_allele', 0.01),       # extra allele row repeating an earlier name
+    ('missing_plasmid', 0.005),       # allele plasmid absent from the plasmid CSV
+    ('invalid_plasmid_name', 0.01),   # extra plasmid row with an invalid name
+    ('duplicate_plasmid', 0.01),      # extra plasmid row repeating an earlier name
+    ('missing_expanded_name', 0.01),
+    ('fuzzy_date', 0.05),             # date in no strict format (e.g. 'March 4, 2019')
+    ('invalid_date', 0.01),
+])
+
+CHROMOSOMES = ['I', 'II', 'III', 'IV', 'V', 'X']
+LAB_PREFIXES = ['e', 'n', 'tm', 'ok', 'ky', 'ns', 'oy', 'hmn', 'gk', 'ju', 'mu', 'sy', 'qa', 'chb']
+SOURCES = ['CGC', 'lab', 'NBRP', '']
+DATE_FORMATS = ['{y}-{m:02}-{d:02}', '{m}/{d}/{y}', '{y}/{m:02}/{d:02}']
+FUZZY_DATE_FORMATS = ['{month} {d}, {y}', '{d} {mon} {y}', 'about {y}-{m}-{d} maybe']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+
+class SyntheticCHB:  # seeded generator of raw strain, allele and plasmid rows; call write() to write the three CSVs
+
+    def __init__(self, strains, seed=0, rates=None):
+        self.num_strains = strains
+        self.num_alleles = max(int(strains * ALLELES_PER_STRAIN), 10)
+        self.num_plasmids = max(int(strains * PLASMIDS_PER_STRAIN), 5)
+        self.rng = random.Random(seed)
+        self.rates = OrderedDict(DEFAULT_RATES)
+        self.rates.update(rates or {})
+
+        rng = self.rng
+        self.genes = unique_names(max(int(self.num_alleles * GENES_PER_ALLELE), 5),
+                                  lambda: f"{''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=3))}-{rng.randint(1, 200)}")
+        self.plasmids = unique_names(self.num_plasmids, lambda: f"p{rng.choice(['CY', 'MH', 'DK', 'JL', 'AB'])}{rng.randint(1, 10 * self.num_plasmids)}")
+        self.alleles = unique_names(self.num_alleles, self.allele_name)
+        self.allele_weights = skewed_cum_weights(len(self.alleles))
+
+        # Names referenced but never defined, so the reference checks of the normalize stage and the ETL fail for a few rows
+        self.missing_alleles = [f'zz{i}' for i in range(max(self.num_alleles // 50, 1))]
+        self.missing_plasmids = [f'pZZ{i}' for i in range(max(self.num_plasmids // 50, 1))]
+
+    def chance(self, rate):
+        return self.rng.random() < self.rates[rate]
+
+    def allele_name(self):  # mutant, transgene, rearrangement or other, in the proportions of the exports
+        rng = self.rng
+        prefix = rng.choice(LAB_PREFIXES)
+        kind = rng.random()
+        if kind < 0.65:
+            return f'{prefix}{rng.randint(1, 20 * self.num_alleles)}'
+        if kind < 0.9:
+            return f"{prefix}{rng.choice(['Is', 'Ex', 'Si'])}{rng.randint(1, 2 * self.num_alleles)}"
+        if kind < 0.97:
+            return f"{prefix}{rng.choice(['T', 'C', 'In', 'Df'])}{rng.randint(1, 200)}"
+        return f'{prefix}{rng.randint(1, 99)}{rng.choice(LAB_PREFIXES)}{rng.randint(1, 99)}'  # e.g. e12ok3 (other)
+
+    def genotype_allele(self):  # an allele of a genotype, sometimes with its gene
+        rng = self.rng
+        if self.chance('missing_allele'):
+            allele = rng.choice(self.missing_alleles)
+        else:
+            allele = rng.choices(self.alleles, cum_weights=self.allele_weights)[0]
+        if rng.random() < 0.3:
+            return f"{rng.choice(self.genes)}{rng.choice(['', ' '])}({allele})"
+        return allele
+
+    def alleleset(self):
+        return ' '.join(self.genotype_allele() for _ in range(self.rng.choice([1, 1, 1, 2])))
+
+    def genotype_item(self):  # e.g. "dec-2(e200) e321/+ [pCY118 gfp] X"
+        rng = self.rng
+        item = self.alleleset()
+        kind = rng.random()
+        if kind < 0.25:
+            item += rng.choice(['/', ' / ']) + self.alleleset()
+        elif kind < 0.4:
+            item += '/+'
+        if rng.random() < 0.08:
+            item += f' [{rng.choice(self.plasmids)} {rng.choice(["gfp", "mCherry", "unc-119(+)"])}]'
+        if rng.random() < 0.03:
+            item += f' (line {rng.randint(1, 40)})'
+        if rng.random() < 0.85:
+            item += ' ' + rng.choice(CHROMOSOMES)
+        return item
+
+    def genotype(self, previous):  # genotype string of a strain; previous: genotypes written so far, for reuse
+        rng = self.rng
+        if previous and self.chance('genotype_reuse'):
+            return rng.choice(previous)
+        if self.chance('empty_genotype'):
+            return rng.choice(['', '', 'WT'])
+        genotype = '; '.join(self.genotype_item() for _ in range(rng.choice([1, 1, 2, 2, 3, 4])))
+        if self.chance('invalid_genotype'):
+            genotype = genotype + rng.choice([', ?', ' *', ' e1:gfp', ' e1=e2'])
+        previous.append(genotype)
+        return genotype
+
+    def strain_rows(self):
+        rng = self.rng
+        genotypes = []
+        for i in range(self.num_strains):
+            if self.chance('invalid_strain_name'):
+                name = rng.choice(['', f'XYZ{i}', f'chb{i}', 'CHB'])
+            elif i and self.chance('duplicate_strain'):
+                name = f'CHB{rng.randint(1, i)}'
+            else:
+                name = f'CHB{i + 1}'
+            row = [''] * STRAIN_COLUMNS
+            row[2] = name if rng.random() < 0.9 else f' {name} '
+            row[8] = self.genotype(genotypes)
+            row[9] = rng.choice(SOURCES)
+            row[11] = rng.choice(['', '', 'from X', 'outcrossed 6x\nby JL', ' see notes '])
+            row[15] = f'alt{i}' if rng.random() < 0.05 else ''
+            yield row
+
+    def with_extra_rows(self, names, invalid_names, invalid_rate, duplicate_rate):  # names, with invalid names and repeats of earlier names inserted
+        rng = self.rng
+        for i, name in enumerate(names):
+            if self.chance(invalid_rate):
+                yield rng.choice(invalid_names)
+            if i and self.chance(duplicate_rate):
+                yield names[rng.randrange(i)]
+            yield name
+
+    def allele_rows(self):
+        rng = self.rng
+        for allele in self.with_extra_rows(self.alleles, ['', 'bad name', '12ab', 'e1-2'], 'invalid_allele_name', 'duplicate_allele'):
+            row = [''] * ALLELE_COLUMNS
+            row[2] = allele + ('ts' if rng.random() < 0.02 else '')
+            row[3] = rng.choice(self.genes) if rng.random() < 0.6 else ''
+            row[5] = rng.choice(['', '', '', 'temperature sensitive', 'from screen\nof 2019'])
+            if any(infix in allele for infix in ('Is', 'Ex', 'Si')):  # transgenes carry plasmids
+                plasmids = [rng.choice(self.missing_plasmids) if self.chance('missing_plasmid') else rng.choice(self.plasmids)
+                            for _ in range(rng.choice([1, 1, 2, 3]))]
+                row[8] = rng.choice([', ', ';', ' ; ']).join(plasmids)
+            yield row
+
+    def date(self):
+        rng = self.rng
+        (y, m, d) = (rng.randint(1995, 2024), rng.randint(1, 12), rng.randint(1, 28))
+        if self.chance('invalid_date'):
+            return rng.choice(['garbage', '2019-13-45', 'soon'])
+        if self.chance('fuzzy_date'):
+            return rng.choice(FUZZY_DATE_FORMATS).format(y=y, m=m, d=d, month=MONTHS[m - 1], mon=MONTHS[m - 1][:3])
+        return rng.choice(DATE_FORMATS).format(y=y, m=m, d=d)
+
+    def plasmid_rows(self):
+        rng = self.rng
+        for plasmid in self.with_extra_rows(self.plasmids, ['', 'bad', 'CY12'], 'invalid_plasmid_name', 'duplicate_plasmid'):
+            row = [''] * PLASMID_COLUMNS
+            row[2] = '' if self.chance('missing_expanded_name') else f"{rng.choice(self.genes)}p::{rng.choice(['gfp', 'mCherry', 'GCaMP6'])}"
+            row[5] = plasmid
+            row[6] = self.date() if rng.random() < 0.9 else ''
+            row[7] = rng.choice(self.plasmids) if rng.random() < 0.3 else ''
+            row[8] = rng.choice(self.plasmids) if rng.random() < 0.1 else ''
+            row[9] = rng.choice(['', 'EcoRI', 'BamHI', 'NotI'])
+            row[13] = rng.choice(SOURCES)
+            yield row
+
+    def write(self, directory):  # write strains.csv, alleles.csv and plasmids.csv to directory; return table -> path, as in Config.rawCSV
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = OrderedDict([('allele', directory / 'alleles.csv'), ('plasmid', directory / 'plasmids.csv'),
+                             ('strain', directory / 'strains.csv')])
+        tables = [('allele', ALLELE_COLUMNS, self.allele_rows()), ('plasmid', PLASMID_COLUMNS, self.plasmid_rows()),
+                  ('strain', STRAIN_COLUMNS, self.strain_rows())]
+        for table, num_columns, rows in tables:
+            with open(paths[table], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow([f'column{i}' for i in range(num_columns)])
+                writer.writerows(rows)
+        return paths
+
+
+def unique_names(n, make):  # n distinct names from make(), in the order made
+    names = OrderedDict()
+    while len(names) < n:
+        names[make()] = None
+    return list(names)
+
+
+def skewed_cum_weights(n, exponent=0.8):  # cumulative Zipf-like weights: a few names are used by many strains
+    cum_weights = []
+    total = 0.0
+    for rank in range(n):
+        total += 1 / (rank + 1) ** exponent
+        cum_weights.append(total)
+    return cum_weights
+
+
+def write_synthetic_csvs(directory, strains, seed=0, rates=None):  # write synthetic raw CSVs; return table -> path
+    return SyntheticCHB(strains, seed, rates).write(directory)
+
+
+def synthetic_config(directory, strains, seed=0, rates=None, **settings):  # Config reading synthetic raw CSVs written to directory/raw, with outputs in directory/output
+    paths = write_synthetic_csvs(Path(directory) / 'raw', strains, seed, rates)
+    return Config(dict({'raw_csv': paths, 'output_directory': Path(directory) / 'output'}, **settings))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='directory to write strains.csv, alleles.csv and plasmids.csv to')
+    parser.add_argument('--strains', type=int, default=100_000, help='number of strain rows (allele and plasmid rows scale with it)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for table, path in write_synthetic_csvs(args.directory, args.strains, args.seed).items():
+        print(f'{table}: {path}')
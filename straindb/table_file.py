@@ -0,0 +1,176 @@
+''' Binary columnar table files (.col), written next to the CSV outputs of the filter, normalize and validate stages
+
+With table_files: true in config.yaml, each stage also writes its output tables in this
+format, and the next stage (and straindb load) reads them instead of the CSV files, without
+tokenizing or unquoting fields. The CSV files are still written, for other tools and for
+LOAD DATA INFILE. Layout (native byte order, recorded in the metadata; sections are 8-byte
+aligned, as in index_file.py):
+
+    magic      b'STRAINTB'
+    version    u32, FORMAT_VERSION
+    length     u32, length of metadata
+    metadata   JSON: byte order, number of rows, column names and types, section offsets
+    sections   for each int column c:          c<i>_values: i64 value of each row
+               for each str or json column c:  c<i>_text:   UTF-8 text of the distinct values, concatenated
+                                               c<i>_ends:   u32 end offset (in characters) of each distinct value
+                                               c<i>_codes:  u32 index of each row's value among the distinct values
+
+Columns whose values are all ints are stored as int columns; other values are stored as
+the text the CSV file holds (None as ''). Name columns repeat heavily (strain names in
+strain_allele, 'NULL', gene names), so storing each distinct value once keeps files small.
+Json columns (the parsed genotype of strain.col) hold a JSON document per distinct value,
+decoded once per distinct value when read.
+'''
+
+import json, mmap, os, sys
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from straindb.index_file import align, header_struct
+
+MAGIC = b'STRAINTB'
+FORMAT_VERSION = 1
+CHUNK_ROWS = 1 << 16  # rows decoded at a time when reading
+
+
+class TableFileError(Exception):  # not a table file, or one of another format version or byte order
+    pass
+
+
+def table_path(csvfile):  # table file written next to a CSV output
+    return Path(csvfile).with_suffix('.col')
+
+
+def input_file(config, csvfile):  # file a stage reads a CSV output from: its table file if config.table_files is set
+    return table_path(csvfile) if config.table_files else Path(csvfile)
+
+
+class ColumnBuilder:  # values of one column, as ints until a value that is not an int is added
+
+    def __init__(self, json_column=False):
+        self.type = 'json' if json_column else 'int'
+        self.values = array('q')
+        self.codes = array('I')
+        self.distinct = {}  # text -> code
+
+    def encode(self, text):
+        code = self.distinct.get(text)
+        if code is None:
+            code = self.distinct[text] = len(self.distinct)
+        self.codes.append(code)
+
+    def add(self, value):
+        if self.type == 'int':
+            if type(value) is int:
+                self.values.append(value)
+                return
+            self.type = 'str'
+            for v in self.values:
+                self.encode(str(v))
+            self.values = None
+        if self.type == 'json':
+            self.encode(json.dumps(value))
+        else:
+            self.encode('' if value is None else str(value))
+
+    def sections(self, i):  # section name -> bytes
+        if self.type == 'int':
+            return [(f'c{i}_values', self.values.tobytes())]
+        ends = array('I')
+        end = 0
+        for text in self.distinct:
+            end += len(text)
+            ends.append(end)
+        return [(f'c{i}_text', ''.join(self.distinct).encode()), (f'c{i}_ends', ends.tobytes()), (f'c{i}_codes', self.codes.tobytes())]
+
+
+class TableWriter:  # collects rows of a table, and writes them as a table file on close()
+
+    def __init__(self, path, header, json_columns=()):
+        self.path = Path(path)
+        self.header = list(header)
+        self.columns = [ColumnBuilder(name in json_columns) for name in self.header]
+        self.num_rows = 0
+
+    def writerow(self, row):
+        for column, value in zip(self.columns, row):
+            column.add(value)
+        self.num_rows += 1
+
+    def close(self):
+        layout = OrderedDict()
+        payload = bytearray()
+        for i, column in enumerate(self.columns):
+            for name, data in column.sections(i):
+                payload += b'\0' * (align(len(payload)) - len(payload))
+                layout[name] = [len(payload), len(data)]
+                payload += data
+
+        metadata = OrderedDict([('byteorder', sys.byteorder),
+                                ('num_rows', self.num_rows),
+                                ('columns', [OrderedDict([('name', name), ('type', column.type)])
+                                             for name, column in zip(self.header, self.columns)]),
+                                ('sections', layout)])
+        encoded = json.dumps(metadata).encode()
+        header = header_struct.pack(MAGIC, FORMAT_VERSION, len(encoded)) + encoded
+        header += b'\0' * (align(len(header)) - len(header))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(str(self.path) + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp, self.path)  # readers see the old table or the new one, never a partial file
+
+
+class TableFile:  # memory-mapped table file
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+        view = memoryview(self.mmap)
+
+        if len(view) < header_struct.size:
+            raise TableFileError(f'{self.path}: truncated table file')
+        magic, version, length = header_struct.unpack_from(view)
+        if magic != MAGIC:
+            raise TableFileError(f'{self.path}: not a table file')
+        if version != FORMAT_VERSION:
+            raise TableFileError(f'{self.path}: table format version {version}, expected {FORMAT_VERSION}')
+        metadata = json.loads(bytes(view[header_struct.size:header_struct.size + length]))
+        if metadata['byteorder'] != sys.byteorder:
+            raise TableFileError(f'{self.path}: written on a {metadata["byteorder"]}-endian machine')
+        payload = view[align(header_struct.size + length):]
+
+        self.num_rows = metadata['num_rows']
+        self.header = [c['name'] for c in metadata['columns']]
+        self.types = [c['type'] for c in metadata['columns']]
+        self.sections = {name: payload[start:start + size] for name, (start, size) in metadata['sections'].items()}
+
+    def distinct_values(self, i, replace=None):  # distinct values of a str or json column, in code order; replace maps str values to others
+        text = bytes(self.sections[f'c{i}_text']).decode()
+        values = []
+        start = 0
+        for end in self.sections[f'c{i}_ends'].cast('I'):
+            values.append(text[start:end])
+            start = end
+        if self.types[i] == 'json':
+            values = [json.loads(v) for v in values]  # shared by all rows with the same value: do not modify
+        elif replace:
+            values = [replace.get(v, v) for v in values]
+        return values
+
+    def rows(self, replace=None):  # each row as a list of values, decoded CHUNK_ROWS rows at a time; see distinct_values for replace
+        columns = []  # (ints, None) or (codes, distinct values)
+        for i, type in enumerate(self.types):
+            if type == 'int':
+                columns.append((self.sections[f'c{i}_values'].cast('q'), None))
+            else:
+                columns.append((self.sections[f'c{i}_codes'].cast('I'), self.distinct_values(i, replace)))
+
+        for start in range(0, self.num_rows, CHUNK_ROWS):
+            end = min(start + CHUNK_ROWS, self.num_rows)
+            chunk = [values[start:end].tolist() if distinct is None else list(map(distinct.__getitem__, values[start:end]))
+                     for (values, distinct) in columns]
+            yield from map(list, zip(*chunk))
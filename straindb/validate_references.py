@@ -0,0 +1,140 @@
+''' Check strain_allele -> allele and allele -> plasmid references of the normalize outputs before loading
+
+4_load_db_tables.sql rolls back each strain with an allele missing from staging_allele, or
+an allele whose plasmid is missing from staging_plasmid, and records the first such
+reference in allele_missing_from_staging_allele_table or
+plasmid_missing_from_staging_plasmid_table. This stage finds the same strains with hash
+sets of allele and plasmid names, writes the same error rows to
+validate_errorlog/<error table>.csv, and writes validate/strain_allele.csv without the
+failing strains, so the database load has nothing to roll back.
+'''
+
+from collections import OrderedDict
+from straindb.config import load_config
+from straindb.fileio import get_writer, mkparent
+from straindb.load import read_rows
+from straindb.pipeline import Pipeline, ReadCSV, ReadTable, WRITE_BUFFER_SIZE, output_stages
+from straindb.strain_allele import strain_allele_header
+from straindb.table_file import input_file
+
+# Error tables of 4_load_db_tables.sql, with their columns
+error_tables = OrderedDict([
+    ('allele_missing_from_staging_allele_table', ['strain_original_line_number', 'strain_name', 'allele_name']),
+    ('plasmid_missing_from_staging_plasmid_table', ['strain_original_line_number', 'strain_name', 'allele_original_line_number',
+                                                    'allele_name', 'plasmid_name']),
+])
+
+
+class References:  # allele and plasmid names of the normalize outputs, for resolving strain_allele references
+
+    def __init__(self, allele_rows, plasmid_names):  # allele.csv rows and plasmid.csv names, with None for NULL
+        plasmid_names = set(plasmid_names)
+        self.first_allele = OrderedDict()     # allele name -> first allele.csv row
+        self.allele_plasmids = OrderedDict()  # allele name -> its plasmids found in plasmid.csv
+        self.missing_plasmid = OrderedDict()  # allele name -> first allele.csv row naming a plasmid missing from plasmid.csv
+        for r in allele_rows:
+            (_, name, _, _, plasmid_name, _) = r
+            self.first_allele.setdefault(name, r)
+            plasmids = self.allele_plasmids.setdefault(name, [])
+            if plasmid_name is not None:
+                if plasmid_name in plasmid_names:
+                    plasmids.append(plasmid_name)
+                else:
+                    self.missing_plasmid.setdefault(name, r)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(read_rows(input_file(config, config.normalize_dir / 'allele.csv')),
+                   (r[1] for r in read_rows(input_file(config, config.filter_dir / 'plasmid.csv'))))
+
+    def check(self, strain_original_line_number, strain_name, allele_name):  # None, or (error table, error row) for a strain_allele row
+        if allele_name is None:
+            return None
+        if allele_name not in self.first_allele:
+            return ('allele_missing_from_staging_allele_table', [strain_original_line_number, strain_name, allele_name])
+        if allele_name in self.missing_plasmid:
+            (allele_original_line_number, _, _, _, plasmid_name, _) = self.missing_plasmid[allele_name]
+            return ('plasmid_missing_from_staging_plasmid_table',
+                    [strain_original_line_number, strain_name, allele_original_line_number, allele_name, plasmid_name])
+        return None
+
+
+class ReferenceErrors:  # error table CSV files; use as a context manager around the pipeline run
+
+    def __init__(self, errdir):
+        self.files = OrderedDict((table, errdir / f'{table}.csv') for table in error_tables)
+        self.counts = OrderedDict((table, 0) for table in error_tables)
+        self.writers = {}
+        self.fouts = []
+
+    def __enter__(self):
+        for table, csvfile in self.files.items():
+            mkparent(csvfile)
+            fout = open(csvfile, 'w', buffering=WRITE_BUFFER_SIZE)
+            self.fouts.append(fout)
+            self.writers[table] = get_writer(fout)
+            self.writers[table].writerow(error_tables[table])
+        return self
+
+    def __exit__(self, *exc):
+        for fout in self.fouts:
+            fout.close()
+        self.fouts = []
+
+    def add(self, table, row):
+        self.writers[table].writerow(row)
+        self.counts[table] += 1
+
+
+class ValidateReferences:  # validate stage for strain_allele rows: reject every row of a strain with an unresolved reference
+
+    def __init__(self, references, errors):
+        self.references = references
+        self.errors = errors
+        self.num_strains = 0
+        self.num_failed = 0
+
+    def __call__(self, records):  # rows of a strain are consecutive in strain_allele.csv
+        strain = []
+        for rec in records:
+            if strain and rec.raw[1] != strain[0].raw[1]:
+                yield from self.check_strain(strain)
+                strain = []
+            strain.append(rec)
+        if strain:
+            yield from self.check_strain(strain)
+
+    def check_strain(self, strain):  # record the first failing row of the strain (as etl_tables does), and fail all its rows
+        self.num_strains += 1
+        for rec in strain:
+            (strain_original_line_number, strain_name, _, _, allele_name) = rec.raw[:5]
+            error = self.references.check(strain_original_line_number, strain_name, allele_name if allele_name != 'NULL' else None)
+            if error is not None:
+                self.errors.add(*error)
+                self.num_failed += 1
+                for r in strain:
+                    r.failed = True
+                break
+        for rec in strain:
+            rec.row = rec.raw
+        return strain
+
+
+def validate_references(config):  # write validate/strain_allele.csv without strains that the database load would roll back
+    validate = ValidateReferences(References.from_config(config), ReferenceErrors(config.validate_errdir))
+    with validate.errors:
+        strain_allele = input_file(config, config.normalize_dir / 'strain_allele.csv')
+        Pipeline(ReadTable(strain_allele) if config.table_files else ReadCSV(strain_allele),
+                 validate,
+                 *output_stages(config, config.validate_dir / 'strain_allele.csv', strain_allele_header)).run()
+
+    print(f'\nREFERENCES:')
+    print(f'  Strains checked: {validate.num_strains}')
+    print(f'  Strains excluded: {validate.num_failed}')
+    for table, count in validate.errors.counts.items():
+        print(f'    {table}: {count}')
+    return validate
+
+
+if __name__ == '__main__':
+    validate_references(load_config())
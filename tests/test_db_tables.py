@@ -0,0 +1,73 @@
+''' db_tables/load_db_tables.sql must hold the statements load_db_tables runs, in the order a mysql client needs them '''
+
+import contextlib, io, re, sqlite3
+from straindb.config import Config
+from straindb.db_tables import db_tables, load_db_tables, table_files, write_db_tables, write_load_script
+from straindb.filter_csv import filter_all
+from straindb.load import read_rows
+from straindb.normalize_csv import normalize_all
+from straindb.sql_scripts import is_create_index, schema_statements, script_statements
+from straindb.synthetic import synthetic_config
+from straindb.validate_references import error_tables
+
+load_data_re = re.compile(r"^load data local infile '((?:[^'\\]|\\.)*)' into table (\w+) ")
+
+
+def script_config(output_directory):  # Config of write_load_script (the raw CSVs are not read)
+    return Config({'raw_csv': {'allele': 'alleles.csv', 'plasmid': 'plasmids.csv', 'strain': 'strains.csv'},
+                   'output_directory': output_directory})
+
+
+def is_ddl(statement):
+    return statement.split()[0].lower() in ('create', 'drop', 'alter', 'truncate', 'rename')
+
+
+def unescape(path):  # file name of a load data statement, as MySQL reads it
+    return re.sub(r'\\(.)', r'\1', path)
+
+
+def test_load_script_statements(tmp_path):
+    output_directory = tmp_path / "it's \\ here"  # quote and backslash must be escaped in the file names
+    config = script_config(output_directory)
+    statements = script_statements(write_load_script(config))
+    begin = statements.index('start transaction')
+    commit = statements.index('commit')
+
+    # DDL commits implicitly in MySQL: none inside the transaction, and every error table created before it
+    assert begin < commit
+    assert not [s for s in statements[begin:commit] if is_ddl(s)]
+    for table in error_tables:
+        assert any(s.startswith(f'create table {table} ') for s in statements[:begin]), table
+
+    # Every database and error table is loaded exactly once, inside the transaction, from its own file
+    loads = [load_data_re.match(s) for s in statements]
+    loaded = [(i, m.group(2), unescape(m.group(1))) for i, m in enumerate(loads) if m]
+    assert sorted(table for _, table, _ in loaded) == sorted(list(db_tables) + list(error_tables))
+    files = table_files(config)
+    for i, table, path in loaded:
+        assert begin < i < commit, table
+        assert path == str(files[table].resolve()), table
+
+
+def test_load_db_tables_sqlite(tmp_path):
+    config = synthetic_config(tmp_path, 500, seed=1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        filter_all(config)
+        normalize_all(config)
+        assign = write_db_tables(config)
+
+    connection = sqlite3.connect(tmp_path / 'straindb.sqlite')
+    try:
+        for statement in schema_statements(sqlite=True):
+            if not is_create_index(statement):
+                connection.execute(statement)
+        load_db_tables(config, connection)
+
+        for table, columns in db_tables.items():
+            assert connection.execute(f'select count(*) from {table}').fetchone()[0] == len(assign.tables[table]), table
+        for table in error_tables:
+            rows = list(read_rows(config.db_tables_dir / f'{table}.csv'))
+            assert connection.execute(f'select count(*) from {table}').fetchone()[0] == len(rows), table
+        assert connection.execute('select generation from load_generation where id = 1').fetchone() == (1,)
+    finally:
+        connection.close()
@@ -0,0 +1,49 @@
+''' A missing, empty, truncated or corrupt index file must read as stale, so queries fall back to the CSVs '''
+
+import contextlib, io
+import pytest
+from straindb.filter_csv import filter_all
+from straindb.index_file import IndexFile, StaleIndexError, header_struct
+from straindb.normalize_csv import normalize_all
+from straindb.query import StrainIndex, index_path
+from straindb.synthetic import synthetic_config
+
+QUERY = 'chromosome:X or chromosome:IV'
+
+
+@pytest.fixture(scope='module')
+def config(tmp_path_factory):
+    config = synthetic_config(tmp_path_factory.mktemp('index'), 500, seed=2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        filter_all(config)
+        normalize_all(config)
+    return config
+
+
+def damaged(data):  # name -> bytes of an index file written as data, damaged in one way
+    length = header_struct.unpack_from(data)[2]
+    metadata_end = header_struct.size + length
+    return {'empty': b'',
+            'header only': data[:header_struct.size],
+            'truncated payload': data[:len(data) - 100],
+            'corrupt metadata': data[:header_struct.size] + b'{' * length + data[metadata_end:],
+            'non-UTF-8 metadata': data[:header_struct.size] + b'\xff' * length + data[metadata_end:]}
+
+
+def test_damaged_index_is_stale(config, tmp_path):
+    data = index_path(config).read_bytes()
+    IndexFile(index_path(config)).verify()
+    expected = StrainIndex.from_config(config).query(QUERY)
+    for name, content in damaged(data).items():
+        path = tmp_path / 'strain_index.bin'
+        path.write_bytes(content)
+        with pytest.raises(StaleIndexError):
+            IndexFile(path)
+
+        index_path(config).write_bytes(content)
+        try:
+            index = StrainIndex.from_config(config)
+            assert index.index_file is None, name
+            assert index.query(QUERY) == expected, name
+        finally:
+            index_path(config).write_bytes(data)
@@ -0,0 +1,60 @@
+''' AlleleClassifier must classify every name as the former regex-per-check parse_allele did '''
+
+import random, re
+import pytest
+from straindb.parse_allele import AlleleClassifier, parse_allele
+
+# Corner cases of the patterns (suffixes, prefix lengths, mixed case, digits only)
+EDGE_CASES = ['', 'e', '1', 'e1', 'e1a', 'e1ab', 'E1', 'e1A', 'abcd1', 'abc1', 'ab1cd2', 'ab1cd2ef', 'nsIs53', 'nsIs53a',
+              'nsIs53x1', 'abcdIs1', 'IS1', 'mIn1', 'mIn1b', 'hT2', 'hC1', 'nDf40', 'nDf40Df1', 'eDf1e2', 'e1Is2', 'ky1IS2x',
+              'p808', 'hmn12', 'oyIs44', 'tm290', 'kyEx1234', 'kyEx', 'e1 2', 'e1-2', 'e1_2']
+
+
+def former_parse_allele(allele_name):  # parse_allele as it was, with a regex for each check
+
+    if allele_name == '' or not re.match(r'^([a-zA-Z]+[0-9]+[a-z]*)+$', allele_name):
+        return (None, None, 'invalid_allele_name')
+
+    allele_name = re.sub(r'[a-z]+$','',allele_name)
+
+    if re.match(r'^([a-z]{1,3}[0-9]+)+$', allele_name):
+        allele_type = 'mutant'
+    elif re.match(r'^[a-z]{1,3}(Ex|Is|Si)[0-9]+$', allele_name):
+        allele_type = 'transgene'
+    elif re.match(r'^[a-z]{1,3}(T|C|In|Df)[0-9]+$', allele_name):
+        allele_type = 'rearrangement'
+    else:
+        allele_type = 'other'
+
+    return (allele_name, allele_type, None)
+
+
+def random_strings(n, seed=0):  # random strings of the letters, digits, infixes and separators that the patterns distinguish
+    rng = random.Random(seed)
+    tokens = ['a', 'e', 'z', 'A', 'Z', 'n', 's', 'I', 'Ex', 'Is', 'Si', 'T', 'C', 'In', 'Df', '0', '1', '9', '12', '-', ' ', '.']
+    weights = [3]*7 + [2]*8 + [4]*4 + [1]*3
+    return [''.join(rng.choices(tokens, weights, k=rng.randint(0, 6))) for _ in range(n)]
+
+
+def assert_equivalent(names):
+    for name in names:
+        expected = former_parse_allele(name)
+        assert AlleleClassifier.classify(name) == expected, f'{name!r}: {AlleleClassifier.classify(name)} != {expected}'
+        assert parse_allele(name) == expected, f'{name!r}: parse_allele differs'
+    assert AlleleClassifier().classify_many(names) == [former_parse_allele(name) for name in names], 'classify_many differs'
+
+
+def test_edge_cases():
+    assert_equivalent(EDGE_CASES)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_strings(seed):
+    assert_equivalent(random_strings(20_000, seed))
+
+
+def test_classify_many_repeats():  # memoized names must give the same results as the first time
+    names = random_strings(2_000) * 3
+    classifier = AlleleClassifier()
+    assert classifier.classify_many(names) == [former_parse_allele(name) for name in names]
+    assert classifier.memo_hits > 0